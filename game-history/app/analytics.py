@@ -0,0 +1,245 @@
+"""
+Compute the game analytics from all completed games and store them in
+game_analytics and game_opening, which GET /analytics serves.
+
+Per game type, and over all game types as "all":
+
+    - results from the point of view of the player who moved first
+    - the most common openings, the positions of the first OPENING_MOVES moves
+    - how often each cell was played by x and by o
+    - the average number of moves and duration of a game
+
+The games are read in chunks. The packed moves of a chunk are decoded into
+NumPy arrays with one gather per field (see app/packing.py for the layout),
+there is no Python loop over the games.
+
+Run from the game-history directory:
+
+    python -m app.analytics [--chunk-size 50000]
+"""
+import argparse
+import asyncio
+import datetime
+import time
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app import packing
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.crud import ALL_GAME_TYPES
+from app.db import DatabaseSessionManager
+from app.models import GameAnalytics, GameHistory, GameOpening
+
+logger = get_logger(__name__)
+
+OPENING_MOVES = 3
+# Openings kept per game type
+TOP_OPENINGS = 20
+
+# Offset of the move codes in a packed game: version, flags, move count and first timestamp
+CODES_OFFSET = 3 + 8
+
+
+class Totals:
+    """Running sums of one game type"""
+
+    def __init__(self):
+        self.games = 0
+        self.first_mover_wins = 0
+        self.first_mover_losses = 0
+        self.draws = 0
+        self.moves = 0
+        self.timed_games = 0
+        self.duration = 0
+        # Cells played by x in row 0 and by o in row 1
+        self.heatmap = np.zeros((2, 9), dtype=np.int64)
+        # Openings by their base 9 number, games and first mover wins and draws
+        self.openings = np.zeros((3, 9 ** OPENING_MOVES), dtype=np.int64)
+
+    def add(self, chunk: dict, mask: np.ndarray):
+        self.games += int(mask.sum())
+        self.first_mover_wins += int((chunk["first_mover_won"] & mask).sum())
+        self.first_mover_losses += int((chunk["first_mover_lost"] & mask).sum())
+        self.draws += int((chunk["draw"] & mask).sum())
+        self.moves += int(chunk["moves"][mask].sum())
+        timed = mask & chunk["timed"]
+        self.timed_games += int(timed.sum())
+        self.duration += int(chunk["duration"][timed].sum())
+
+        played = chunk["played"] & mask[:, None]
+        self.heatmap += np.bincount(
+            (chunk["symbols"][played] * 9 + chunk["positions"][played]), minlength=18).reshape(2, 9)
+
+        opened = chunk["opened"] & mask
+        openings = chunk["openings"][opened]
+        self.openings[0] += np.bincount(openings, minlength=self.openings.shape[1])
+        self.openings[1] += np.bincount(openings[chunk["first_mover_won"][opened]], minlength=self.openings.shape[1])
+        self.openings[2] += np.bincount(openings[chunk["draw"][opened]], minlength=self.openings.shape[1])
+
+
+def json_blob(moves: list[dict]) -> bytes:
+    """
+    Packed stand-in for a game that is stored as JSON, with the codes of its moves
+    and zero timestamps. Only used for the few games pack_moves could not encode.
+    """
+    codes = bytes(
+        (packing.NO_POSITION if move.get("position") is None else move["position"])
+        | (packing.SYMBOL_O if move.get("symbol") == "o" else 0)
+        for move in moves[:255]
+    )
+    return bytes((packing.VERSION, 0, len(codes))) + bytes(8) + codes + bytes(4 * max(len(codes) - 1, 0))
+
+
+def decode_chunk(winners: list[str], blobs: list[bytes], timed: np.ndarray) -> dict:
+    """Decode the packed moves of a chunk of games into arrays with one row per game"""
+    lengths = np.fromiter(map(len, blobs), dtype=np.int64, count=len(blobs))
+    data = np.frombuffer(b"".join(blobs), dtype=np.uint8)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    flags = data[starts + 1]
+    counts = data[starts + 2].astype(np.int64)
+    width = int(counts.max(initial=0))
+    slots = np.arange(width)
+    in_game = slots < counts[:, None]
+
+    codes = np.where(in_game, data[np.where(in_game, starts[:, None] + CODES_OFFSET + slots, 0)],
+                     packing.NO_POSITION)
+    positions = (codes & packing.NO_POSITION).astype(np.int64)
+    symbols = ((codes & packing.SYMBOL_O) >> 4).astype(np.int64)
+    played = positions != packing.NO_POSITION
+
+    # Move the played cells to the front of each row, keeping their order
+    order = np.argsort(~played, axis=1, kind="stable")
+    played_positions = np.take_along_axis(positions, order, axis=1)
+    moves = played.sum(axis=1)
+
+    # The first mover is the symbol of the first played cell
+    has_moves = moves > 0
+    first_symbol = np.where(has_moves, np.take_along_axis(symbols, order[:, :1], axis=1)[:, 0], -1)
+    winners = np.asarray(winners)
+    winner_symbol = np.select([winners == "x", winners == "o"], [0, 1], -1)
+    draw = has_moves & (winners == "draw")
+    first_mover_won = has_moves & (winner_symbol == first_symbol)
+    first_mover_lost = has_moves & (winner_symbol >= 0) & (winner_symbol != first_symbol)
+
+    opened = moves >= OPENING_MOVES
+    openings = np.zeros(len(blobs), dtype=np.int64)
+    for i in range(min(OPENING_MOVES, width)):
+        openings = openings * 9 + np.where(opened, played_positions[:, i], 0)
+
+    # The duration is the sum of the timestamp deltas after the codes, 4 or 8 bytes each
+    timed = timed & (counts > 1)
+    duration = np.zeros(len(blobs), dtype=np.int64)
+    if width > 1:
+        delta_width = np.where(flags & packing.FLAG_WIDE_DELTAS, 8, 4)
+        in_deltas = slots[:-1] < (counts - 1)[:, None]
+        delta_starts = starts[:, None] + CODES_OFFSET + counts[:, None] + delta_width[:, None] * slots[:-1]
+        byte_slots = np.arange(8)
+        in_bytes = in_deltas[:, :, None] & (byte_slots < delta_width[:, None, None])
+        delta_bytes = np.where(
+            in_bytes, data[np.where(in_bytes, delta_starts[:, :, None] + byte_slots, 0)], 0).astype(np.uint64)
+        # Little endian, wide deltas are two's complement
+        deltas = (delta_bytes << (8 * byte_slots).astype(np.uint64)).sum(axis=2).view(np.int64)
+        duration = np.where(timed, deltas.sum(axis=1), 0)
+
+    return {
+        "positions": positions,
+        "symbols": symbols,
+        "played": played,
+        "moves": moves,
+        "draw": draw,
+        "first_mover_won": first_mover_won,
+        "first_mover_lost": first_mover_lost,
+        "opened": opened,
+        "openings": openings,
+        "timed": timed,
+        "duration": duration,
+    }
+
+
+def opening_name(number: int) -> str:
+    positions = []
+    for _ in range(OPENING_MOVES):
+        number, position = divmod(number, 9)
+        positions.append(str(position))
+    return "-".join(reversed(positions))
+
+
+async def compute(conn: AsyncConnection, chunk_size: int) -> dict[str, Totals]:
+    totals = {ALL_GAME_TYPES: Totals()}
+    query = (
+        select(GameHistory.game_type, GameHistory.winner, GameHistory.moves_packed, GameHistory.moves_json)
+        .filter(GameHistory.game_status == "completed")
+        .execution_options(yield_per=chunk_size)
+    )
+    result = await conn.stream(query)
+    async for rows in result.partitions():
+        game_types, winners, blobs, moves_json = map(list, zip(*rows))
+        packed = np.fromiter((blob is not None for blob in blobs), dtype=bool, count=len(blobs))
+        for i in np.flatnonzero(~packed):
+            blobs[i] = json_blob(moves_json[i])
+
+        chunk = decode_chunk(winners, blobs, packed)
+        totals[ALL_GAME_TYPES].add(chunk, np.ones(len(blobs), dtype=bool))
+        game_types = np.asarray(game_types)
+        for game_type in np.unique(game_types):
+            totals.setdefault(str(game_type), Totals()).add(chunk, game_types == game_type)
+    return totals
+
+
+async def store(conn: AsyncConnection, totals: dict[str, Totals]):
+    """Replace the stored analytics in one transaction"""
+    computed_at = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    analytics = []
+    openings = []
+    for game_type, total in totals.items():
+        analytics.append({
+            "game_type": game_type,
+            "games": total.games,
+            "first_mover_wins": total.first_mover_wins,
+            "first_mover_losses": total.first_mover_losses,
+            "draws": total.draws,
+            "avg_moves": total.moves / total.games if total.games else 0.0,
+            "avg_duration_seconds": total.duration / total.timed_games / 1e6 if total.timed_games else None,
+            "heatmap_x": total.heatmap[0].tolist(),
+            "heatmap_o": total.heatmap[1].tolist(),
+            "computed_at": computed_at,
+        })
+        for number in np.argsort(-total.openings[0], kind="stable")[:TOP_OPENINGS]:
+            if total.openings[0, number] == 0:
+                break
+            openings.append({
+                "game_type": game_type,
+                "opening": opening_name(int(number)),
+                "games": int(total.openings[0, number]),
+                "first_mover_wins": int(total.openings[1, number]),
+                "draws": int(total.openings[2, number]),
+            })
+
+    await conn.execute(delete(GameOpening))
+    await conn.execute(delete(GameAnalytics))
+    await conn.execute(insert(GameAnalytics), analytics)
+    if openings:
+        await conn.execute(insert(GameOpening), openings)
+
+
+async def main(chunk_size: int):
+    sessionmanager = DatabaseSessionManager(str(settings.DATABASE_URI))
+    try:
+        started = time.perf_counter()
+        async with sessionmanager.connect() as conn:
+            totals = await compute(conn, chunk_size)
+            await store(conn, totals)
+        logger.info(f"Computed the analytics of {totals[ALL_GAME_TYPES].games} games "
+                    f"in {time.perf_counter() - started:.1f}s")
+    finally:
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Games decoded at a time")
+    asyncio.run(main(parser.parse_args().chunk_size))
@@ -0,0 +1,32 @@
+"""
+Recompute the per-user statistics from the stored games.
+
+Needed once for the games stored before user_stats existed, and to repair the
+statistics after manual changes to the data. Safe to run while the worker is
+consuming.
+
+Run from the game-history directory:
+
+    python -m app.backfill_stats
+"""
+import argparse
+import asyncio
+
+from app.core.config import settings
+from app.crud import rebuild_user_stats
+from app.db import DatabaseSessionManager
+
+
+async def backfill():
+    sessionmanager = DatabaseSessionManager(str(settings.DATABASE_URI))
+    try:
+        async with sessionmanager.session() as db_session:
+            rows = await rebuild_user_stats(db_session)
+        print(f"Rebuilt {rows} user statistics rows")
+    finally:
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+    asyncio.run(backfill())
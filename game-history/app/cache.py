@@ -0,0 +1,144 @@
+import hashlib
+
+import redis
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.core.metrics import HISTORY_CACHE_REQUESTS
+from app.recent import recent_games_key
+
+logger = get_logger(__name__)
+
+VERSION_TTL = 24 * 3600
+
+# A version is the time of the change in microseconds, and at least one more than the
+# version it replaces. Versions are never reused, also not after their key expired, so
+# they can back ETags that clients keep for longer than VERSION_TTL.
+NEXT_VERSION_LUA = """
+local function next_version(key)
+    local now = redis.call('TIME')
+    local version = math.max(tonumber(now[1]) * 1000000 + tonumber(now[2]), tonumber(redis.call('GET', key) or '0') + 1)
+    return string.format('%d', version)
+end
+"""
+
+# Reads the version of the user (KEYS[1]), the cached page (KEYS[3]) if it was stored at that version
+# and the recent games of the user (KEYS[2]) in one round trip. A missing version is started, a
+# version equal to ARGV[1] is returned alone, the client has the page.
+#
+# KEYS[4] holds the version at which the user last had recent games. Pushing a recent game
+# bumps the version, but the list expiring does not, so once it is gone while the version
+# is still the one it was seen at, the version is bumped here, see app/recent.py.
+GET_PAGE_SCRIPT = NEXT_VERSION_LUA + """
+local version = redis.call('GET', KEYS[1])
+if not version then
+    version = next_version(KEYS[1])
+    redis.call('SET', KEYS[1], version, 'EX', ARGV[2])
+end
+local seen_at = redis.call('GET', KEYS[4])
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    if seen_at ~= version then
+        redis.call('SET', KEYS[4], version, 'EX', ARGV[2])
+    end
+elseif seen_at then
+    redis.call('DEL', KEYS[4])
+    if seen_at == version then
+        version = next_version(KEYS[1])
+        redis.call('SET', KEYS[1], version, 'EX', ARGV[2])
+    end
+end
+if version == ARGV[1] then
+    return {version}
+end
+local body = false
+local page = redis.call('GET', KEYS[3])
+if page then
+    local separator = string.find(page, ':', 1, true)
+    if separator and string.sub(page, 1, separator - 1) == version then
+        body = string.sub(page, separator + 1)
+    end
+end
+return {version, body, redis.call('LRANGE', KEYS[2], 0, -1)}
+"""
+
+BUMP_VERSIONS_SCRIPT = NEXT_VERSION_LUA + """
+for _, key in ipairs(KEYS) do
+    redis.call('SET', key, next_version(key), 'EX', ARGV[1])
+end
+"""
+
+
+# The user ID is a hash tag in all keys of a user, so the keys GET_PAGE_SCRIPT reads
+# together are in the same Redis Cluster slot. See recent_games_key.
+def version_key(user_id: str) -> str:
+    return f"history:version:{{{user_id}}}"
+
+
+def recent_seen_key(user_id: str) -> str:
+    return f"history:recent_seen:{{{user_id}}}"
+
+
+def page_key(user_id: str, params: dict) -> str:
+    return f"history:page:{{{user_id}}}:{params_digest(params)}"
+
+
+def params_digest(params: dict) -> str:
+    canonical = "&".join(f"{name}={params[name]}" for name in sorted(params))
+    return hashlib.blake2b(canonical.encode(), digest_size=12).hexdigest()
+
+
+class HistoryCache:
+    """
+    Serialized history pages per user, versioned by the games the user finished.
+
+    A page is stored with the version of the user it was built at. Storing a
+    new game bumps the version, which makes all cached pages of the user stale
+    at once, they are ignored until they are overwritten or expire. A hit returns the response body as is,
+    without touching Postgres or Pydantic. Redis errors count as misses.
+    """
+
+    def __init__(self, redis_client, ttl: int = settings.HISTORY_CACHE_TTL):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self._get_page = redis_client.register_script(GET_PAGE_SCRIPT)
+
+    async def get(self, user_id: str, params: dict,
+                  known_version: str | None = None) -> tuple[bytes | None, str | None, list[str]]:
+        """
+        Returns the cached body, if any, the version to store a fresh page under
+        and the summaries of the games the user recently finished, see app/recent.py.
+
+        If the version is known_version, the client already has the page and only
+        the version is read.
+        """
+        try:
+            version, *page = await self._get_page(
+                keys=[version_key(user_id), recent_games_key(user_id), page_key(user_id, params),
+                      recent_seen_key(user_id)],
+                args=[known_version or "", VERSION_TTL])
+        except redis.RedisError as e:
+            logger.error(f"Error reading cached history of {user_id}: {e}")
+            HISTORY_CACHE_REQUESTS.labels(result="error").inc()
+            return None, None, []
+
+        if not page:
+            HISTORY_CACHE_REQUESTS.labels(result="not_modified").inc()
+            return None, version, []
+        body, recent = page
+        HISTORY_CACHE_REQUESTS.labels(result="hit" if body is not None else "miss").inc()
+        return (body.encode() if isinstance(body, str) else body), version, recent
+
+    async def set(self, user_id: str, version: str | None, params: dict, body: bytes):
+        if version is None:
+            return
+        try:
+            await self.redis_client.set(page_key(user_id, params), f"{version}:".encode() + body, ex=self.ttl)
+        except redis.RedisError as e:
+            logger.error(f"Error caching history of {user_id}: {e}")
+
+
+def invalidate_users(pipe, user_ids: set[str]):
+    """Queue the version bumps of users that finished a game on a Redis pipeline"""
+    # One script per user, the versions of different users are in different cluster slots
+    for user_id in sorted(user_ids):
+        pipe.eval(BUMP_VERSIONS_SCRIPT, 1, version_key(user_id), VERSION_TTL)
@@ -1,159 +1,541 @@
-import threading
 import asyncio
 import redis
+from opentelemetry.trace import Link, SpanKind
 import json
 import os
 import socket
+import time
+from collections import defaultdict
+from uuid import UUID
+from sqlalchemy.exc import DBAPIError
 from app.core.config import settings
 from app.core.logger import get_logger
-from app.crud import create_game_history
+from app.core.tracing import extract_trace_context, get_tracer
+from app.core.metrics import (
+    COMPLETED_GAMES_CONSUMER_LAG,
+    COMPLETED_GAMES_DEAD_LETTER_LENGTH,
+    COMPLETED_GAMES_DEAD_LETTERED,
+    CONSUMER_BACKPRESSURE_PAUSE,
+    COMPLETED_GAMES_PENDING,
+    COMPLETED_GAMES_STREAM_LENGTH,
+)
+from app.core.redis_client import get_redis_client
+from app.crud import create_game_histories, game_history_values, participation_values
 from app.db import DatabaseSessionManager
+from app import cache, leaderboard
 
 
 logger = get_logger(__name__)
+tracer = get_tracer(__name__)
 
-def get_redis_client():
-    return redis.Redis(
-        host=settings.REDIS_HOST,
-        port=settings.REDIS_PORT,
-        db=settings.REDIS_DB,
-        password=settings.REDIS_PASSWORD,
-        decode_responses=True
-    )
+STREAM = "completed_games"
+GROUP = "game_history"
+# Entries that could not be stored, kept for inspection and replay
+DEAD_LETTER_STREAM = "completed_games:dead"
 
-_consumer_sessionmanager = None
-_consumer_thread = None
-
-def is_first_worker():
-    """Determine if this is the first worker by checking Redis"""
-    client = get_redis_client()
-    
-    # Use a Redis key as a lock
-    hostname = socket.gethostname()
-    pid = os.getpid()
-    lock_key = "game_history_consumer_lock"
-    
-    # Try to set the key with our hostname:pid if it doesn't exist yet
-    # NX = only set if it doesn't exist, EX = expiry in seconds
-    lock_acquired = client.set(lock_key, f"{hostname}:{pid}", nx=True, ex=30)
-    
-    if lock_acquired:
-        logger.info(f"Lock acquired by {hostname}:{pid}, starting consumer")
-        
-        # Set up a recurring task to refresh the lock
-        def refresh_lock():
-            try:
-                current_value = client.get(lock_key)
-                if current_value and current_value.decode() == f"{hostname}:{pid}":
-                    client.expire(lock_key, 30)  # Extend expiry
-                    threading.Timer(10, refresh_lock).start()
-            except Exception as e:
-                logger.error(f"Error refreshing lock: {e}")
-        
-        # Start refreshing the lock
-        threading.Timer(10, refresh_lock).start()
-        return True
-    else:
-        logger.info(f"Lock already acquired, skipping consumer start in {hostname}:{pid}")
-        current_holder = client.get(lock_key)
-        logger.info(f"Current lock holder: {current_holder}")
-        return False
+# SQLSTATE classes of errors caused by the values of a game: data exceptions and constraint violations
+REJECTED_SQLSTATE_CLASSES = ("22", "23")
 
+# How often the stream length and consumer lag are exported, in seconds
+STREAM_METRICS_INTERVAL = 15
+# How often the stream is trimmed to its retention, in seconds
+TRIM_INTERVAL = 60
 
-async def process_redis_messages():
-    global _consumer_sessionmanager
+_consumer_sessionmanager = None
+# Monotonic time the consumer loop last finished an iteration, used for the health check
+_last_iteration = time.monotonic()
 
-    _consumer_sessionmanager = DatabaseSessionManager(str(settings.DATABASE_URI))
 
-    redis_client = get_redis_client()
+def get_consumer_name():
+    """Unique name of this consumer within the group, one per pod and worker process"""
+    return f"{socket.gethostname()}:{os.getpid()}"
 
+
+async def ensure_consumer_group(redis_client):
     try:
-        redis_client.xgroup_create("completed_games", "game_history", id="0", mkstream=True)
+        await redis_client.xgroup_create(STREAM, GROUP, id="0", mkstream=True)
         logger.info("Consumer Group created")
     except redis.exceptions.ResponseError:
         logger.info("Consumer Group already exists")
 
-    logger.info("Checking existing messages in stream...")
-    all_messages = redis_client.xrange("completed_games", "-", "+")
-    logger.info(f"All messages in stream: {all_messages}")
-    
+
+async def record_stream_metrics(redis_client):
+    """Export the length of the completed_games stream and the lag of our consumer group"""
+    COMPLETED_GAMES_STREAM_LENGTH.set(await redis_client.xlen(STREAM))
+    COMPLETED_GAMES_DEAD_LETTER_LENGTH.set(await redis_client.xlen(DEAD_LETTER_STREAM))
+    for group in await redis_client.xinfo_groups(STREAM):
+        if group["name"] == GROUP:
+            COMPLETED_GAMES_PENDING.set(group["pending"])
+            # Redis reports the lag since 7.0, and None if it cannot be determined
+            if group.get("lag") is not None:
+                COMPLETED_GAMES_CONSUMER_LAG.set(group["lag"])
+
+
+async def remove_idle_consumers(redis_client, consumer_name: str):
+    """Remove consumers of exited workers from the group once they have nothing pending"""
+    for consumer in await redis_client.xinfo_consumers(STREAM, GROUP):
+        if (consumer["name"] != consumer_name and consumer["pending"] == 0
+                and consumer["idle"] > settings.CONSUMER_REMOVE_IDLE_MS):
+            await redis_client.xgroup_delconsumer(STREAM, GROUP, consumer["name"])
+            logger.info(f"Removed idle consumer {consumer['name']}")
+
+
+async def trim_stream(redis_client):
+    """
+    Drop entries older than COMPLETED_GAMES_RETENTION_HOURS.
+
+    Stored games are deleted right after they are acknowledged, so this only
+    bounds the backlog while no worker is consuming. The game service caps
+    the length of the stream as well.
+    """
+    min_id = int((time.time() - settings.COMPLETED_GAMES_RETENTION_HOURS * 3600) * 1000)
+    trimmed = await redis_client.xtrim(STREAM, minid=str(min_id), approximate=True)
+    if trimmed:
+        logger.warning(f"Trimmed {trimmed} entries older than "
+                       f"{settings.COMPLETED_GAMES_RETENTION_HOURS}h from {STREAM}")
+
+
+async def dead_letter(redis_client, entries: list[tuple[str, dict, int]], reason: str):
+    """
+    Move entries to the dead-letter stream and remove them from completed_games.
+
+    Takes (message id, fields, retries) tuples. The dead-lettered entry keeps
+    the original fields and records its original ID, the reason and how often
+    processing it was retried.
+    """
+    if not entries:
+        return
+
+    pipe = redis_client.pipeline(transaction=False)
+    for msg_id, msg_data, retries in entries:
+        pipe.xadd(DEAD_LETTER_STREAM, {
+            **msg_data,
+            "source_id": msg_id,
+            "reason": reason,
+            "retries": retries,
+            "failed_at": int(time.time()),
+        }, maxlen=settings.DEAD_LETTER_MAXLEN, approximate=True)
+    msg_ids = [msg_id for msg_id, _, _ in entries]
+    pipe.xack(STREAM, GROUP, *msg_ids)
+    pipe.xdel(STREAM, *msg_ids)
+    await pipe.execute()
+
+    COMPLETED_GAMES_DEAD_LETTERED.labels(reason=reason).inc(len(entries))
+    logger.warning(f"Moved {len(entries)} messages to {DEAD_LETTER_STREAM}, reason: {reason}")
+
+
+async def delivery_counts(redis_client, consumer_name: str, msg_ids: list[str]) -> dict[str, int]:
+    """How often each of the given entries pending for this consumer was delivered"""
+    pipe = redis_client.pipeline(transaction=False)
+    for msg_id in msg_ids:
+        pipe.xpending_range(STREAM, GROUP, min=msg_id, max=msg_id, count=1, consumername=consumer_name)
+    return {entry["message_id"]: entry["times_delivered"] for pending in await pipe.execute() for entry in pending}
+
+
+async def dead_letter_exhausted(redis_client, consumer_name: str,
+                                messages: list[tuple[str, dict]]) -> list[tuple[str, dict]]:
+    """
+    Dead-letter reclaimed entries that were delivered more than CONSUMER_MAX_DELIVERIES times.
+
+    Deliveries whose write failed because the database was unavailable are
+    not counted, see release_deliveries. What is left are deliveries that
+    ended without an outcome, e.g. because the worker crashed on the entry.
+    Returns the entries that should be retried.
+    """
+    if not messages:
+        return messages
+
+    deliveries = await delivery_counts(redis_client, consumer_name, [msg_id for msg_id, _ in messages])
+
+    retry, exhausted = [], []
+    for msg_id, msg_data in messages:
+        delivered = deliveries.get(msg_id, 1)
+        if delivered > settings.CONSUMER_MAX_DELIVERIES:
+            exhausted.append((msg_id, msg_data, delivered - 1))
+        else:
+            retry.append((msg_id, msg_data))
+
+    await dead_letter(redis_client, exhausted, "max_deliveries")
+    return retry
+
+
+async def release_deliveries(redis_client, consumer_name: str, msg_ids: list[str]):
+    """
+    Take back the last delivery of entries whose write failed through no fault of their own.
+
+    The entries stay pending for this consumer with their delivery count
+    lowered by one, so an outage of the database doesn't use up their deliveries.
+    """
+    retries = defaultdict(list)
+    for msg_id, delivered in (await delivery_counts(redis_client, consumer_name, msg_ids)).items():
+        retries[max(delivered - 1, 0)].append(msg_id)
+
+    pipe = redis_client.pipeline(transaction=False)
+    for retry_count, ids in retries.items():
+        pipe.xclaim(STREAM, GROUP, consumer_name, 0, ids, retrycount=retry_count, justid=True)
+    await pipe.execute()
+
+
+def record_stored_games(pipe, games_data: list[dict], inserted: list[UUID]):
+    """
+    Queue the updates that follow storing games on a Redis pipeline: the
+    leaderboard points of the games that were inserted and the history
+    versions of all players.
+
+    Games that were stored before, e.g. by an earlier delivery, get no points,
+    their points were added when they were inserted.
+    """
+    inserted_ids = {str(game_id) for game_id in inserted}
+    participations = [
+        participation for game_data in games_data for participation in participation_values(game_data)]
+    leaderboard.record_games(
+        pipe, [participation for participation in participations
+               if str(participation["game_id"]) in inserted_ids])
+    cache.invalidate_users(pipe, {participation["user_id"] for participation in participations})
+
+
+def start_consumer_span(msg_id: str, msg_data: dict):
+    """
+    Continue the trace of the move that completed the game.
+
+    The time the entry spent in the stream is derived from the millisecond timestamp in its ID.
+    The span is ended by the caller once the game has been stored.
+    """
+    queued_ms = int(time.time() * 1000) - int(msg_id.split("-")[0])
+    return tracer.start_span(
+        "history.persist_game",
+        context=extract_trace_context(msg_data),
+        kind=SpanKind.CONSUMER,
+        attributes={"messaging.message.id": msg_id, "messaging.queue_time_ms": queued_ms},
+    )
+
+
+def parse_message(msg_id: str, msg_data: dict) -> dict | None:
+    """Extract the game from a stream entry, None if the entry is malformed"""
+    if "data" not in msg_data:
+        logger.error(f"Message {msg_id} doesn't contain 'data' field: {msg_data}")
+        return None
+
+    # Parse the nested JSON string
     try:
-        while True:
-            # Read messages from the stream
+        game_data = json.loads(msg_data["data"])
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse JSON data of message {msg_id}: {e}")
+        return None
+
+    # Reject games that cannot be stored here, so they don't fail the whole batch
+    try:
+        game_history_values(game_data)
+        UUID(game_data["id"])
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        logger.error(f"Message {msg_id} is not a valid game: {e!r}")
+        return None
+    return game_data
+
+
+def is_rejected(error: Exception) -> bool:
+    """Whether the database refused the values of the games, rather than being unavailable"""
+    if isinstance(error, (KeyError, TypeError, ValueError)):
+        return True
+    sqlstate = getattr(getattr(error, "orig", None), "sqlstate", None)
+    return isinstance(error, DBAPIError) and sqlstate is not None and sqlstate[:2] in REJECTED_SQLSTATE_CLASSES
+
+
+async def store_games(entries: list[tuple[str, dict, dict]]) -> tuple[list, list, list[UUID]]:
+    """
+    Store the games of (message id, fields, game) tuples, one transaction per batch.
+
+    When the database rejects a batch, it is split in halves that are stored
+    on their own, down to the single games it rejects. Returns the stored and
+    the rejected entries, and the IDs of the games that were inserted. Other
+    errors, e.g. a lost connection, are raised.
+    """
+    try:
+        async with _consumer_sessionmanager.session() as db_session:
+            # Redelivered games are skipped, so storing them again is safe
+            inserted = await create_game_histories(
+                db_session=db_session, games_data=[game_data for _, _, game_data in entries])
+        return entries, [], inserted
+    except Exception as e:
+        if not is_rejected(e):
+            raise
+        if len(entries) == 1:
+            logger.error(f"Database rejected the game of message {entries[0][0]}: {e}")
+            return [], entries, []
+
+    middle = len(entries) // 2
+    stored, rejected, inserted = await store_games(entries[:middle])
+    stored_rest, rejected_rest, inserted_rest = await store_games(entries[middle:])
+    return stored + stored_rest, rejected + rejected_rest, inserted + inserted_rest
+
+
+async def handle_batch(redis_client, consumer_name: str, messages: list[tuple[str, dict]]) -> bool:
+    """
+    Store a batch of completed games in one transaction, then update the
+    leaderboards, invalidate the cached history of the players and acknowledge
+    and delete the entries with one pipeline.
+
+    Malformed entries and games the database rejects are moved to the
+    dead-letter stream, the rest of the batch is stored. If the database is
+    unavailable, the entries stay pending for this consumer without the
+    delivery counting against them. Returns whether the write succeeded.
+    """
+    spans = []
+    entries = []
+    malformed = []
+    for msg_id, msg_data in messages:
+        span = start_consumer_span(msg_id, msg_data)
+        game_data = parse_message(msg_id, msg_data)
+        if game_data is None:
+            span.end()
+            malformed.append((msg_id, msg_data, 0))
+            continue
+        spans.append(span)
+        entries.append((msg_id, msg_data, game_data))
+
+    await dead_letter(redis_client, malformed, "malformed")
+
+    if not entries:
+        return True
+
+    try:
+        try:
+            with tracer.start_as_current_span(
+                    "history.create_game_histories",
+                    links=[Link(span.get_span_context()) for span in spans],
+                    attributes={"batch.size": len(entries)}):
+                stored, rejected, inserted = await store_games(entries)
+        except Exception as e:
+            logger.error(f"Error in database operation: {e}")
+            await release_deliveries(redis_client, consumer_name, [msg_id for msg_id, _, _ in entries])
+            return False
+
+        await dead_letter(redis_client, [(msg_id, msg_data, 0) for msg_id, msg_data, _ in rejected], "rejected")
+        if not stored:
+            return True
+
+        # Acknowledge and delete the stored games after processing. If this fails after the
+        # commit, the redelivered games are no longer new and their points are only restored
+        # by rebuilding the leaderboards, see app.rebuild_leaderboard.
+        msg_ids = [msg_id for msg_id, _, _ in stored]
+        pipe = redis_client.pipeline(transaction=False)
+        record_stored_games(pipe, [game_data for _, _, game_data in stored], inserted)
+        pipe.xack(STREAM, GROUP, *msg_ids)
+        pipe.xdel(STREAM, *msg_ids)
+        await pipe.execute()
+        logger.info(f"Acknowledged {len(msg_ids)} messages, stored {len(inserted)} new games in DB")
+        return True
+    finally:
+        for span in spans:
+            span.end()
+
+
+async def read_batch(redis_client, consumer_name: str) -> list[tuple[str, dict]]:
+    """
+    Read up to CONSUMER_BATCH_SIZE new entries.
+
+    Blocks until the first entry arrives, then keeps collecting for at most
+    CONSUMER_BATCH_WAIT_MS so bursts are written together.
+    """
+    batch = []
+    block_ms = settings.CONSUMER_BLOCK_MS
+    deadline = None
+    while len(batch) < settings.CONSUMER_BATCH_SIZE:
+        if deadline is not None:
+            block_ms = int((deadline - time.monotonic()) * 1000)
+            if block_ms <= 0:
+                break
+
+        messages = await redis_client.xreadgroup(
+            GROUP, consumer_name, {STREAM: ">"},
+            count=settings.CONSUMER_BATCH_SIZE - len(batch),
+            block=block_ms,
+        )
+        if not messages:
+            break
+        for stream, msg_list in messages:
+            batch.extend(msg_list)
+
+        if deadline is None:
+            deadline = time.monotonic() + settings.CONSUMER_BATCH_WAIT_MS / 1000
+    return batch
+
+
+async def read_own_pending(redis_client, consumer_name: str) -> list[tuple[str, dict]]:
+    """Read the oldest entries that this consumer received but has not acknowledged yet"""
+    messages = await redis_client.xreadgroup(
+        GROUP, consumer_name, {STREAM: "0"}, count=settings.CONSUMER_BATCH_SIZE)
+    batch = [message for stream, msg_list in messages for message in msg_list]
+    # Entries deleted from the stream while pending have no fields, nothing is left to store
+    deleted = [msg_id for msg_id, msg_data in batch if not msg_data]
+    if deleted:
+        await redis_client.xack(STREAM, GROUP, *deleted)
+    return [(msg_id, msg_data) for msg_id, msg_data in batch if msg_data]
+
+
+async def claim_stale_messages(redis_client, consumer_name: str, start_id: str):
+    """
+    Take over entries that another consumer received but did not acknowledge in time,
+    e.g. because its pod was killed or the DB write failed.
+
+    Returns the claimed messages and the cursor for the next call.
+    """
+    response = await redis_client.xautoclaim(
+        STREAM, GROUP, consumer_name,
+        min_idle_time=settings.CONSUMER_CLAIM_MIN_IDLE_MS,
+        start_id=start_id,
+        count=settings.CONSUMER_BATCH_SIZE,
+    )
+    next_id, messages = response[0], response[1]
+    # Entries deleted from the stream while pending are returned as None
+    return [(msg_id, msg_data) for msg_id, msg_data in messages if msg_data], next_id
+
+
+class Backpressure:
+    """
+    Slow down reading when the database gets slow.
+
+    Keeps a moving average of the batch write latency. While it is above the
+    target, the consumer pauses before reading the next batch, the longer the
+    further above the target it is. A failed write doubles the pause, so a
+    struggling database is not hammered with retries. Entries that are not
+    read yet simply wait in the stream.
+    """
+
+    def __init__(self, target: float = settings.CONSUMER_TARGET_WRITE_SECONDS,
+                 max_pause: float = settings.CONSUMER_MAX_PAUSE_SECONDS, smoothing: float = 0.3):
+        self.target = target
+        self.max_pause = max_pause
+        self.smoothing = smoothing
+        self.latency = 0.0
+        self.pause = 0.0
+
+    def record(self, duration: float, succeeded: bool):
+        if not succeeded:
+            self.pause = min(self.max_pause, max(self.pause * 2, self.target))
+        else:
+            self.latency = self.smoothing * duration + (1 - self.smoothing) * self.latency
+            overload = self.latency / self.target - 1
+            self.pause = min(self.max_pause, self.latency * overload) if overload > 0 else 0.0
+        CONSUMER_BACKPRESSURE_PAUSE.set(self.pause)
+
+    async def wait(self, stopping: asyncio.Event):
+        """Sleep for the current pause, returns early when the consumer is stopping"""
+        if self.pause <= 0:
+            return
+        try:
+            await asyncio.wait_for(stopping.wait(), timeout=self.pause)
+        except TimeoutError:
+            pass
+
+
+async def handle_with_backpressure(redis_client, consumer_name: str, messages: list[tuple[str, dict]],
+                                   backpressure: Backpressure) -> bool:
+    start = time.monotonic()
+    succeeded = await handle_batch(redis_client, consumer_name, messages)
+    backpressure.record(time.monotonic() - start, succeeded)
+    return succeeded
+
+
+async def leave_consumer_group(redis_client, consumer_name: str):
+    """Remove this consumer from the group on shutdown, unless it still owns pending entries"""
+    for consumer in await redis_client.xinfo_consumers(STREAM, GROUP):
+        if consumer["name"] == consumer_name and consumer["pending"] == 0:
+            await redis_client.xgroup_delconsumer(STREAM, GROUP, consumer_name)
+            logger.info(f"Consumer {consumer_name} left group {GROUP}")
+
+
+def is_healthy() -> bool:
+    """Whether the consumer loop has made progress recently"""
+    return time.monotonic() - _last_iteration < settings.WORKER_STALL_TIMEOUT
+
+
+async def process_redis_messages(stopping: asyncio.Event):
+    """
+    Consume the completed_games stream until `stopping` is set.
+
+    The batch in flight when stopping is set is still written and acknowledged
+    before the function returns.
+    """
+    global _consumer_sessionmanager, _last_iteration
+
+    # Own pool, writes must not wait for connections the API holds
+    _consumer_sessionmanager = DatabaseSessionManager(
+        str(settings.DATABASE_URI),
+        pool_size=settings.DB_WORKER_POOL_SIZE,
+        max_overflow=settings.DB_WORKER_MAX_OVERFLOW,
+    )
+    _consumer_sessionmanager.start_health_checks()
+
+    redis_client = get_redis_client()
+    consumer_name = get_consumer_name()
+    backpressure = Backpressure()
+
+    await ensure_consumer_group(redis_client)
+    logger.info(f"Consuming {STREAM} as {consumer_name} in group {GROUP}")
+
+    last_stream_metrics = 0.0
+    last_trim = 0.0
+    last_claim = 0.0
+    claim_cursor = "0-0"
+    # Set when a write fails, until the entries this consumer holds are stored
+    retry_pending = False
+
+    try:
+        while not stopping.is_set():
+            _last_iteration = time.monotonic()
             try:
-                messages = redis_client.xread({"completed_games": "0"}, count=1, block=5000)
-                logger.debug(f"Messages read: {messages}")
-                if messages:
-                    for stream, msg_list in messages:
-                        for msg_id, msg_data in msg_list:
-                            logger.info(f"Raw message data: {msg_data}")
-                            
-                            # Extract the nested JSON data
-                            if "data" in msg_data:
-                                # Parse the nested JSON string
-                                try:
-                                    game_data = json.loads(msg_data["data"])
-                                    logger.info(f"Parsed game data: {game_data}")
-                                    
-                                    async with _consumer_sessionmanager.session() as db_session:
-                                        # Now we have a real session, not just a dependency annotation
-                                        try:
-                                            await create_game_history(db_session=db_session, game_data=game_data)
-                                            logger.info(f"Game history created for game ID: {game_data['id']}")
-                                            
-                                            # Acknowledge the message
-                                            redis_client.xack("completed_games", "game_history", msg_id)
-                                            logger.info(f"Acknowledged and stored in DB: {msg_id}")
-                                            
-                                            # Delete message after processing
-                                            redis_client.xdel("completed_games", msg_id)
-                                            logger.info(f"Deleted: {msg_id}")
-                                        except Exception as e:
-                                            # The session.close() will be handled by the context manager
-                                            logger.error(f"Error in database operation: {e}")
-                                            continue
-                                except json.JSONDecodeError as e:
-                                    logger.error(f"Failed to parse JSON data: {e}")
-                            else:
-                                logger.error(f"Message doesn't contain 'data' field: {msg_data}")
-            
-                else:
+                if time.monotonic() - last_stream_metrics >= STREAM_METRICS_INTERVAL:
+                    await record_stream_metrics(redis_client)
+                    last_stream_metrics = time.monotonic()
+
+                if time.monotonic() - last_trim >= TRIM_INTERVAL:
+                    await trim_stream(redis_client)
+                    last_trim = time.monotonic()
+
+                await backpressure.wait(stopping)
+                if stopping.is_set():
+                    break
+
+                if retry_pending:
+                    # No new entries are taken on while the database fails, they wait in the stream
+                    pending = await read_own_pending(redis_client, consumer_name)
+                    if pending:
+                        await handle_with_backpressure(redis_client, consumer_name, pending, backpressure)
+                    else:
+                        retry_pending = False
+                    continue
+
+                if time.monotonic() - last_claim >= settings.CONSUMER_CLAIM_INTERVAL:
+                    claimed, claim_cursor = await claim_stale_messages(
+                        redis_client, consumer_name, claim_cursor)
+                    claimed = await dead_letter_exhausted(redis_client, consumer_name, claimed)
+                    if claimed:
+                        logger.info(f"Reclaimed {len(claimed)} stale messages")
+                        if not await handle_with_backpressure(redis_client, consumer_name, claimed, backpressure):
+                            retry_pending = True
+                            continue
+                    # Keep paging through the pending list until the cursor wraps around
+                    if claim_cursor == "0-0":
+                        await remove_idle_consumers(redis_client, consumer_name)
+                        last_claim = time.monotonic()
+
+                # Read a batch of new messages, blocking without holding up the event loop
+                messages = await read_batch(redis_client, consumer_name)
+                if not messages:
                     logger.debug("No new messages. Waiting...")
-                    await asyncio.sleep(1)
+                    continue
+
+                retry_pending = not await handle_with_backpressure(
+                    redis_client, consumer_name, messages, backpressure)
             except Exception as e:
-                logger.info(f"Error processing message: {e}")
+                logger.error(f"Error processing messages: {e}")
                 await asyncio.sleep(1)  # Wait before retrying
+
+        logger.info("Consumer stopped, all read messages are processed")
+        await leave_consumer_group(redis_client, consumer_name)
     finally:
         # Clean up if the consumer exits
+        await redis_client.aclose()
         if _consumer_sessionmanager:
             await _consumer_sessionmanager.close()
-
-def run_async_process():
-    """Run the async process_redis_messages in an event loop"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(process_redis_messages())
-    finally:
-        loop.close()
-
-def start_redis_consumer():
-    """Start the Redis consumer in a separate thread"""
-    thread = threading.Thread(target=run_async_process, daemon=True)
-    thread.start()
-    return thread
-
-def ensure_consumer_running():
-    """Ensure the consumer is running, starting it if needed"""
-    global _consumer_thread
-    
-    # Only start the consumer if we're the first worker to do so
-    if is_first_worker():
-        if _consumer_thread is None or not _consumer_thread.is_alive():
-            _consumer_thread = start_redis_consumer()
-            return _consumer_thread
-    return None
-
-# Auto-start on import if not running as main script
-if __name__ != "__main__":
-    ensure_consumer_running()
\ No newline at end of file
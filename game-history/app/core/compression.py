@@ -0,0 +1,76 @@
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder, IdentityResponder
+
+
+def accepted_encodings(accept_encoding: str) -> dict[str, float]:
+    """The content codings of an Accept-Encoding header with their q-values"""
+    encodings = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        encodings[coding] = q
+    return encodings
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int):
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if more_body:
+            # Flush so a streamed chunk reaches the client without waiting for the next one
+            return self.compressor.process(body) + self.compressor.flush()
+        return self.compressor.process(body) + self.compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress responses of at least minimum_size bytes with brotli or gzip,
+    whichever the client prefers by q-value, brotli on a tie. Codings with
+    q=0 are refused.
+
+    Streamed responses like /export are compressed chunk by chunk. The content
+    coding is appended to the ETag of a compressed response, a strong ETag
+    identifies a single encoding of the response.
+    """
+
+    def __init__(self, app, minimum_size: int = 1000, compresslevel: int = 6, brotli_quality: int = 4):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_with_etag(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                etag = headers.get("ETag")
+                if etag and etag.endswith('"') and "content-encoding" in headers:
+                    headers["ETag"] = f'{etag[:-1]}-{headers["content-encoding"]}"'
+            await send(message)
+
+        accepted = accepted_encodings(Headers(scope=scope).get("Accept-Encoding", ""))
+        # Codings that are not listed get the q-value of "*", if any
+        br, gzip = (accepted.get(coding, accepted.get("*", 0.0)) for coding in ("br", "gzip"))
+        if br > 0 and br >= gzip:
+            responder = BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+        elif gzip > 0:
+            responder = GZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send_with_etag)
@@ -32,12 +32,90 @@ class Settings(BaseSettings):
             port=self.POSTGRES_PORT,
             path=self.POSTGRES_DB,
         )
+
+    # Read replicas, comma separated hosts with the port and credentials of the primary.
+    # One host per instance, not a service balancing over several, see app/db.py
+    POSTGRES_REPLICA_SERVERS: str = ""
+
+    @computed_field  # type: ignore[misc]
+    @property
+    def REPLICA_DATABASE_URIS(self) -> list[PostgresDsn]:
+        return [
+            MultiHostUrl.build(
+                scheme="postgresql+asyncpg",
+                username=self.POSTGRES_USER,
+                password=self.POSTGRES_PASSWORD,
+                host=host.strip(),
+                port=self.POSTGRES_PORT,
+                path=self.POSTGRES_DB,
+            )
+            for host in self.POSTGRES_REPLICA_SERVERS.split(",") if host.strip()
+        ]
+
+    # Replicas further behind the primary get no reads, in seconds
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    # Liveness and replica lag checks instead of a ping per checkout, in seconds
+    DB_HEALTH_CHECK_INTERVAL: float = 5.0
+    DB_POOL_RECYCLE: int = 1800  # seconds
+    # Connection pools per engine of the API and of the ingestion worker
+    DB_API_POOL_SIZE: int = 10
+    DB_API_MAX_OVERFLOW: int = 5
+    DB_WORKER_POOL_SIZE: int = 2
+    DB_WORKER_MAX_OVERFLOW: int = 0
     
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
     REDIS_PASSWORD: str = "password"
 
+    # completed_games consumer
+    CONSUMER_BATCH_SIZE: int = 100
+    CONSUMER_BLOCK_MS: int = 5000
+    # Time to keep collecting a batch after its first entry arrived
+    CONSUMER_BATCH_WAIT_MS: int = 50
+    # Entries pending longer than this are taken over from their consumer
+    CONSUMER_CLAIM_MIN_IDLE_MS: int = 60000
+    CONSUMER_CLAIM_INTERVAL: int = 30  # seconds
+    CONSUMER_REMOVE_IDLE_MS: int = 3600000
+    # Pause reading while batch writes take longer than the target, in seconds
+    CONSUMER_TARGET_WRITE_SECONDS: float = 0.5
+    CONSUMER_MAX_PAUSE_SECONDS: float = 10.0
+    # Entries delivered more often than this are moved to the dead-letter stream,
+    # deliveries whose write failed because the database was unavailable are not counted
+    CONSUMER_MAX_DELIVERIES: int = 10
+
+    # Retention of the completed_games stream and its dead-letter stream
+    COMPLETED_GAMES_RETENTION_HOURS: int = 72
+    DEAD_LETTER_MAXLEN: int = 100000
+
+    # Cached history pages, the consumer invalidates them when a user finishes a game
+    HISTORY_CACHE_TTL: int = 300  # seconds
+
+    # Responses from this size on are compressed with brotli or gzip, in bytes
+    COMPRESSION_MINIMUM_SIZE: int = 1000
+    GZIP_COMPRESSLEVEL: int = 6
+    BROTLI_QUALITY: int = 4
+
+    # Rows per chunk of /export, memory of an export is bounded by one chunk
+    EXPORT_CHUNK_SIZE: int = 1000
+
+    # Parquet files of archived game_history partitions, see app/partitions.py
+    ARCHIVE_DIR: str = "archive"
+
+    # Ingestion worker
+    WORKER_PORT: int = 8000
+    # Seconds without a finished consumer iteration before the worker reports unhealthy
+    WORKER_STALL_TIMEOUT: int = 120
+
+    # Event loop monitoring, in seconds
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL: float = 0.25
+    LOOP_MONITOR_THRESHOLD: float = 0.1
+
+    # Tracing
+    OTEL_SERVICE_NAME: str = "game-history"
+    OTEL_EXPORTER_OTLP_ENDPOINT: str | None = None
+
 
     # Logging
     LOG_FILE_PATH: str = "logs/app.log"
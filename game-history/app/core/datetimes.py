@@ -0,0 +1,8 @@
+import datetime
+
+
+def to_naive_utc(value: datetime.datetime | None) -> datetime.datetime | None:
+    """created_at is stored as naive UTC"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,27 @@
+from starlette.responses import Response
+
+# Content codings CompressionMiddleware appends to the ETags of the responses it compresses
+CONTENT_CODINGS = ("br", "gzip")
+
+
+def make_etag(version: str, digest: str) -> str:
+    """Strong ETag of a response built at version, digest tells apart responses built at the same version"""
+    return f'"{version}.{digest}"'
+
+
+def match_etag(if_none_match: str | None, digest: str) -> tuple[str | None, str | None]:
+    """The ETag in If-None-Match that was made with digest, if any, and its version"""
+    for tag in (if_none_match or "").split(","):
+        tag = tag.strip()
+        value = tag.removeprefix("W/").strip('"')
+        for coding in CONTENT_CODINGS:
+            value = value.removesuffix(f"-{coding}")
+        version, _, tag_digest = value.partition(".")
+        if tag_digest == digest and version:
+            return tag, version
+    return None, None
+
+
+def not_modified(etag: str) -> Response:
+    """Empty response for a client that has the representation with etag"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
@@ -0,0 +1,90 @@
+import asyncio
+import collections
+import sys
+import threading
+import time
+import traceback
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.core.metrics import EVENT_LOOP_BLOCKED, EVENT_LOOP_LAG, EVENT_LOOP_LAG_QUANTILE
+
+logger = get_logger(__name__)
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class LoopMonitor:
+    """
+    Measure the lag of an asyncio event loop and report callbacks that block it.
+
+    A task on the monitored loop wakes up every `interval` seconds and records
+    how late it was. A watchdog thread checks when the task last woke up; if
+    the loop has been stuck for longer than `threshold` seconds, it logs the
+    current stack of the loop's thread, which points at the blocking call.
+    """
+
+    def __init__(self, name: str, interval: float = settings.LOOP_MONITOR_INTERVAL,
+                 threshold: float = settings.LOOP_MONITOR_THRESHOLD, window: int = 240):
+        self.name = name
+        self.interval = interval
+        self.threshold = threshold
+        # Recent lag samples used for the exported percentiles
+        self._samples = collections.deque(maxlen=window)
+        self._last_tick = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._stopped = threading.Event()
+        self._reported_stall = False
+
+    def start(self):
+        """Start monitoring the running event loop"""
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._task = loop.create_task(self._measure())
+        threading.Thread(target=self._watch, name=f"loop-monitor-{self.name}", daemon=True).start()
+        logger.info(f"Event loop monitor started for {self.name}")
+
+    def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _measure(self):
+        loop = asyncio.get_running_loop()
+        ticks = 0
+        while True:
+            scheduled = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - scheduled - self.interval)
+            self._last_tick = time.monotonic()
+            self._reported_stall = False
+
+            EVENT_LOOP_LAG.labels(loop=self.name).observe(lag)
+            self._samples.append(lag)
+
+            ticks += 1
+            if ticks % 4 == 0:
+                self._export_quantiles()
+
+    def _export_quantiles(self):
+        samples = sorted(self._samples)
+        for quantile in QUANTILES:
+            value = samples[min(len(samples) - 1, int(quantile * len(samples)))]
+            EVENT_LOOP_LAG_QUANTILE.labels(loop=self.name, quantile=str(quantile)).set(value)
+
+    def _watch(self):
+        while not self._stopped.wait(self.threshold / 2):
+            stalled = time.monotonic() - self._last_tick - self.interval
+            if stalled <= self.threshold or self._reported_stall:
+                continue
+
+            # Only report each stall once, the next tick re-arms the watchdog
+            self._reported_stall = True
+            EVENT_LOOP_BLOCKED.labels(loop=self.name).inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<unavailable>"
+            logger.warning(
+                f"Event loop {self.name} blocked for more than {stalled:.3f}s, stack:\n{stack}")
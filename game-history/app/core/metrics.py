@@ -0,0 +1,228 @@
+import os
+import time
+
+import redis
+import redis.client
+import redis.asyncio
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.responses import Response
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+)
+
+HISTORY_CACHE_REQUESTS = Counter(
+    "history_cache_requests_total",
+    "Lookups of cached history pages",
+    ["result"],
+)
+
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds",
+    "Database query latency by operation",
+    ["query"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+DB_READ_SESSIONS = Counter(
+    "db_read_sessions_total",
+    "Read-only sessions by the database they were routed to",
+    ["target"],
+)
+
+DB_REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds",
+    "Replication lag of a read replica at its last health check",
+    ["replica"],
+    multiprocess_mode="livemostrecent",
+)
+
+COMPLETED_GAMES_STREAM_LENGTH = Gauge(
+    "completed_games_stream_length",
+    "Number of entries in the completed_games stream",
+    multiprocess_mode="livemostrecent",
+)
+
+COMPLETED_GAMES_CONSUMER_LAG = Gauge(
+    "completed_games_consumer_lag",
+    "Entries of the completed_games stream not yet delivered to the consumer group",
+    multiprocess_mode="livemostrecent",
+)
+
+COMPLETED_GAMES_PENDING = Gauge(
+    "completed_games_pending",
+    "Entries delivered to the consumer group but not yet acknowledged",
+    multiprocess_mode="livemostrecent",
+)
+
+COMPLETED_GAMES_DEAD_LETTER_LENGTH = Gauge(
+    "completed_games_dead_letter_length",
+    "Number of entries in the completed_games dead-letter stream",
+    multiprocess_mode="livemostrecent",
+)
+
+COMPLETED_GAMES_DEAD_LETTERED = Counter(
+    "completed_games_dead_lettered_total",
+    "Entries moved to the dead-letter stream",
+    ["reason"],
+)
+
+CONSUMER_BACKPRESSURE_PAUSE = Gauge(
+    "completed_games_consumer_pause_seconds",
+    "Pause before reading the next batch because of slow database writes",
+    multiprocess_mode="livemostrecent",
+)
+
+REDIS_COMMAND_LATENCY = Histogram(
+    "redis_command_duration_seconds",
+    "Redis command latency",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+# A pipeline is one round trip, its latency is recorded under command="PIPELINE"
+# and its size here, the size as a label would make a series per batch size
+REDIS_PIPELINE_COMMANDS = Histogram(
+    "redis_pipeline_commands",
+    "Commands per executed Redis pipeline",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay of scheduled event loop wake-ups",
+    ["loop"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+EVENT_LOOP_LAG_QUANTILE = Gauge(
+    "event_loop_lag_quantile_seconds",
+    "Event loop lag percentiles over the recent window, per process",
+    ["loop", "quantile"],
+    multiprocess_mode="liveall",
+)
+
+EVENT_LOOP_BLOCKED = Counter(
+    "event_loop_blocked_total",
+    "Times the event loop was blocked for longer than the threshold",
+    ["loop"],
+)
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    """Pipeline that records the latency and the size of every batch it executes."""
+
+    def execute(self, raise_on_error=True):
+        commands = len(self.command_stack)
+        if not commands:
+            return super().execute(raise_on_error)
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            REDIS_COMMAND_LATENCY.labels(command="PIPELINE").observe(time.perf_counter() - start)
+            REDIS_PIPELINE_COMMANDS.observe(commands)
+
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client that records the latency of every command and pipeline it executes."""
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        # Queued commands skip execute_command, the pipeline records them as a batch
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_LATENCY.labels(command=str(args[0]).upper()).observe(
+                time.perf_counter() - start)
+
+
+class InstrumentedAsyncPipeline(redis.asyncio.client.Pipeline):
+    """Asyncio variant of InstrumentedPipeline."""
+
+    async def execute(self, raise_on_error: bool = True):
+        commands = len(self.command_stack)
+        if not commands:
+            return await super().execute(raise_on_error)
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_COMMAND_LATENCY.labels(command="PIPELINE").observe(time.perf_counter() - start)
+            REDIS_PIPELINE_COMMANDS.observe(commands)
+
+
+class InstrumentedAsyncRedis(redis.asyncio.Redis):
+    """Asyncio variant of InstrumentedRedis."""
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None):
+        return InstrumentedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_LATENCY.labels(command=str(args[0]).upper()).observe(
+                time.perf_counter() - start)
+
+
+class PrometheusMiddleware:
+    """Record the latency of every HTTP request, labelled by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Use the route template, not the raw path, to keep label cardinality bounded
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                method=scope["method"],
+                route=route.path if route is not None else "unmatched",
+                status=str(status_code),
+            ).observe(time.perf_counter() - start)
+
+
+def metrics_response() -> Response:
+    """
+    Render all metrics in the Prometheus text format.
+
+    When running under gunicorn with PROMETHEUS_MULTIPROC_DIR set, the
+    metrics of all workers are aggregated.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
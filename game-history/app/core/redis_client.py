@@ -0,0 +1,12 @@
+from app.core.config import settings
+from app.core.metrics import InstrumentedAsyncRedis
+
+
+def get_redis_client():
+    return InstrumentedAsyncRedis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        password=settings.REDIS_PASSWORD,
+        decode_responses=True
+    )
@@ -1,55 +1,423 @@
+import base64
 from datetime import datetime
-from sqlalchemy import select
+from typing import AsyncIterator
+from uuid import UUID
+from sqlalchemy import case, func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models import GameHistory
+from sqlalchemy.orm import load_only
+from app.models import GameAnalytics, GameHistory, GameOpening, GameParticipation, UserStats
+from app.packing import try_pack_moves
 from app.core.logger import get_logger
+from app.core.metrics import DB_QUERY_LATENCY
 
 logger = get_logger(__name__)
 
-async def get_games(db_session: AsyncSession, user_id: str, offset: int, limit: int) -> list[GameHistory]:
+# The game service plays bot games as this user, it has no history of its own
+BOT_USER_ID = "bot"
+# game_type of the statistics over all game types
+ALL_GAME_TYPES = "all"
+
+
+def encode_cursor(game: GameHistory) -> str:
+    """Opaque cursor pointing after the given game in the newest first order"""
+    return base64.urlsafe_b64encode(f"{game.created_at.isoformat()}|{game.game_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    """Raises ValueError for cursors that were not created by encode_cursor"""
+    try:
+        created_at, game_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), UUID(game_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+# Columns of game_history each field of GameDTO is read from, board and moves are unpacked from several
+MOVES_COLUMNS = ("board_json", "moves_json", "moves_packed", "player_x_id", "player_o_id")
+GAME_FIELD_COLUMNS = {
+    "id": ("id",),
+    "player_x_id": ("player_x_id",),
+    "player_o_id": ("player_o_id",),
+    "winner": ("winner",),
+    "game_type": ("game_type",),
+    "game_status": ("game_status",),
+    "board": MOVES_COLUMNS,
+    "moves": MOVES_COLUMNS,
+    "game_id": ("game_id",),
+    "created_at": ("created_at",),
+    "created_by": ("created_by",),
+    "result": (),
+}
+
+
+def participation_page(query, user_id: str, offset: int, limit: int, cursor: str | None = None,
+                       result: str | None = None, opponent_id: str | None = None, game_type: str | None = None,
+                       since: datetime | None = None, until: datetime | None = None):
+    """
+    Restrict a query on game_participation to a page of the games of a user, newest first.
+
+    Every filter has an index that starts with user_id and the filtered column and
+    continues with created_at, so a page is a range scan also with a date range.
+    Postgres picks the most selective index, usually opponent_id, and applies the
+    other filters to its included columns.
     """
-    Get all games for the current user.
+    query = query.filter(GameParticipation.user_id == user_id)
+    if result is not None:
+        query = query.filter(GameParticipation.result == result)
+    if opponent_id is not None:
+        query = query.filter(GameParticipation.opponent_id == opponent_id)
+    if game_type is not None:
+        query = query.filter(GameParticipation.game_type == game_type)
+    if since is not None:
+        query = query.filter(GameParticipation.created_at >= since)
+    if until is not None:
+        query = query.filter(GameParticipation.created_at < until)
+    if cursor is not None:
+        created_at, game_id = decode_cursor(cursor)
+        query = query.filter(
+            tuple_(GameParticipation.created_at, GameParticipation.game_id) < tuple_(created_at, game_id))
+    return query.order_by(
+        GameParticipation.created_at.desc(), GameParticipation.game_id.desc()).offset(offset).limit(limit)
+
+
+async def get_games(db_session: AsyncSession, user_id: str, offset: int, limit: int,
+                    cursor: str | None = None, result: str | None = None,
+                    fields: set[str] | None = None, **filters) -> list[tuple[GameHistory, str]]:
+    """
+    Get the games of the current user with their result for the user, newest first.
+
+    With a cursor, the page starts after the game the cursor points to.
+    The page is an index range scan over the participations of the user,
+    also when filtering, see participation_page for the filters. With fields,
+    only the columns of those fields of GameDTO are read, the other attributes
+    raise when accessed.
     """
-    games = await db_session.execute(
-        select(GameHistory).filter(
-            (GameHistory.player_x_id == user_id) | (GameHistory.player_o_id == user_id)
-        ).offset(offset).limit(limit)
+    # Joining on created_at as well lets Postgres probe only the partition of each game
+    query = select(GameHistory, GameParticipation.result).join(
+        GameParticipation, (GameParticipation.game_id == GameHistory.game_id)
+        & (GameParticipation.created_at == GameHistory.created_at)
     )
-    return games.scalars().all()
+    if fields is not None:
+        columns = {column for field in fields for column in GAME_FIELD_COLUMNS[field]}
+        query = query.options(load_only(*(getattr(GameHistory, column) for column in columns), raiseload=True))
+
+    with DB_QUERY_LATENCY.labels(query="get_games").time():
+        games = await db_session.execute(
+            participation_page(query, user_id, offset, limit, cursor, result, **filters))
+    return games.all()
+
+
+async def get_game_summaries(db_session: AsyncSession, user_id: str, offset: int, limit: int,
+                             cursor: str | None = None, result: str | None = None,
+                             **filters) -> list[GameParticipation]:
+    """
+    Get the opponent, result and date of the games of the current user, newest first.
+
+    Read from the participations of the user alone, an index only scan that
+    doesn't touch game_history. Unlike get_games it also lists the games of
+    archived partitions, their participations are kept.
+    """
+    with DB_QUERY_LATENCY.labels(query="get_game_summaries").time():
+        summaries = await db_session.execute(
+            participation_page(select(GameParticipation), user_id, offset, limit, cursor, result, **filters))
+    return summaries.scalars().all()
+
+
+async def get_head_to_head(db_session: AsyncSession, user_id: str, opponent_id: str,
+                           game_type: str | None = None):
+    """
+    Results of a user against one opponent, optionally in one game type.
+
+    Counted from the user_id, opponent_id index alone, without visiting any game.
+    """
+    query = select(
+        func.count().label("games"),
+        func.count().filter(GameParticipation.result == "win").label("wins"),
+        func.count().filter(GameParticipation.result == "loss").label("losses"),
+        func.count().filter(GameParticipation.result == "draw").label("draws"),
+        func.max(GameParticipation.created_at).label("last_played_at"),
+    ).filter(GameParticipation.user_id == user_id, GameParticipation.opponent_id == opponent_id)
+    if game_type is not None:
+        query = query.filter(GameParticipation.game_type == game_type)
+
+    with DB_QUERY_LATENCY.labels(query="get_head_to_head").time():
+        head_to_head = await db_session.execute(query)
+    return head_to_head.one()
+
+
+async def stream_games(db_session: AsyncSession, since: datetime | None = None, until: datetime | None = None,
+                       game_type: str | None = None, chunk_size: int = 1000) -> AsyncIterator[list[GameHistory]]:
+    """
+    Stream the games created in [since, until), oldest first, chunk_size games at a time.
+
+    The games are read through a server-side cursor, the next chunk is only
+    fetched when the caller asks for it, so memory is bounded by one chunk.
+    """
+    query = select(GameHistory).order_by(GameHistory.created_at, GameHistory.id)
+    if since is not None:
+        query = query.filter(GameHistory.created_at >= since)
+    if until is not None:
+        query = query.filter(GameHistory.created_at < until)
+    if game_type is not None:
+        query = query.filter(GameHistory.game_type == game_type)
+
+    result = await db_session.stream(query.execution_options(yield_per=chunk_size))
+    async for games in result.scalars().partitions():
+        yield games
 
 
 async def get_game_by_id(db_session: AsyncSession, game_id: str) -> GameHistory:
     """
     Get a game by its ID.
     """
-    game = await db_session.execute(
-        select(GameHistory).filter(GameHistory.game_id == game_id)
-    )
+    with DB_QUERY_LATENCY.labels(query="get_game_by_id").time():
+        game = await db_session.execute(
+            select(GameHistory).filter(GameHistory.game_id == game_id)
+        )
     return game.scalars().first()
 
-async def create_game_history(db_session: AsyncSession, game_data: dict) -> GameHistory:
+def game_moves_values(game_data: dict) -> dict:
     """
-    Create a new game history entry.
+    Board and moves of a completed game, packed if possible, see app/packing.py.
     """
-    try:
-        game_history = GameHistory(
-            game_id=game_data["id"],
-            player_x_id=game_data["players"]["x"],
-            player_o_id=game_data["players"]["o"],
-            winner=game_data["winner"],
-            game_type=game_data["type"],
-            game_status=game_data["status"],
-            board=game_data["board"],
-            moves=game_data["moves"],
-            created_at=datetime.fromisoformat(game_data["created_at"]),
-            created_by=game_data["created_by"]
+    packed = try_pack_moves(game_data["board"], game_data["moves"], game_data["players"])
+    if packed is None:
+        return {"board_json": game_data["board"], "moves_json": game_data["moves"], "moves_packed": None}
+    return {"board_json": None, "moves_json": None, "moves_packed": packed}
+
+
+def game_history_values(game_data: dict) -> dict:
+    """
+    Map a completed game from the completed_games stream to the columns of game_history.
+    """
+    return {
+        "game_id": game_data["id"],
+        "player_x_id": game_data["players"]["x"],
+        "player_o_id": game_data["players"]["o"],
+        "winner": game_data["winner"],
+        "game_type": game_data["type"],
+        "game_status": game_data["status"],
+        **game_moves_values(game_data),
+        "created_at": datetime.fromisoformat(game_data["created_at"]),
+        "created_by": game_data["created_by"],
+    }
+
+
+def game_result(winner: str, symbol: str) -> str:
+    if winner == "draw":
+        return "draw"
+    return "win" if winner == symbol else "loss"
+
+
+def participation_values(game_data: dict) -> list[dict]:
+    """
+    Map a completed game to one game_participation row per player, the bot gets none.
+    """
+    players = game_data["players"]
+    values = []
+    for symbol, opponent_symbol in (("x", "o"), ("o", "x")):
+        user_id = players[symbol]
+        # A user playing against themselves gets a single row
+        if user_id == BOT_USER_ID or (symbol == "o" and user_id == players["x"]):
+            continue
+        values.append({
+            "user_id": user_id,
+            "game_id": game_data["id"],
+            "opponent_id": players[opponent_symbol],
+            "symbol": symbol,
+            "result": game_result(game_data["winner"], symbol),
+            "game_type": game_data["type"],
+            "created_at": datetime.fromisoformat(game_data["created_at"]),
+        })
+    return values
+
+
+def user_stats_rounds(participations: list[dict]) -> list[list[dict]]:
+    """
+    Turn participations into user_stats rows for one game each, oldest first.
+
+    Every game of a user counts for its game type and for ALL_GAME_TYPES. A single
+    upsert can change a row only once, so the rows are split into rounds in which
+    each (user_id, game_type) appears at most once, applied one after the other.
+    """
+    rounds: list[list[dict]] = []
+    seen: dict[tuple[str, str], int] = {}
+    for participation in sorted(participations, key=lambda p: (p["created_at"], str(p["game_id"]))):
+        result = participation["result"]
+        for game_type in (participation["game_type"], ALL_GAME_TYPES):
+            key = (participation["user_id"], game_type)
+            index = seen.get(key, 0)
+            seen[key] = index + 1
+            if index == len(rounds):
+                rounds.append([])
+            rounds[index].append({
+                "user_id": participation["user_id"],
+                "game_type": game_type,
+                "games": 1,
+                "wins": int(result == "win"),
+                "losses": int(result == "loss"),
+                "draws": int(result == "draw"),
+                "current_streak": int(result == "win"),
+                "best_streak": int(result == "win"),
+                "last_played_at": participation["created_at"],
+            })
+    # Lock the rows in the same order in every transaction
+    return [sorted(rows, key=lambda row: (row["user_id"], row["game_type"])) for rows in rounds]
+
+
+async def update_user_stats(db_session: AsyncSession, participations: list[dict]):
+    """Add newly stored participations to the statistics of their users"""
+    for rows in user_stats_rounds(participations):
+        statement = insert(UserStats).values(rows)
+        current_streak = case(
+            (statement.excluded.wins == 1, UserStats.current_streak + 1), else_=0)
+        await db_session.execute(statement.on_conflict_do_update(
+            index_elements=[UserStats.user_id, UserStats.game_type],
+            set_={
+                "games": UserStats.games + statement.excluded.games,
+                "wins": UserStats.wins + statement.excluded.wins,
+                "losses": UserStats.losses + statement.excluded.losses,
+                "draws": UserStats.draws + statement.excluded.draws,
+                "current_streak": current_streak,
+                "best_streak": func.greatest(UserStats.best_streak, current_streak),
+                "last_played_at": func.greatest(UserStats.last_played_at, statement.excluded.last_played_at),
+            },
+        ))
+
+
+# Recomputes user_stats from game_participation. Wins in a row form islands of equal
+# (game number - win number), the current streak is the island ending at the last game.
+REBUILD_USER_STATS_SQL = f"""
+WITH participations AS (
+    SELECT user_id, game_type, result, created_at, game_id FROM game_participation
+    UNION ALL
+    SELECT user_id, '{ALL_GAME_TYPES}', result, created_at, game_id FROM game_participation
+), numbered AS (
+    SELECT user_id, game_type, result, created_at,
+           row_number() OVER games AS game_number,
+           row_number() OVER games - row_number() OVER (
+               PARTITION BY user_id, game_type, result ORDER BY created_at, game_id
+           ) AS island
+    FROM participations
+    WINDOW games AS (PARTITION BY user_id, game_type ORDER BY created_at, game_id)
+), streaks AS (
+    SELECT user_id, game_type, count(*) AS length, max(game_number) AS last_game_number
+    FROM numbered
+    WHERE result = 'win'
+    GROUP BY user_id, game_type, island
+), totals AS (
+    SELECT user_id, game_type,
+           count(*) AS games,
+           count(*) FILTER (WHERE result = 'win') AS wins,
+           count(*) FILTER (WHERE result = 'loss') AS losses,
+           count(*) FILTER (WHERE result = 'draw') AS draws,
+           max(game_number) AS last_game_number,
+           max(created_at) AS last_played_at
+    FROM numbered
+    GROUP BY user_id, game_type
+)
+INSERT INTO user_stats (user_id, game_type, games, wins, losses, draws,
+                        current_streak, best_streak, last_played_at)
+SELECT totals.user_id, totals.game_type, totals.games, totals.wins, totals.losses, totals.draws,
+       coalesce(max(streaks.length) FILTER (WHERE streaks.last_game_number = totals.last_game_number), 0),
+       coalesce(max(streaks.length), 0),
+       totals.last_played_at
+FROM totals
+LEFT JOIN streaks USING (user_id, game_type)
+GROUP BY totals.user_id, totals.game_type, totals.games, totals.wins, totals.losses,
+         totals.draws, totals.last_played_at
+ON CONFLICT (user_id, game_type) DO UPDATE SET
+    games = excluded.games,
+    wins = excluded.wins,
+    losses = excluded.losses,
+    draws = excluded.draws,
+    current_streak = excluded.current_streak,
+    best_streak = excluded.best_streak,
+    last_played_at = excluded.last_played_at
+"""
+
+
+async def rebuild_user_stats(db_session: AsyncSession) -> int:
+    """
+    Recompute the statistics of all users from their stored games.
+
+    The table is locked against concurrent updates by the consumer, whose
+    games are then applied on top of the rebuilt statistics.
+    """
+    await db_session.execute(text("LOCK TABLE user_stats IN EXCLUSIVE MODE"))
+    result = await db_session.execute(text(REBUILD_USER_STATS_SQL))
+    await db_session.commit()
+    return result.rowcount
+
+
+async def get_user_stats(db_session: AsyncSession, user_id: str) -> list[UserStats]:
+    """
+    Get the statistics of a user for all game types, a primary key range scan.
+    """
+    with DB_QUERY_LATENCY.labels(query="get_user_stats").time():
+        stats = await db_session.execute(
+            select(UserStats).filter(UserStats.user_id == user_id)
+        )
+    return stats.scalars().all()
+
+
+async def get_game_analytics(db_session: AsyncSession, game_type: str) -> tuple[GameAnalytics | None, list[GameOpening]]:
+    """
+    Get the stored analytics of a game type and its openings, most common first.
+    """
+    with DB_QUERY_LATENCY.labels(query="get_game_analytics").time():
+        analytics = await db_session.get(GameAnalytics, game_type)
+        openings = await db_session.execute(
+            select(GameOpening).filter(GameOpening.game_type == game_type)
+            .order_by(GameOpening.games.desc(), GameOpening.opening)
         )
-        logger.info(f"Creating game history in db: {game_history}")
-        db_session.add(game_history)
-        await db_session.commit()
-        await db_session.refresh(game_history)
-        return game_history
+    return analytics, openings.scalars().all()
+
+
+async def create_game_histories(db_session: AsyncSession, games_data: list[dict]) -> list[UUID]:
+    """
+    Store a batch of completed games with a single multi-row INSERT in one transaction.
+
+    The participation rows and statistics of the players are updated in the same transaction.
+    Games that are already stored are skipped, so redelivered entries are harmless,
+    also when a game appears twice in one batch. Returns the IDs of the games that
+    were actually inserted.
+    """
+    if not games_data:
+        return []
+
+    # A game published twice, or redelivered next to the original, would count twice in user_stats
+    unique_games = {}
+    for game_data in games_data:
+        unique_games.setdefault(str(game_data["id"]), game_data)
+    games_data = list(unique_games.values())
+
+    try:
+        with DB_QUERY_LATENCY.labels(query="create_game_histories").time():
+            result = await db_session.execute(
+                insert(GameHistory)
+                .values([game_history_values(game_data) for game_data in games_data])
+                .on_conflict_do_nothing(index_elements=[GameHistory.game_id, GameHistory.created_at])
+                .returning(GameHistory.game_id)
+            )
+            inserted = result.scalars().all()
+
+            inserted_ids = {str(game_id) for game_id in inserted}
+            participations = [
+                values
+                for game_data in games_data if str(game_data["id"]) in inserted_ids
+                for values in participation_values(game_data)
+            ]
+            if participations:
+                await db_session.execute(
+                    insert(GameParticipation).values(participations).on_conflict_do_nothing())
+                await update_user_stats(db_session, participations)
+            await db_session.commit()
+        logger.info(f"Created {len(inserted)} game history entries in db, "
+                    f"skipped {len(games_data) - len(inserted)} already stored")
+        return inserted
     except Exception as e:
-        logger.error(f"Error creating game history: {e}")
+        logger.error(f"Error creating game histories: {e}")
         await db_session.rollback()
-        raise e
\ No newline at end of file
+        raise e
@@ -1,27 +1,140 @@
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import (
     AsyncConnection,
+    AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+import asyncio
 import contextlib
-from typing import AsyncIterator
+import itertools
+from typing import AsyncIterator, Sequence
 from app.core.config import settings
+from app.core.logger import get_logger
+from app.core.metrics import DB_READ_SESSIONS, DB_REPLICA_LAG
+
+logger = get_logger(__name__)
+
+# Whether the host is a replica, whether it streams WAL from the primary and the seconds it is
+# behind, 0 if it replayed everything it received and NULL if it has not replayed a transaction yet.
+# The status of the WAL receiver is only visible with pg_read_all_stats, without it a running
+# receiver counts as streaming.
+REPLICA_STATE_SQL = text(
+    """
+    SELECT pg_is_in_recovery(),
+        EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE coalesce(status, 'streaming') = 'streaming'),
+        CASE
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+        END
+    """
+)
 
 
 class DatabaseSessionManager:
-    def __init__(self, host: str):
-        self._engine = create_async_engine(host, pool_pre_ping=True)
+    """
+    Sessions on the primary for writes, and on replicas for reads that may be slightly stale.
+
+    Instead of pinging every connection on checkout, a background task checks each
+    database every DB_HEALTH_CHECK_INTERVAL seconds, see start_health_checks. A database
+    that fails the check has its idle connections dropped. A replica that fails it, does
+    not stream WAL from the primary, lags more than max_replica_lag seconds or was promoted
+    gets no reads until it passes again. Without healthy replicas reads go to the primary.
+
+    Every replica host has to be a single instance, not a service balancing over several,
+    the lag measured on one connection has to hold for all connections of its pool.
+    """
+
+    def __init__(self, host: str, replica_hosts: Sequence[str] = (), pool_size: int = 5, max_overflow: int = 5,
+                 max_replica_lag: float = settings.REPLICA_MAX_LAG_SECONDS):
+        def engine(url: str) -> AsyncEngine:
+            return create_async_engine(url, pool_size=pool_size, max_overflow=max_overflow,
+                                       pool_recycle=settings.DB_POOL_RECYCLE)
+
+        self._engine = engine(host)
         self._sessionmaker = async_sessionmaker(
             self._engine, expire_on_commit=False)
+        self._replica_engines = [engine(replica_host) for replica_host in replica_hosts]
+        self._replica_sessionmakers = [
+            async_sessionmaker(replica_engine, expire_on_commit=False) for replica_engine in self._replica_engines]
+        # Indexes of the replicas that passed the last check, none until the first check
+        self._healthy_replicas: list[int] = []
+        self._next_replica = itertools.count()
+        self._max_replica_lag = max_replica_lag
+        self._health_checks: asyncio.Task | None = None
 
     async def close(self):
         if self._engine is None:
             raise Exception("DatabaseSessionManager is not initialized")
+        if self._health_checks is not None:
+            self._health_checks.cancel()
+            self._health_checks = None
         await self._engine.dispose()
+        for replica_engine in self._replica_engines:
+            await replica_engine.dispose()
 
         self._engine = None
         self._sessionmaker = None
+        self._replica_engines = []
+        self._replica_sessionmakers = []
+        self._healthy_replicas = []
+
+    def start_health_checks(self, interval: float = settings.DB_HEALTH_CHECK_INTERVAL):
+        """Check the databases in the background until close(), call from a running event loop"""
+        if self._health_checks is None:
+            self._health_checks = asyncio.create_task(self._run_health_checks(interval))
+
+    async def _run_health_checks(self, interval: float):
+        while True:
+            try:
+                await self.check_health()
+            except Exception as e:
+                # The replicas are not known to be healthy anymore, read from the primary until the next check
+                logger.error(f"Database health check failed: {e}")
+                self._healthy_replicas = []
+            await asyncio.sleep(interval)
+
+    async def check_health(self):
+        """Check the primary and whether every replica streams and how far it lags"""
+        try:
+            async with self._engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+        except Exception as e:
+            logger.warning(f"Primary database check failed: {e}")
+            await self._engine.dispose()
+
+        healthy = []
+        for i, replica_engine in enumerate(self._replica_engines):
+            replica = replica_engine.url.host
+            try:
+                async with replica_engine.connect() as connection:
+                    in_recovery, streaming, lag = (await connection.execute(REPLICA_STATE_SQL)).one()
+            except Exception as e:
+                logger.warning(f"Replica {replica} check failed: {e}")
+                await replica_engine.dispose()
+                continue
+
+            problem = None
+            if not in_recovery:
+                problem = "is not a replica"
+            elif not streaming:
+                # Without a WAL receiver it replayed everything it received, but that can be arbitrarily old
+                problem = "does not stream WAL from the primary"
+            elif lag is None:
+                problem = "has not replayed any transaction yet"
+            else:
+                lag = float(lag)
+                DB_REPLICA_LAG.labels(replica=replica).set(lag)
+                if lag > self._max_replica_lag:
+                    problem = f"lags {lag:.1f}s behind"
+            if problem is None:
+                healthy.append(i)
+            elif i in self._healthy_replicas:
+                logger.warning(f"Replica {replica} {problem}, reading from other databases")
+        for i in set(healthy) - set(self._healthy_replicas):
+            logger.info(f"Reading from replica {self._replica_engines[i].url.host}")
+        self._healthy_replicas = healthy
 
     @contextlib.asynccontextmanager
     async def connect(self) -> AsyncIterator[AsyncConnection]:
@@ -36,11 +149,11 @@ class DatabaseSessionManager:
                 raise
 
     @contextlib.asynccontextmanager
-    async def session(self) -> AsyncIterator[AsyncSession]:
+    async def session(self, sessionmaker: async_sessionmaker | None = None) -> AsyncIterator[AsyncSession]:
         if self._sessionmaker is None:
             raise Exception("DatabaseSessionManager is not initialized")
 
-        session = self._sessionmaker()
+        session = (sessionmaker or self._sessionmaker)()
         try:
             yield session
         except Exception:
@@ -49,10 +162,34 @@ class DatabaseSessionManager:
         finally:
             await session.close()
 
+    @contextlib.asynccontextmanager
+    async def read_session(self) -> AsyncIterator[AsyncSession]:
+        """A session on a healthy replica in turn, or on the primary if there is none"""
+        healthy = self._healthy_replicas
+        if healthy:
+            replica = healthy[next(self._next_replica) % len(healthy)]
+            DB_READ_SESSIONS.labels(target="replica").inc()
+            async with self.session(self._replica_sessionmakers[replica]) as session:
+                yield session
+        else:
+            DB_READ_SESSIONS.labels(target="primary").inc()
+            async with self.session() as session:
+                yield session
+
 
-sessionmanager = DatabaseSessionManager(str(settings.DATABASE_URI))
+sessionmanager = DatabaseSessionManager(
+    str(settings.DATABASE_URI),
+    replica_hosts=[str(uri) for uri in settings.REPLICA_DATABASE_URIS],
+    pool_size=settings.DB_API_POOL_SIZE,
+    max_overflow=settings.DB_API_MAX_OVERFLOW,
+)
 
 
 async def get_db_session():
     async with sessionmanager.session() as session:
         yield session
+
+
+async def get_read_db_session():
+    async with sessionmanager.read_session() as session:
+        yield session
@@ -0,0 +1,62 @@
+import csv
+import datetime
+import io
+import json
+from typing import AsyncIterator
+
+from app.core.config import settings
+from app.core.datetimes import to_naive_utc
+from app.core.logger import get_logger
+from app.crud import stream_games
+from app.db import sessionmanager
+from app.models import GameHistory
+from app.schemes import GameDTO
+
+logger = get_logger(__name__)
+
+CSV_COLUMNS = ["id", "game_id", "player_x_id", "player_o_id", "winner", "game_type", "game_status",
+               "board", "moves", "created_at", "created_by"]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def ndjson_chunk(games: list[GameHistory]) -> bytes:
+    return b"".join(
+        GameDTO.model_validate(game).model_dump_json(exclude={"result"}).encode() + b"\n" for game in games
+    )
+
+
+def csv_chunk(games: list[GameHistory], header: bool) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    for game in games:
+        writer.writerow([
+            game.id, game.game_id, game.player_x_id, game.player_o_id, game.winner, game.game_type,
+            game.game_status, json.dumps(game.board), json.dumps(game.moves),
+            game.created_at.isoformat(), game.created_by,
+        ])
+    return out.getvalue().encode()
+
+
+async def export_games(format: str, since: datetime.datetime | None, until: datetime.datetime | None,
+                       game_type: str | None) -> AsyncIterator[bytes]:
+    """
+    Body of an export, one encoded chunk of games at a time.
+
+    The response is sent while the games are read. The server only pulls the next
+    chunk once the previous one was written to the client, so a slow client slows
+    down the cursor instead of filling up memory. The session is opened here and not
+    taken from a dependency, dependencies are closed before a streamed body is sent.
+    """
+    count = 0
+    if format == "csv":
+        # Header also for empty exports
+        yield csv_chunk([], header=True)
+    async with sessionmanager.read_session() as session:
+        async for games in stream_games(session, to_naive_utc(since), to_naive_utc(until), game_type,
+                                        settings.EXPORT_CHUNK_SIZE):
+            yield ndjson_chunk(games) if format == "ndjson" else csv_chunk(games, header=False)
+            count += len(games)
+    logger.info(f"Exported {count} games as {format}")
@@ -0,0 +1,222 @@
+import datetime
+import json
+from uuid import UUID
+
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.logger import get_logger
+from app.models import GameParticipation
+
+logger = get_logger(__name__)
+
+# Points a player gets for the result of a game
+POINTS = {"win": 3, "draw": 1, "loss": 0}
+
+# Windows stay readable for a while after they ended
+DAILY_TTL = 2 * 24 * 3600
+WEEKLY_TTL = 14 * 24 * 3600
+
+# Set while rebuild runs, the games recorded meanwhile are kept in REBUILD_PENDING_KEY
+REBUILDING_KEY = "leaderboard:rebuilding"
+REBUILD_PENDING_KEY = "leaderboard:rebuild:pending"
+REBUILD_TIMEOUT = 3600
+
+# Adds the points of one game (ARGV[1]) to the all-time, daily and weekly sets (KEYS[2..4]),
+# unless the game is in the set of recorded games of its day (KEYS[1]). ARGV[2] and ARGV[3]
+# are the TTLs of the daily and weekly sets, followed by user ID and points pairs.
+RECORD_GAME_SCRIPT = """
+if redis.call('SADD', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+local scores = {}
+for i = 4, #ARGV, 2 do
+    for key = 2, 4 do
+        redis.call('ZINCRBY', KEYS[key], ARGV[i + 1], ARGV[i])
+    end
+    table.insert(scores, {ARGV[i], tonumber(ARGV[i + 1])})
+end
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+redis.call('EXPIRE', KEYS[4], ARGV[3])
+if redis.call('EXISTS', KEYS[5]) == 1 then
+    redis.call('RPUSH', KEYS[6], cjson.encode({game_id = ARGV[1], keys = {KEYS[2], KEYS[3], KEYS[4]}, scores = scores}))
+    redis.call('EXPIRE', KEYS[6], redis.call('TTL', KEYS[5]))
+end
+return 1
+"""
+
+
+def window_key(window: str, day: datetime.date) -> str:
+    if window == "daily":
+        return f"leaderboard:daily:{day.isoformat()}"
+    if window == "weekly":
+        year, week, _ = day.isocalendar()
+        return f"leaderboard:weekly:{year}-W{week:02d}"
+    return "leaderboard:all"
+
+
+def recorded_key(day: datetime.date) -> str:
+    """IDs of the games created on day whose points were added, kept as long as the weekly window"""
+    return f"leaderboard:recorded:{day.isoformat()}"
+
+
+def current_key(window: str) -> str:
+    # The game service stamps games with the container clock, which is UTC
+    return window_key(window, datetime.datetime.now(datetime.timezone.utc).date())
+
+
+def record_games(pipe, participations: list[dict]):
+    """
+    Queue the score updates for stored participations on a Redis pipeline.
+
+    Only pass the participations of games that were just inserted. The sets of
+    recorded games expire with the weekly sets, they only keep a rebuild from
+    counting a game twice, not a game recorded again weeks later. Every
+    player is added to the sorted sets, also with zero points, so everyone who
+    played has a rank.
+    """
+    games = {}
+    for participation in participations:
+        games.setdefault(str(participation["game_id"]), []).append(participation)
+    for game_id, game_participations in games.items():
+        day = game_participations[0]["created_at"].date()
+        scores = [value for participation in game_participations
+                  for value in (participation["user_id"], POINTS[participation["result"]])]
+        pipe.eval(RECORD_GAME_SCRIPT, 6, recorded_key(day), window_key("all", day), window_key("daily", day),
+                  window_key("weekly", day), REBUILDING_KEY, REBUILD_PENDING_KEY,
+                  game_id, DAILY_TTL, WEEKLY_TTL, *scores)
+
+
+def to_entries(members: list[tuple[str, float]], first_rank: int) -> list[dict]:
+    return [
+        {"rank": first_rank + i, "user_id": user_id, "score": int(score)}
+        for i, (user_id, score) in enumerate(members)
+    ]
+
+
+async def get_top(redis_client, window: str, limit: int) -> list[dict]:
+    """The best `limit` players of the window, O(log n + limit)"""
+    members = await redis_client.zrevrange(current_key(window), 0, limit - 1, withscores=True)
+    return to_entries(members, 1)
+
+
+async def get_position(redis_client, window: str, user_id: str, neighbors: int) -> tuple[dict | None, list[dict]]:
+    """
+    The entry of the user and the players ranked right above and below, O(log n + neighbors).
+
+    The entry is None if the user has not played in the window.
+    """
+    key = current_key(window)
+    rank = await redis_client.zrevrank(key, user_id)
+    if rank is None:
+        return None, []
+
+    start = max(0, rank - neighbors)
+    members = await redis_client.zrevrange(key, start, rank + neighbors, withscores=True)
+    entries = to_entries(members, start + 1)
+    entry = next(entry for entry in entries if entry["user_id"] == user_id)
+    return entry, entries
+
+
+async def rebuild(redis_client, db_session: AsyncSession, chunk_size: int = 1000) -> dict[str, int]:
+    """
+    Regenerate the all-time set and the live daily and weekly sets from the stored games.
+
+    Each set is built under a temporary key, and all of them are renamed over the
+    old ones at once, so readers never see a partial leaderboard. The sets are
+    read from one snapshot of the database. Games recorded while the rebuild runs
+    are kept aside and added to the new sets unless the snapshot has them, and the
+    games of the snapshot are marked as recorded, so no points are lost or counted
+    twice. Returns the number of players per key.
+    """
+    if not await redis_client.set(REBUILDING_KEY, 1, nx=True, ex=REBUILD_TIMEOUT):
+        raise RuntimeError("The leaderboards are already being rebuilt")
+    try:
+        # The snapshot is taken by the first query, after REBUILDING_KEY is set
+        await db_session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        return await rebuild_snapshot(redis_client, db_session, chunk_size)
+    except BaseException:
+        await redis_client.delete(REBUILDING_KEY, REBUILD_PENDING_KEY)
+        raise
+
+
+async def rebuild_snapshot(redis_client, db_session: AsyncSession, chunk_size: int) -> dict[str, int]:
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    day = datetime.timedelta(days=1)
+    week = datetime.timedelta(days=7)
+    monday = today - datetime.timedelta(days=today.weekday())
+    # (key, first day, length, ttl) of the current and the previous windows
+    windows = [
+        (window_key("all", today), None, None, None),
+        (window_key("daily", today), today, day, DAILY_TTL),
+        (window_key("daily", today - day), today - day, day, DAILY_TTL),
+        (window_key("weekly", monday), monday, week, WEEKLY_TTL),
+        (window_key("weekly", monday - week), monday - week, week, WEEKLY_TTL),
+    ]
+
+    points = func.sum(case(POINTS, value=GameParticipation.result, else_=0))
+    players = {}
+    for key, since, length, ttl in windows:
+        query = select(GameParticipation.user_id, points).group_by(GameParticipation.user_id)
+        if since is not None:
+            query = query.filter(GameParticipation.created_at >= since,
+                                 GameParticipation.created_at < since + length)
+
+        temporary_key = f"{key}:rebuild"
+        await redis_client.delete(temporary_key)
+        result = await db_session.stream(query.execution_options(yield_per=chunk_size))
+        count = 0
+        async for rows in result.partitions():
+            await redis_client.zadd(temporary_key, {user_id: score for user_id, score in rows})
+            count += len(rows)
+        players[key] = count
+
+    # Games of the snapshot that are recorded after the swap must not add their points again
+    marked_since = today - datetime.timedelta(seconds=WEEKLY_TTL)
+    query = (select(GameParticipation.game_id, GameParticipation.created_at).distinct()
+             .filter(GameParticipation.created_at >= marked_since))
+    result = await db_session.stream(query.execution_options(yield_per=chunk_size))
+    async for rows in result.partitions():
+        pipe = redis_client.pipeline(transaction=False)
+        for game_id, created_at in rows:
+            pipe.sadd(recorded_key(created_at.date()), str(game_id))
+        for recorded in {recorded_key(created_at.date()) for _, created_at in rows}:
+            pipe.expire(recorded, WEEKLY_TTL)
+        await pipe.execute()
+
+    pipe = redis_client.pipeline(transaction=True)
+    for key, _, _, ttl in windows:
+        if players[key]:
+            pipe.rename(f"{key}:rebuild", key)
+            if ttl is not None:
+                pipe.expire(key, ttl)
+        else:
+            pipe.delete(key)
+    pipe.delete(REBUILDING_KEY)
+    pipe.lrange(REBUILD_PENDING_KEY, 0, -1)
+    pipe.delete(REBUILD_PENDING_KEY)
+    pending = [json.loads(entry) for entry in (await pipe.execute())[-2]]
+
+    # The games recorded during the rebuild went to the old sets, add those the snapshot misses again
+    if pending:
+        in_snapshot = set(await db_session.scalars(
+            select(GameParticipation.game_id).distinct()
+            .filter(GameParticipation.game_id.in_([UUID(game["game_id"]) for game in pending]))))
+        ttls = {key: ttl for key, _, _, ttl in windows}
+        pending = [game for game in pending if UUID(game["game_id"]) not in in_snapshot]
+        pipe = redis_client.pipeline(transaction=False)
+        for game in pending:
+            for key in game["keys"]:
+                if key not in ttls:
+                    continue
+                for user_id, score in game["scores"]:
+                    pipe.zincrby(key, score, user_id)
+                if ttls[key] is not None:
+                    pipe.expire(key, ttls[key])
+        await pipe.execute()
+
+    for key, count in players.items():
+        logger.info(f"Rebuilt {key} with {count} players")
+    logger.info(f"Added {len(pending)} games recorded during the rebuild and missing from the snapshot")
+    return players
@@ -1,14 +1,35 @@
-from fastapi import Depends, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+import datetime
+import json
+from typing import Literal
+from uuid import UUID
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
+from app.core.datetimes import to_naive_utc
+from app.core.etag import make_etag, match_etag, not_modified
 from app.core.logger import get_logger
+from app.core.loop_monitor import LoopMonitor
+from app.core.metrics import PrometheusMiddleware, metrics_response
+from app.core.tracing import setup_tracing
 from app.db import sessionmanager
 from contextlib import asynccontextmanager
-from app.deps import DBSessionDep
-from app.crud import get_games
-import app.consumer
+from app.deps import DBSessionDep, ReadDBSessionDep
+from app.crud import (ALL_GAME_TYPES, encode_cursor, game_result, get_game_analytics, get_game_by_id, get_game_summaries,
+                       get_games, get_head_to_head, get_user_stats)
+from app.core.redis_client import get_redis_client
+from app import leaderboard
+from app.cache import HistoryCache, params_digest
+from app.export import MEDIA_TYPES, export_games
+from app.recent import (get_recent_games, merge_recent_games, parse_recent_games, recent_game_matches,
+                        recent_game_summary)
 
-from app.schemes import GameDTO, GamesDTO
+from app.schemes import (GameAnalyticsDTO, GameDTO, GamesDTO, GameStatsDTO, GameSummariesDTO, GameSummaryDTO,
+                         HeadToHeadDTO, LeaderboardDTO, LeaderboardPositionDTO, OpeningDTO, StatsDTO, parse_fields)
+
+redis_client = get_redis_client()
+history_cache = HistoryCache(redis_client)
 
 
 @asynccontextmanager
@@ -16,7 +37,13 @@ async def lifespan(app: FastAPI):
     """
     Function that handles startup and shutdown events.
     """
+    loop_monitor = LoopMonitor("api")
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    sessionmanager.start_health_checks()
     yield
+    loop_monitor.stop()
+    await redis_client.aclose()
     if sessionmanager._engine is not None:
         # Close the DB connection
         await sessionmanager.close()
@@ -26,6 +53,7 @@ app = FastAPI(lifespan=lifespan,
               title=settings.PROJECT_NAME,
               root_path="/history-service"
               )
+setup_tracing(app)
 
 logger = get_logger(__name__)
 
@@ -44,7 +72,7 @@ class AuthenticationMiddleware:
 
         request = Request(scope, receive)
 
-        if request.url.path in ["/history-service/docs", "/history-service/openapi.json", "/history-service/health"]:
+        if request.url.path in ["/history-service/docs", "/history-service/openapi.json", "/history-service/health", "/history-service/metrics"]:
             return await self.app(scope, receive, send)
 
         # Extract the cookie
@@ -92,44 +120,234 @@ async def get_current_user(request: Request):
     return request.state.user
 
 
-@app.get("/games", response_model=GamesDTO)
+@app.get("/games", response_model=GamesDTO | GameSummariesDTO)
 async def get_games_history(
         db: DBSessionDep,
         offset: int = 0,
         limit: int = 10,
+        cursor: str | None = None,
+        result: Literal["win", "loss", "draw"] | None = None,
+        opponent_id: str | None = None,
+        game_type: str | None = None,
+        since: datetime.datetime | None = None,
+        until: datetime.datetime | None = None,
+        view: Literal["full", "summary"] = "full",
+        fields: str | None = None,
+        if_none_match: str | None = Header(None),
         user=Depends(get_current_user)):
     """
-    Get all games for the current user.
+    Get the games of the current user, newest first.
+
+    Filter by result, opponent, game type and creation time in [since, until), each
+    filter is served from an index on the games of the user, also combined. Pass the next_cursor of the response as cursor to get the next page.
+    Pages are served from the cache until the user finishes another game.
+    The first page also lists the games the user just finished that are not stored yet.
+
+    view=summary only returns the opponent, result, game type and date of each game,
+    read from an index without touching the stored games. fields is a comma separated
+    list of the fields to return, game_id and created_at are always returned, and only
+    the columns they need are read. Get a whole game from /games/{game_id}.
+
+    The ETag changes with the version of the history of the user. With a current
+    ETag in If-None-Match the response is 304, only the version is read.
     """
-    games = await get_games(db, user["id"], offset, limit)
+    try:
+        selected = parse_fields(GameSummaryDTO if view == "summary" else GameDTO, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = {"result": result, "opponent_id": opponent_id, "game_type": game_type,
+               "since": to_naive_utc(since), "until": to_naive_utc(until)}
+    params = {"offset": offset, "limit": limit, "cursor": cursor, **filters, "view": view,
+              "fields": ",".join(sorted(selected)) if selected else None}
+    digest = params_digest({**params, "user_id": user["id"]})
+    known_etag, known_version = match_etag(if_none_match, digest)
+    body, version, recent = await history_cache.get(user["id"], params, known_version)
+    if version is not None and version == known_version:
+        return not_modified(known_etag)
+    headers = {"ETag": make_etag(version, digest), "Cache-Control": "private, no-cache"} if version else {}
+
+    recent_games = parse_recent_games(recent) if offset == 0 and cursor is None else []
+    if body is not None:
+        if recent_games:
+            return with_recent_games(body, headers, recent_games, limit, filters, view, selected, user["id"])
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    # Read from the primary, a lagging replica would cache a stale page under the current version
+    try:
+        if view == "summary":
+            games = await get_game_summaries(db, user["id"], offset, limit, cursor, **filters)
+        else:
+            games = await get_games(db, user["id"], offset, limit, cursor, fields=selected, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not games and not recent_games:
+        raise HTTPException(status_code=404, detail="No games found")
+
+    if view == "summary":
+        page = GameSummariesDTO(games=[GameSummaryDTO.model_validate(summary) for summary in games])
+        last_game = games[-1] if games else None
+    else:
+        # Convert SQLAlchemy models to Pydantic models, the result is computed at ingestion
+        game_dtos = []
+
+        for game, outcome in games:
+            if selected is None:
+                game_dto = GameDTO.model_validate(game)
+            else:
+                # Only the selected columns were read
+                game_dto = GameDTO.model_construct(
+                    **{field: getattr(game, field) for field in selected if field != "result"})
+            game_dto.result = outcome
+            game_dtos.append(game_dto)
+
+        # Return wrapped in GamesDTO
+        page = GamesDTO(games=game_dtos)
+        last_game = games[-1][0] if games else None
+    page.next_cursor = encode_cursor(last_game) if len(games) == limit else None
+    body = page.model_dump_json(
+        include={"games": {"__all__": selected}, "next_cursor": True} if selected else None).encode()
+    if games:
+        await history_cache.set(user["id"], version, params, body)
+    return with_recent_games(body, headers, recent_games, limit, filters, view, selected, user["id"])
+
+
+def with_recent_games(body: bytes, headers: dict, recent_games: list[GameDTO], limit: int, filters: dict,
+                      view: str, selected: set[str] | None, user_id: str) -> Response:
+    """The first page with the games the user just finished merged in, see app/recent.py"""
+    if not recent_games:
+        return Response(content=body, media_type="application/json", headers=headers)
+    page = json.loads(body)
+    recent = [
+        (recent_game_summary(game, user_id) if view == "summary" else game).model_dump(mode="json", include=selected)
+        for game in recent_games if recent_game_matches(game, user_id, **filters)
+    ]
+    games = merge_recent_games(page["games"], recent, limit)
     if not games:
         raise HTTPException(status_code=404, detail="No games found")
+    if games is not page["games"]:
+        # Not cached, the recent games leave the page once they are stored
+        body = json.dumps({**page, "games": games}, separators=(",", ":")).encode()
+    return Response(content=body, media_type="application/json", headers=headers)
 
-    # Convert SQLAlchemy models to Pydantic models
-    game_dtos = []
 
-    for game in games:
-        game_dto = GameDTO.model_validate(game)
+@app.get("/games/{game_id}", response_model=GameDTO)
+async def get_game(game_id: UUID, db: ReadDBSessionDep, user=Depends(get_current_user)):
+    """
+    Get a game of the current user with its board and all moves.
 
-        if game.winner == "draw":
-            game_dto.result = "draw"
-        elif game.winner == "x" and game.player_x_id == user["id"]:
-            game_dto.result = "win"
-        elif game.winner == "o" and game.player_o_id == user["id"]:
-            game_dto.result = "win"
-        else:
-            game_dto.result = "loss"
+    A game the user just finished is returned from its summary until it is stored.
+    """
+    game = await get_game_by_id(db, game_id)
+    if game is None:
+        for recent_game in await get_recent_games(redis_client, user["id"]):
+            if str(recent_game.game_id) == str(game_id):
+                return recent_game
+    if game is None or user["id"] not in (game.player_x_id, game.player_o_id):
+        raise HTTPException(status_code=404, detail="Game not found")
+
+    game_dto = GameDTO.model_validate(game)
+    game_dto.result = game_result(game.winner, "x" if game.player_x_id == user["id"] else "o")
+    return game_dto
+
+
+@app.get("/stats", response_model=StatsDTO)
+async def get_stats(db: ReadDBSessionDep, user=Depends(get_current_user)):
+    """
+    Get the win/loss/draw counts and streaks of the current user, in total and per game type.
+    """
+    stats = {row.game_type: GameStatsDTO.model_validate(row) for row in await get_user_stats(db, user["id"])}
+    return StatsDTO(
+        user_id=user["id"],
+        total=stats.pop(ALL_GAME_TYPES, GameStatsDTO()),
+        by_game_type=stats,
+    )
+
+
+@app.get("/head-to-head/{opponent_id}", response_model=HeadToHeadDTO)
+async def get_head_to_head_stats(
+        opponent_id: str,
+        db: ReadDBSessionDep,
+        game_type: str | None = None,
+        user=Depends(get_current_user)):
+    """
+    Get the wins, losses and draws of the current user against an opponent, optionally in one game type.
+
+    List the games themselves with /games?opponent_id=...
+    """
+    head_to_head = await get_head_to_head(db, user["id"], opponent_id, game_type)
+    return HeadToHeadDTO(user_id=user["id"], opponent_id=opponent_id, game_type=game_type,
+                         **head_to_head._mapping)
+
+
+@app.get("/analytics", response_model=GameAnalyticsDTO)
+async def get_analytics(db: ReadDBSessionDep, game_type: str = ALL_GAME_TYPES):
+    """
+    Get the first-move results, openings, cell heatmaps and game lengths of a game type, or of all games.
+
+    Computed in batch by python -m app.analytics, see computed_at.
+    """
+    analytics, openings = await get_game_analytics(db, game_type)
+    if analytics is None:
+        raise HTTPException(status_code=404, detail="No analytics for this game type")
+    analytics_dto = GameAnalyticsDTO.model_validate(analytics)
+    analytics_dto.openings = [OpeningDTO.model_validate(opening) for opening in openings]
+    return analytics_dto
+
+
+@app.get("/export")
+async def export_history(
+        format: Literal["ndjson", "csv"] = "ndjson",
+        since: datetime.datetime | None = None,
+        until: datetime.datetime | None = None,
+        game_type: str | None = None,
+        user=Depends(get_current_user)):
+    """
+    Stream all games created in [since, until), optionally of one game type, oldest first.
 
-        game_dtos.append(game_dto)
+    For analysts, only superusers may export. Memory use does not depend on the number of games.
+    """
+    if not user.get("is_superuser"):
+        raise HTTPException(status_code=403, detail="Only superusers can export the game history")
 
-    # Return wrapped in GamesDTO
-    return GamesDTO(games=game_dtos)
+    return StreamingResponse(
+        export_games(format, since, until, game_type),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="games.{format}"'},
+    )
+
+
+@app.get("/leaderboard", response_model=LeaderboardDTO)
+async def get_leaderboard(
+        window: Literal["all", "daily", "weekly"] = "all",
+        limit: int = Query(10, ge=1, le=100)):
+    """
+    Get the best players of all time, of today or of this week.
+    """
+    entries = await leaderboard.get_top(redis_client, window, limit)
+    return LeaderboardDTO(window=window, entries=entries)
+
+
+@app.get("/leaderboard/me", response_model=LeaderboardPositionDTO)
+async def get_leaderboard_position(
+        window: Literal["all", "daily", "weekly"] = "all",
+        neighbors: int = Query(2, ge=0, le=25),
+        user=Depends(get_current_user)):
+    """
+    Get the rank of the current user and the players ranked right above and below.
+    """
+    entry, entries = await leaderboard.get_position(redis_client, window, user["id"], neighbors)
+    return LeaderboardPositionDTO(window=window, entry=entry, neighbors=entries)
 
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
 allowed_origins = [
     settings.CORS_URL,
 ]
@@ -141,3 +359,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"]
 )
+
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    compresslevel=settings.GZIP_COMPRESSLEVEL,
+    brotli_quality=settings.BROTLI_QUALITY,
+)
+
+app.add_middleware(PrometheusMiddleware)
@@ -20,6 +20,15 @@ config.set_main_option("sqlalchemy.url", str(settings.DATABASE_URI))
 target_metadata = Base.metadata
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    """Skip the partitions of game_history, they are managed by app/partitions.py"""
+    if type_ == "table" and reflected and compare_to is None:
+        return not name.startswith(f"{GameHistory.__tablename__}_")
+    if type_ == "index" and reflected and compare_to is None:
+        return not object.table.name.startswith(f"{GameHistory.__tablename__}_")
+    return True
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -36,6 +45,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -45,7 +55,7 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object)
 
     with context.begin_transaction():
         context.run_migrations()
@@ -0,0 +1,41 @@
+"""covering participation indexes
+
+Revision ID: 7d3283db4a1a
+Revises: d40a1d1603e9
+Create Date: 2026-10-19 13:13:14.428884
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d3283db4a1a'
+down_revision: Union[str, None] = 'd40a1d1603e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Alembic does not compare included columns, the indexes are replaced by hand
+    op.drop_index('ix_game_participation_user_id_created_at', table_name='game_participation')
+    op.drop_index('ix_game_participation_user_id_result_created_at', table_name='game_participation')
+    op.create_index('ix_game_participation_user_id_created_at', 'game_participation',
+                    ['user_id', 'created_at', 'game_id'], unique=False,
+                    postgresql_include=['opponent_id', 'symbol', 'result', 'game_type'])
+    op.create_index('ix_game_participation_user_id_result_created_at', 'game_participation',
+                    ['user_id', 'result', 'created_at', 'game_id'], unique=False,
+                    postgresql_include=['opponent_id', 'symbol', 'game_type'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_game_participation_user_id_result_created_at', table_name='game_participation')
+    op.drop_index('ix_game_participation_user_id_created_at', table_name='game_participation')
+    op.create_index('ix_game_participation_user_id_created_at', 'game_participation',
+                    ['user_id', 'created_at', 'game_id'], unique=False)
+    op.create_index('ix_game_participation_user_id_result_created_at', 'game_participation',
+                    ['user_id', 'result', 'created_at', 'game_id'], unique=False)
@@ -0,0 +1,248 @@
+"""packed moves
+
+Revision ID: 8e70e25eab75
+Revises: 8b1012961a1a
+Create Date: 2026-10-19 14:31:05.927114
+
+"""
+import datetime
+import struct
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e70e25eab75'
+down_revision: Union[str, None] = '8b1012961a1a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+# Version 1 of the packed layout as in app/packing.py when this migration was written,
+# copied so later changes to the app don't change what this migration does
+VERSION = 1
+FLAG_BOARD = 0x01
+FLAG_WIDE_DELTAS = 0x02
+
+NO_POSITION = 0x0F
+SYMBOL_O = 0x10
+EXPLICIT_PLAYER = 0x20
+ACTION_SHIFT = 6
+
+SYMBOLS = ("x", "o")
+ACTIONS = (None, "disconnect", "disconnect_timeout", "creator_abandoned")
+CELLS = ("", "x", "o")
+MAX_DELTA = 2 ** 32 - 1
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def derive_board(moves: list[dict]) -> list[str]:
+    board = [""] * 9
+    for move in moves:
+        if move["position"] is not None:
+            board[move["position"]] = move["symbol"]
+    return board
+
+
+def pack_moves(board: list[str], moves: list[dict], players: dict[str, str]) -> bytes:
+    """Encode board and moves, players maps the symbols to the player IDs of the game"""
+    if len(moves) > 255:
+        raise ValueError(f"Can't pack {len(moves)} moves")
+    flags = 0
+    codes = bytearray()
+    explicit_players = bytearray()
+    timestamps = []
+    for move in moves:
+        keys = ["player", "symbol", "position", "timestamp"]
+        if "action" in move:
+            keys.insert(3, "action")
+        if list(move) != keys or move["symbol"] not in SYMBOLS or move.get("action") not in ACTIONS:
+            raise ValueError(f"Can't pack move {move}")
+        position = move["position"]
+        if position is not None and not (type(position) is int and 0 <= position < 9):
+            raise ValueError(f"Can't pack position {position}")
+
+        code = NO_POSITION if position is None else position
+        if move["symbol"] == "o":
+            code |= SYMBOL_O
+        if move["player"] != players[move["symbol"]]:
+            code |= EXPLICIT_PLAYER
+            player = move["player"].encode()
+            explicit_players.append(len(player))
+            explicit_players += player
+        if "action" in move:
+            # An explicit None action can't be told apart from a missing one
+            if move["action"] is None:
+                raise ValueError(f"Can't pack move {move}")
+            code |= ACTIONS.index(move["action"]) << ACTION_SHIFT
+        codes.append(code)
+
+        timestamp = datetime.datetime.fromisoformat(move["timestamp"])
+        if timestamp.tzinfo is not None or timestamp.isoformat() != move["timestamp"]:
+            raise ValueError(f"Can't pack timestamp {move['timestamp']}")
+        timestamps.append((timestamp - EPOCH) // MICROSECOND)
+
+    out = bytearray()
+    if timestamps:
+        deltas = [b - a for a, b in zip(timestamps, timestamps[1:])]
+        if any(not 0 <= delta <= MAX_DELTA for delta in deltas):
+            flags |= FLAG_WIDE_DELTAS
+        out += struct.pack(f"<q{len(moves)}s{len(deltas)}{'q' if flags & FLAG_WIDE_DELTAS else 'I'}",
+                           timestamps[0], codes, *deltas)
+    out += explicit_players
+
+    if board != derive_board(moves):
+        if len(board) != 9 or any(cell not in CELLS for cell in board):
+            raise ValueError(f"Can't pack board {board}")
+        flags |= FLAG_BOARD
+        cells = 0
+        for i, cell in enumerate(board):
+            cells |= CELLS.index(cell) << (2 * i)
+        out += cells.to_bytes(3, "little")
+    return bytes((VERSION, flags, len(moves))) + out
+
+
+def unpack_moves(data: bytes, players: dict[str, str]) -> tuple[list[str], list[dict]]:
+    """Decode what pack_moves encoded, returns board and moves"""
+    version, flags, count = data[0], data[1], data[2]
+    if version != VERSION:
+        raise ValueError(f"Unknown packed moves version {version}")
+
+    moves = []
+    offset = 3
+    if count:
+        delta_format = "q" if flags & FLAG_WIDE_DELTAS else "I"
+        first, codes, *deltas = struct.unpack_from(f"<q{count}s{count - 1}{delta_format}", data, offset)
+        offset += 8 + count + (count - 1) * (8 if flags & FLAG_WIDE_DELTAS else 4)
+
+        timestamp = EPOCH + first * MICROSECOND
+        deltas.insert(0, 0)
+        for code, delta in zip(codes, deltas):
+            timestamp += delta * MICROSECOND
+            symbol = SYMBOLS[(code & SYMBOL_O) >> 4]
+            if code & EXPLICIT_PLAYER:
+                length = data[offset]
+                player = data[offset + 1:offset + 1 + length].decode()
+                offset += 1 + length
+            else:
+                player = players[symbol]
+            position = code & NO_POSITION
+            if code >> ACTION_SHIFT:
+                moves.append({
+                    "player": player,
+                    "symbol": symbol,
+                    "position": None if position == NO_POSITION else position,
+                    "action": ACTIONS[code >> ACTION_SHIFT],
+                    "timestamp": timestamp.isoformat(),
+                })
+            else:
+                moves.append({
+                    "player": player,
+                    "symbol": symbol,
+                    "position": None if position == NO_POSITION else position,
+                    "timestamp": timestamp.isoformat(),
+                })
+
+    if flags & FLAG_BOARD:
+        cells = int.from_bytes(data[offset:offset + 3], "little")
+        board = [CELLS[(cells >> (2 * i)) & 0x03] for i in range(9)]
+    else:
+        board = derive_board(moves)
+    return board, moves
+
+
+def try_pack_moves(board: list[str], moves: list[dict], players: dict[str, str]) -> bytes | None:
+    """pack_moves, or None if the game has to stay in the JSON columns"""
+    try:
+        packed = pack_moves(board, moves, players)
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+    # Guard against anything the checks above missed
+    if unpack_moves(packed, players) != (board, moves):
+        return None
+    return packed
+
+
+game_history = sa.table(
+    'game_history',
+    sa.column('id', sa.Uuid()),
+    sa.column('created_at', sa.DateTime()),
+    sa.column('player_x_id', sa.String()),
+    sa.column('player_o_id', sa.String()),
+    sa.column('board', sa.JSON()),
+    sa.column('moves', sa.JSON()),
+    sa.column('moves_packed', sa.LargeBinary()),
+)
+by_key = (game_history.c.id == sa.bindparam('b_id')) & (game_history.c.created_at == sa.bindparam('b_created_at'))
+
+
+def batches(condition):
+    """Rows matching the condition in primary key order, BATCH_SIZE at a time"""
+    connection = op.get_bind()
+    last = None
+    while True:
+        query = sa.select(game_history).where(condition)
+        if last is not None:
+            query = query.where(sa.tuple_(game_history.c.created_at, game_history.c.id) > last)
+        rows = connection.execute(
+            query.order_by(game_history.c.created_at, game_history.c.id).limit(BATCH_SIZE)).all()
+        if not rows:
+            return
+        yield connection, rows
+        last = (rows[-1].created_at, rows[-1].id)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.add_column('game_history', sa.Column('moves_packed', sa.LargeBinary(), nullable=True))
+    op.alter_column('game_history', 'board',
+               existing_type=sa.JSON(),
+               nullable=True)
+    op.alter_column('game_history', 'moves',
+               existing_type=sa.JSON(),
+               nullable=True)
+    # ### end Alembic commands ###
+
+    # Pack the stored games, the ones that can't be packed keep their JSON
+    for connection, rows in batches(game_history.c.moves_packed.is_(None)):
+        packed = []
+        for row in rows:
+            moves_packed = try_pack_moves(row.board, row.moves, {"x": row.player_x_id, "o": row.player_o_id})
+            if moves_packed is not None:
+                packed.append({"b_id": row.id, "b_created_at": row.created_at, "b_packed": moves_packed})
+        if packed:
+            connection.execute(
+                game_history.update().where(by_key)
+                .values(board=sa.null(), moves=sa.null(), moves_packed=sa.bindparam('b_packed')),
+                packed,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for connection, rows in batches(game_history.c.moves_packed.is_not(None)):
+        unpacked = []
+        for row in rows:
+            board, moves = unpack_moves(row.moves_packed, {"x": row.player_x_id, "o": row.player_o_id})
+            unpacked.append({"b_id": row.id, "b_created_at": row.created_at, "b_board": board, "b_moves": moves})
+        connection.execute(
+            game_history.update().where(by_key)
+            .values(board=sa.bindparam('b_board'), moves=sa.bindparam('b_moves'), moves_packed=sa.null()),
+            unpacked,
+        )
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.alter_column('game_history', 'moves',
+               existing_type=sa.JSON(),
+               nullable=False)
+    op.alter_column('game_history', 'board',
+               existing_type=sa.JSON(),
+               nullable=False)
+    op.drop_column('game_history', 'moves_packed')
+    # ### end Alembic commands ###
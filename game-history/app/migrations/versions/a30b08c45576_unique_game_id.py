@@ -0,0 +1,44 @@
+"""unique game_id
+
+Revision ID: a30b08c45576
+Revises: 620578a48060
+Create Date: 2026-10-19 10:12:41.503112
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a30b08c45576'
+down_revision: Union[str, None] = '620578a48060'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Redelivered stream entries may have stored the same game more than once,
+    # keep the earliest row of every game before enforcing uniqueness
+    op.execute(
+        """
+        DELETE FROM game_history
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY game_id ORDER BY created_at, id
+                ) AS rn
+                FROM game_history
+            ) ranked
+            WHERE rn > 1
+        )
+        """
+    )
+    op.create_index(op.f('ix_game_history_game_id'), 'game_history', ['game_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_game_history_game_id'), table_name='game_history')
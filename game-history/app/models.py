@@ -1,9 +1,12 @@
 import datetime
+import functools
 from typing import List
 from uuid import UUID, uuid4
 
 from sqlalchemy.orm import Mapped, mapped_column, DeclarativeBase
-from sqlalchemy import JSON
+from sqlalchemy import JSON, Index, LargeBinary
+
+from app.packing import unpack_moves
 
 class Base(DeclarativeBase):
     ...
@@ -11,6 +14,13 @@ class Base(DeclarativeBase):
 class GameHistory(Base):
     """
     Game history model for the Tic Tac Toe game."
+
+    Partitioned by month of created_at, see app/partitions.py. Keys of a
+    partitioned table have to contain the partition key, so created_at is
+    part of the primary key and of the unique game_id index.
+
+    Board and moves are stored packed in moves_packed, see app/packing.py.
+    Games that can't be packed keep them in the JSON columns.
     """
     __tablename__ = "game_history"
 
@@ -20,10 +30,117 @@ class GameHistory(Base):
     player_o_id: Mapped[str]
     winner: Mapped[str] # id or draw
     game_type: Mapped[str]
-    board: Mapped[List[str]] = mapped_column(JSON)
-    moves: Mapped[List[dict]] = mapped_column(JSON)
+    board_json: Mapped[List[str] | None] = mapped_column("board", JSON(none_as_null=True))
+    moves_json: Mapped[List[dict] | None] = mapped_column("moves", JSON(none_as_null=True))
+    moves_packed: Mapped[bytes | None] = mapped_column(LargeBinary)
     game_id: Mapped[UUID]
     game_status: Mapped[str]
-    created_at: Mapped[datetime.datetime]
+    created_at: Mapped[datetime.datetime] = mapped_column(primary_key=True)
     created_by: Mapped[str]
 
+    __table_args__ = (
+        Index("ix_game_history_game_id", "game_id", "created_at", unique=True),
+        Index("ix_game_history_created_at", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    @functools.cached_property
+    def unpacked(self) -> tuple[List[str], List[dict]]:
+        if self.moves_packed is None:
+            return self.board_json, self.moves_json
+        return unpack_moves(self.moves_packed, {"x": self.player_x_id, "o": self.player_o_id})
+
+    @property
+    def board(self) -> List[str]:
+        return self.unpacked[0]
+
+    @property
+    def moves(self) -> List[dict]:
+        return self.unpacked[1]
+
+
+class GameParticipation(Base):
+    """
+    One row per player of a stored game, with the result from the player's point of view.
+
+    Written together with the game, so the history of a user is a single index range scan.
+    """
+    __tablename__ = "game_participation"
+
+    user_id: Mapped[str] = mapped_column(primary_key=True)
+    # No foreign key, archived partitions are detached from game_history
+    game_id: Mapped[UUID] = mapped_column(primary_key=True, index=True)
+    opponent_id: Mapped[str]
+    symbol: Mapped[str]
+    result: Mapped[str] # win, loss or draw
+    game_type: Mapped[str]
+    created_at: Mapped[datetime.datetime]
+
+    __table_args__ = (
+        # Serve the history of a user newest first, optionally filtered by result, see crud.get_games.
+        # The included columns let crud.get_game_summaries read the summaries from the index alone.
+        Index("ix_game_participation_user_id_created_at", "user_id", "created_at", "game_id",
+              postgresql_include=["opponent_id", "symbol", "result", "game_type"]),
+        Index("ix_game_participation_user_id_result_created_at", "user_id", "result", "created_at", "game_id",
+              postgresql_include=["opponent_id", "symbol", "game_type"]),
+        # Filters by opponent, which also serves head to head queries, and by game type, see crud.participation_page
+        Index("ix_game_participation_user_id_opponent_id_created_at", "user_id", "opponent_id", "created_at", "game_id",
+              postgresql_include=["symbol", "result", "game_type"]),
+        Index("ix_game_participation_user_id_game_type_created_at", "user_id", "game_type", "created_at", "game_id",
+              postgresql_include=["opponent_id", "symbol", "result"]),
+    )
+
+
+class UserStats(Base):
+    """
+    Results and win streaks of a user per game type, and over all game types as game_type "all".
+
+    Maintained incrementally when games are stored, see crud.update_user_stats.
+    """
+    __tablename__ = "user_stats"
+
+    user_id: Mapped[str] = mapped_column(primary_key=True)
+    game_type: Mapped[str] = mapped_column(primary_key=True)
+    games: Mapped[int]
+    wins: Mapped[int]
+    losses: Mapped[int]
+    draws: Mapped[int]
+    current_streak: Mapped[int]  # wins in a row up to the last game
+    best_streak: Mapped[int]
+    last_played_at: Mapped[datetime.datetime]
+
+
+
+class GameAnalytics(Base):
+    """
+    Aggregates over all completed games of a game type, and over all game types as game_type "all".
+
+    Recomputed in batch by python -m app.analytics.
+    """
+    __tablename__ = "game_analytics"
+
+    game_type: Mapped[str] = mapped_column(primary_key=True)
+    games: Mapped[int]
+    # Results from the point of view of the player who made the first move
+    first_mover_wins: Mapped[int]
+    first_mover_losses: Mapped[int]
+    draws: Mapped[int]
+    avg_moves: Mapped[float]
+    avg_duration_seconds: Mapped[float | None]
+    # Moves per board cell, index 0-8
+    heatmap_x: Mapped[List[int]] = mapped_column(JSON)
+    heatmap_o: Mapped[List[int]] = mapped_column(JSON)
+    computed_at: Mapped[datetime.datetime]
+
+
+class GameOpening(Base):
+    """
+    The most common first moves of a game type, see app/analytics.py.
+    """
+    __tablename__ = "game_opening"
+
+    game_type: Mapped[str] = mapped_column(primary_key=True)
+    opening: Mapped[str] = mapped_column(primary_key=True)  # positions of the first moves, e.g. "4-0-8"
+    games: Mapped[int]
+    first_mover_wins: Mapped[int]
+    draws: Mapped[int]
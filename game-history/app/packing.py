@@ -0,0 +1,201 @@
+"""
+Compact binary encoding of the moves and the board of a stored game.
+
+Layout, integers are little endian:
+
+    version             1 byte, currently 1
+    flags               1 byte
+                            bit 0  the board is stored explicitly
+                            bit 1  timestamp deltas are 8 bytes wide
+    move count          1 byte
+    first timestamp     8 bytes, microseconds since 1970-01-01, only if there are moves
+    moves               1 byte per move
+                            bits 0-3  position 0-8, 15 for None
+                            bit 4     symbol, 0 for x and 1 for o
+                            bit 5     the player is stored explicitly
+                            bits 6-7  action, see ACTIONS
+    timestamp deltas    microseconds since the previous move for every move after the first,
+                        unsigned 4 bytes, or signed 8 bytes if flag bit 1 is set
+    players             1 byte length and UTF-8 bytes, for every move with bit 5 set
+    board               3 bytes with 2 bits per cell, see CELLS, only if flag bit 0 is set
+
+Fixed width fields let unpack_moves read all timestamps with one struct call,
+4 byte deltas cover the 71 minutes a player can take at most per move.
+
+The player of a move is normally the player of its symbol, and the board
+follows from the moves, so both are only stored when they differ.
+pack_moves raises ValueError for games it can't encode losslessly, their
+moves stay in the JSON columns.
+"""
+import datetime
+import functools
+import itertools
+import struct
+
+VERSION = 1
+FLAG_BOARD = 0x01
+FLAG_WIDE_DELTAS = 0x02
+
+NO_POSITION = 0x0F
+SYMBOL_O = 0x10
+EXPLICIT_PLAYER = 0x20
+ACTION_SHIFT = 6
+
+SYMBOLS = ("x", "o")
+ACTIONS = (None, "disconnect", "disconnect_timeout", "creator_abandoned")
+CELLS = ("", "x", "o")
+MAX_DELTA = 2 ** 32 - 1
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+MICROS_PER_MINUTE = 60_000_000
+TWO_DIGITS = [f"{i:02d}" for i in range(60)]
+
+# Symbol, position and action of every move code, decoding looks them up instead of masking bits
+MOVE_CODES = [
+    (SYMBOLS[(code & SYMBOL_O) >> 4],
+     None if code & NO_POSITION == NO_POSITION else code & NO_POSITION,
+     ACTIONS[code >> ACTION_SHIFT])
+    for code in range(256)
+]
+
+
+@functools.lru_cache(maxsize=1024)
+def moves_struct(count: int, wide_deltas: bool) -> struct.Struct:
+    """First timestamp, move codes and timestamp deltas of count moves"""
+    return struct.Struct(f"<q{count}s{count - 1}{'q' if wide_deltas else 'I'}")
+
+
+@functools.lru_cache(maxsize=4096)
+def minute_prefix(minute: int) -> str:
+    """A minute since 1970-01-01 formatted like datetime.isoformat up to its seconds, e.g. 2026-10-19T12:34:"""
+    day, minute_of_day = divmod(minute, 24 * 60)
+    date = (EPOCH + datetime.timedelta(days=day)).date().isoformat()
+    return f"{date}T{TWO_DIGITS[minute_of_day // 60]}:{TWO_DIGITS[minute_of_day % 60]}:"
+
+
+def derive_board(moves: list[dict]) -> list[str]:
+    board = [""] * 9
+    for move in moves:
+        if move["position"] is not None:
+            board[move["position"]] = move["symbol"]
+    return board
+
+
+def pack_moves(board: list[str], moves: list[dict], players: dict[str, str]) -> bytes:
+    """Encode board and moves, players maps the symbols to the player IDs of the game"""
+    if len(moves) > 255:
+        raise ValueError(f"Can't pack {len(moves)} moves")
+    flags = 0
+    codes = bytearray()
+    explicit_players = bytearray()
+    timestamps = []
+    for move in moves:
+        keys = ["player", "symbol", "position", "timestamp"]
+        if "action" in move:
+            keys.insert(3, "action")
+        if list(move) != keys or move["symbol"] not in SYMBOLS or move.get("action") not in ACTIONS:
+            raise ValueError(f"Can't pack move {move}")
+        position = move["position"]
+        if position is not None and not (type(position) is int and 0 <= position < 9):
+            raise ValueError(f"Can't pack position {position}")
+
+        code = NO_POSITION if position is None else position
+        if move["symbol"] == "o":
+            code |= SYMBOL_O
+        if move["player"] != players[move["symbol"]]:
+            code |= EXPLICIT_PLAYER
+            player = move["player"].encode()
+            explicit_players.append(len(player))
+            explicit_players += player
+        if "action" in move:
+            # An explicit None action can't be told apart from a missing one
+            if move["action"] is None:
+                raise ValueError(f"Can't pack move {move}")
+            code |= ACTIONS.index(move["action"]) << ACTION_SHIFT
+        codes.append(code)
+
+        timestamp = datetime.datetime.fromisoformat(move["timestamp"])
+        if timestamp.tzinfo is not None or timestamp.isoformat() != move["timestamp"]:
+            raise ValueError(f"Can't pack timestamp {move['timestamp']}")
+        timestamps.append((timestamp - EPOCH) // MICROSECOND)
+
+    out = bytearray()
+    if timestamps:
+        deltas = [b - a for a, b in zip(timestamps, timestamps[1:])]
+        if any(not 0 <= delta <= MAX_DELTA for delta in deltas):
+            flags |= FLAG_WIDE_DELTAS
+        out += moves_struct(len(moves), bool(flags & FLAG_WIDE_DELTAS)).pack(timestamps[0], codes, *deltas)
+    out += explicit_players
+
+    if board != derive_board(moves):
+        if len(board) != 9 or any(cell not in CELLS for cell in board):
+            raise ValueError(f"Can't pack board {board}")
+        flags |= FLAG_BOARD
+        cells = 0
+        for i, cell in enumerate(board):
+            cells |= CELLS.index(cell) << (2 * i)
+        out += cells.to_bytes(3, "little")
+    return bytes((VERSION, flags, len(moves))) + out
+
+
+def unpack_moves(data: bytes, players: dict[str, str]) -> tuple[list[str], list[dict]]:
+    """Decode what pack_moves encoded, returns board and moves"""
+    version, flags, count = data[0], data[1], data[2]
+    if version != VERSION:
+        raise ValueError(f"Unknown packed moves version {version}")
+
+    moves = []
+    board = [""] * 9
+    offset = 3
+    if count:
+        layout = moves_struct(count, bool(flags & FLAG_WIDE_DELTAS))
+        first, codes, *deltas = layout.unpack_from(data, offset)
+        offset += layout.size
+
+        # Timestamps are formatted like datetime.isoformat from the cached date and time of
+        # their minute, building a datetime per move makes decoding slower than parsing JSON
+        minute_start = minute_end = 0
+        prefix = None
+        for code, micros in zip(codes, itertools.accumulate(deltas, initial=first)):
+            symbol, position, action = MOVE_CODES[code]
+            if code & EXPLICIT_PLAYER:
+                length = data[offset]
+                player = data[offset + 1:offset + 1 + length].decode()
+                offset += 1 + length
+            else:
+                player = players[symbol]
+
+            if not minute_start <= micros < minute_end:
+                minute = micros // MICROS_PER_MINUTE
+                minute_start = minute * MICROS_PER_MINUTE
+                minute_end = minute_start + MICROS_PER_MINUTE
+                prefix = minute_prefix(minute)
+            second = TWO_DIGITS[(micros - minute_start) // 1_000_000]
+            fraction = micros % 1_000_000
+            timestamp = f"{prefix}{second}.{str(1_000_000 + fraction)[1:]}" if fraction else prefix + second
+
+            if position is not None:
+                board[position] = symbol
+            if action is None:
+                moves.append({"player": player, "symbol": symbol, "position": position, "timestamp": timestamp})
+            else:
+                moves.append({"player": player, "symbol": symbol, "position": position, "action": action,
+                              "timestamp": timestamp})
+
+    if flags & FLAG_BOARD:
+        cells = int.from_bytes(data[offset:offset + 3], "little")
+        board = [CELLS[(cells >> (2 * i)) & 0x03] for i in range(9)]
+    return board, moves
+
+
+def try_pack_moves(board: list[str], moves: list[dict], players: dict[str, str]) -> bytes | None:
+    """pack_moves, or None if the game has to stay in the JSON columns"""
+    try:
+        packed = pack_moves(board, moves, players)
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+    # Guard against anything the checks above missed
+    if unpack_moves(packed, players) != (board, moves):
+        return None
+    return packed
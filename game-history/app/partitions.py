@@ -0,0 +1,219 @@
+"""
+Maintain the monthly partitions of game_history and archive old ones.
+
+    python -m app.partitions maintain [--ahead 3]
+        Create the partitions of the current and the next months. Rows that
+        ended up in the default partition for one of these months are moved.
+
+    python -m app.partitions archive --older-than 12 --output-dir /archive [--drop]
+        Export every partition that ended more than the given number of months
+        ago to a zstd-compressed Parquet file, then detach it from game_history.
+        With --drop the detached table is dropped as well.
+
+    python -m app.partitions list
+
+Run from the game-history directory.
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.db import DatabaseSessionManager
+
+logger = get_logger(__name__)
+
+TABLE = "game_history"
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+# game_history with the JSON and UUID columns as text, in the column order of the archive files
+EXPORT_COLUMNS = (
+    "id::text AS id, game_id::text AS game_id, player_x_id, player_o_id, winner, game_type, "
+    "game_status, board::text AS board, moves::text AS moves, moves_packed, created_at, created_by"
+)
+
+
+def month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+async def list_partitions(conn: AsyncConnection) -> list[tuple[str, datetime.date | None, datetime.date | None]]:
+    """(name, first day, first day after) of every partition, None bounds for the default partition"""
+    rows = await conn.execute(text(
+        """
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table
+        ORDER BY child.relname
+        """
+    ), {"table": TABLE})
+
+    partitions = []
+    for name, bound in rows:
+        match = BOUND_PATTERN.search(bound)
+        if match is None:
+            partitions.append((name, None, None))
+        else:
+            partitions.append((name, datetime.datetime.fromisoformat(match[1]).date(),
+                               datetime.datetime.fromisoformat(match[2]).date()))
+    return partitions
+
+
+async def ensure_partition(conn: AsyncConnection, month: datetime.date) -> bool:
+    """
+    Create the partition of a month, returns False if it already exists.
+
+    Rows of the month in the default partition would make CREATE TABLE ... PARTITION OF
+    fail, so the partition is created as a plain table, those rows are moved into it,
+    and then it is attached.
+    """
+    name = partition_name(month)
+    exists = await conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+    if exists:
+        return False
+
+    bounds = {"start": month, "end": add_months(month, 1)}
+    await conn.execute(text(f'CREATE TABLE "{name}" (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    moved = await conn.execute(text(
+        f"""
+        WITH moved AS (
+            DELETE FROM "{DEFAULT_PARTITION}"
+            WHERE created_at >= :start AND created_at < :end
+            RETURNING *
+        )
+        INSERT INTO "{name}" SELECT * FROM moved
+        """
+    ), bounds)
+    await conn.execute(text(
+        f"ALTER TABLE {TABLE} ATTACH PARTITION \"{name}\" "
+        f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+    ))
+    logger.info(f"Created partition {name}, moved {moved.rowcount} rows from {DEFAULT_PARTITION}")
+    return True
+
+
+async def maintain(sessionmanager: DatabaseSessionManager, ahead: int):
+    first = month_start(datetime.datetime.now(datetime.timezone.utc).date())
+    for i in range(ahead + 1):
+        # One transaction per partition, each only locks game_history briefly
+        async with sessionmanager.connect() as conn:
+            await ensure_partition(conn, add_months(first, i))
+
+
+# Layout of the archive files, JSON columns keep their text and moves_packed its bytes,
+# so the games can be loaded back unchanged
+def archive_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.string()),
+        ("game_id", pa.string()),
+        ("player_x_id", pa.string()),
+        ("player_o_id", pa.string()),
+        ("winner", pa.string()),
+        ("game_type", pa.string()),
+        ("game_status", pa.string()),
+        ("board", pa.string()),
+        ("moves", pa.string()),
+        ("moves_packed", pa.binary()),
+        ("created_at", pa.timestamp("us")),
+        ("created_by", pa.string()),
+    ])
+
+
+async def export_partition(conn: AsyncConnection, name: str, path: str, chunk_size: int) -> int:
+    """Stream a partition into a Parquet file one row group per chunk, returns the number of rows"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = archive_schema()
+    result = await conn.stream(text(f'SELECT {EXPORT_COLUMNS} FROM "{name}"').execution_options(yield_per=chunk_size))
+    count = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        async for rows in result.partitions():
+            columns = list(zip(*rows))
+            writer.write_batch(pa.record_batch(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            count += len(rows)
+    return count
+
+
+async def archive(sessionmanager: DatabaseSessionManager, older_than: int, output_dir: str,
+                  drop: bool, chunk_size: int = 5000):
+    import pyarrow.parquet as pq
+
+    cutoff = add_months(month_start(datetime.datetime.now(datetime.timezone.utc).date()), -older_than)
+    os.makedirs(output_dir, exist_ok=True)
+
+    async with sessionmanager.connect() as conn:
+        partitions = [
+            name for name, start, end in await list_partitions(conn)
+            if end is not None and end <= cutoff
+        ]
+
+    for name in partitions:
+        path = os.path.join(output_dir, f"{name}.parquet")
+        async with sessionmanager.connect() as conn:
+            expected = await conn.scalar(text(f'SELECT count(*) FROM "{name}"'))
+            written = await export_partition(conn, name, path, chunk_size)
+
+        if written != expected or pq.ParquetFile(path).metadata.num_rows != expected:
+            logger.error(f"Archive of {name} has {written} rows instead of {expected}, keeping the partition")
+            continue
+
+        async with sessionmanager.connect() as conn:
+            await conn.execute(text(f'ALTER TABLE {TABLE} DETACH PARTITION "{name}"'))
+            if drop:
+                await conn.execute(text(f'DROP TABLE "{name}"'))
+        logger.info(f"Archived {written} rows of {name} to {path}"
+                    f"{', dropped the partition' if drop else ', detached the partition'}")
+
+
+async def main(args):
+    sessionmanager = DatabaseSessionManager(str(settings.DATABASE_URI))
+    try:
+        if args.command == "maintain":
+            await maintain(sessionmanager, args.ahead)
+        elif args.command == "archive":
+            await archive(sessionmanager, args.older_than, args.output_dir, args.drop)
+        else:
+            async with sessionmanager.connect() as conn:
+                for name, start, end in await list_partitions(conn):
+                    rows = await conn.scalar(text(f'SELECT count(*) FROM "{name}"'))
+                    print(f"{name:<28}{str(start or 'default'):<12}{str(end or ''):<12}{rows:>10}")
+    finally:
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    maintain_parser = commands.add_parser("maintain")
+    maintain_parser.add_argument("--ahead", type=int, default=3, help="Months to create in advance")
+    archive_parser = commands.add_parser("archive")
+    archive_parser.add_argument("--older-than", type=int, default=12, help="Age in months of the partitions to archive")
+    archive_parser.add_argument("--output-dir", default=settings.ARCHIVE_DIR)
+    archive_parser.add_argument("--drop", action="store_true", help="Drop the partitions after detaching them")
+    commands.add_parser("list")
+    asyncio.run(main(parser.parse_args()))
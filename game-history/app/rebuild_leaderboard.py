@@ -0,0 +1,35 @@
+"""
+Regenerate the leaderboard sorted sets in Redis from the stored games.
+
+Use it after Redis lost its data, or when the leaderboards missed updates
+because Redis was unavailable while games were stored.
+
+Run from the game-history directory:
+
+    python -m app.rebuild_leaderboard
+"""
+import argparse
+import asyncio
+import json
+
+from app import leaderboard
+from app.core.config import settings
+from app.core.redis_client import get_redis_client
+from app.db import DatabaseSessionManager
+
+
+async def rebuild():
+    redis_client = get_redis_client()
+    sessionmanager = DatabaseSessionManager(str(settings.DATABASE_URI))
+    try:
+        async with sessionmanager.session() as db_session:
+            players = await leaderboard.rebuild(redis_client, db_session)
+        print(json.dumps(players))
+    finally:
+        await redis_client.aclose()
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+    asyncio.run(rebuild())
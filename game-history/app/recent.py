@@ -0,0 +1,106 @@
+"""
+Games that were finished but may not be stored yet.
+
+When a game ends, the game service pushes a summary of it for each player onto
+recent_games:{user_id}, trimmed to the newest few and expiring a few minutes
+later. The first history page merges them with the games from Postgres, so a
+player sees the game they just finished even while the consumer lags behind.
+Once the game is stored, it is deduplicated on game_id.
+
+The list is part of the history version the ETags are built from. Pushing a
+game bumps the version, and so does storing it. If the list expires before the
+consumer stored its games, or a game is dead-lettered and never stored, nothing
+writes, so the next history read notices the list is gone while the version is
+still the one it was seen at and bumps the version itself, see GET_PAGE_SCRIPT.
+A client holding an ETag with the expired games then gets the page without them
+rather than a 304. Trimming only happens on a push, which already bumps.
+"""
+import datetime
+import json
+
+import redis
+from pydantic import ValidationError
+
+from app.core.datetimes import to_naive_utc
+from app.core.logger import get_logger
+from app.schemes import GameDTO, GameSummaryDTO
+
+logger = get_logger(__name__)
+
+
+def recent_games_key(user_id: str) -> str:
+    # The user ID is a hash tag, the history cache reads the list together with other keys of the user
+    return f"recent_games:{{{user_id}}}"
+
+
+def parse_recent_games(entries: list[str]) -> list[GameDTO]:
+    games = []
+    for entry in entries:
+        try:
+            summary = json.loads(entry)
+            # The game is not stored yet, it has no row ID
+            games.append(GameDTO(id=summary["game_id"], **summary))
+        except (ValueError, KeyError, TypeError, ValidationError) as e:
+            logger.warning(f"Skipping invalid recent game {entry!r}: {e}")
+    return games
+
+
+async def get_recent_games(redis_client, user_id: str) -> list[GameDTO]:
+    try:
+        entries = await redis_client.lrange(recent_games_key(user_id), 0, -1)
+    except redis.RedisError as e:
+        logger.error(f"Error reading the recent games of {user_id}: {e}")
+        return []
+    return parse_recent_games(entries)
+
+
+def recent_game_summary(game: GameDTO, user_id: str) -> GameSummaryDTO:
+    """The summary of a recent game as get_game_summaries reads it"""
+    symbol = "x" if game.player_x_id == user_id else "o"
+    return GameSummaryDTO(
+        game_id=game.game_id,
+        opponent_id=game.player_o_id if symbol == "x" else game.player_x_id,
+        symbol=symbol,
+        result=game.result,
+        game_type=game.game_type,
+        created_at=game.created_at,
+    )
+
+
+def recent_game_matches(game: GameDTO, user_id: str, result: str | None = None, opponent_id: str | None = None,
+                        game_type: str | None = None, since: datetime.datetime | None = None,
+                        until: datetime.datetime | None = None) -> bool:
+    """Whether a recent game passes the filters of the history, as crud.participation_page applies them"""
+    opponent = game.player_o_id if game.player_x_id == user_id else game.player_x_id
+    created = to_naive_utc(game.created_at)
+    return ((result is None or game.result == result)
+            and (opponent_id is None or opponent == opponent_id)
+            and (game_type is None or game.game_type == game_type)
+            and (since is None or created >= since)
+            and (until is None or created < until))
+
+
+def merge_recent_games(games: list[dict], recent: list[dict], limit: int) -> list[dict]:
+    """
+    Add the recent games missing from the first page, keeping it ordered newest first.
+
+    Games are serialized as in the response, with at least game_id and created_at.
+    A full page only gets recent games created after its last game, older ones
+    belong on a later page and show up there once they are stored.
+    Returns games itself if nothing was added.
+    """
+    seen = {game["game_id"] for game in games}
+    cutoff = created_at(games[-1]) if games and len(games) >= limit else None
+    pending = []
+    for game in recent:
+        if game["game_id"] in seen or (cutoff is not None and created_at(game) < cutoff):
+            continue
+        seen.add(game["game_id"])
+        pending.append(game)
+    if not pending:
+        return games
+    return sorted(games + pending, key=created_at, reverse=True)
+
+
+def created_at(game: dict) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(game["created_at"])
@@ -0,0 +1,123 @@
+"""
+Re-ingest games from the completed_games dead-letter stream.
+
+Entries are read page by page and written to the database by several
+batches in parallel. Stored entries are removed from the dead-letter stream,
+the games that were not stored yet add their leaderboard points and the
+history versions of all players are bumped, like in the consumer.
+Entries that fail again are re-added with an incremented retry count, and
+entries that are still malformed are left untouched.
+
+Run from the game-history directory:
+
+    python -m app.replay --concurrency 8 --batch-size 100
+"""
+import argparse
+import asyncio
+import json
+
+from app.consumer import DEAD_LETTER_STREAM, parse_message, record_stored_games
+from app.core.redis_client import get_redis_client
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.crud import create_game_histories
+from app.db import DatabaseSessionManager
+
+logger = get_logger(__name__)
+
+
+async def replay_batch(redis_client, sessionmanager: DatabaseSessionManager,
+                       entries: list[tuple[str, dict]], totals: dict[str, int]):
+    games_data = []
+    entry_ids = []
+    for entry_id, fields in entries:
+        game_data = parse_message(entry_id, fields)
+        if game_data is None:
+            totals["malformed"] += 1
+            continue
+        games_data.append(game_data)
+        entry_ids.append(entry_id)
+
+    if not games_data:
+        return
+
+    try:
+        async with sessionmanager.session() as db_session:
+            inserted = await create_game_histories(db_session=db_session, games_data=games_data)
+    except Exception as e:
+        logger.error(f"Failed to replay {len(entry_ids)} entries: {e}")
+        # Move the entries to the end of the dead-letter stream with one more retry
+        pipe = redis_client.pipeline(transaction=False)
+        failed_ids = set(entry_ids)
+        for entry_id, fields in entries:
+            if entry_id in failed_ids:
+                pipe.xadd(DEAD_LETTER_STREAM, {**fields, "retries": int(fields.get("retries", 0)) + 1},
+                          maxlen=settings.DEAD_LETTER_MAXLEN, approximate=True)
+        pipe.xdel(DEAD_LETTER_STREAM, *entry_ids)
+        await pipe.execute()
+        totals["failed"] += len(entry_ids)
+        return
+
+    pipe = redis_client.pipeline(transaction=False)
+    record_stored_games(pipe, games_data, inserted)
+    pipe.xdel(DEAD_LETTER_STREAM, *entry_ids)
+    await pipe.execute()
+    totals["replayed"] += len(entry_ids)
+    totals["inserted"] += len(inserted)
+
+
+async def replay(concurrency: int, batch_size: int, limit: int | None):
+    redis_client = get_redis_client()
+    sessionmanager = DatabaseSessionManager(str(settings.DATABASE_URI))
+    totals = {"replayed": 0, "inserted": 0, "failed": 0, "malformed": 0}
+
+    # Only replay what is dead-lettered now, entries re-added on failure come after it
+    last = await redis_client.xrevrange(DEAD_LETTER_STREAM, count=1)
+    if not last:
+        print("Dead-letter stream is empty")
+        return
+    end_id = last[0][0]
+
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def run_batch(entries):
+        try:
+            await replay_batch(redis_client, sessionmanager, entries, totals)
+        except Exception as e:
+            logger.error(f"Error replaying batch: {e}")
+        finally:
+            semaphore.release()
+
+    try:
+        start_id = "-"
+        read = 0
+        while limit is None or read < limit:
+            count = batch_size if limit is None else min(batch_size, limit - read)
+            entries = await redis_client.xrange(DEAD_LETTER_STREAM, min=start_id, max=end_id, count=count)
+            if not entries:
+                break
+            read += len(entries)
+            start_id = f"({entries[-1][0]}"
+
+            # Bounds the batches in flight, and with them the entries held in memory
+            await semaphore.acquire()
+            task = asyncio.create_task(run_batch(entries))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        await asyncio.gather(*tasks)
+    finally:
+        await redis_client.aclose()
+        await sessionmanager.close()
+
+    print(json.dumps(totals))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=None, help="Replay at most this many entries")
+    args = parser.parse_args()
+    asyncio.run(replay(args.concurrency, args.batch_size, args.limit))
@@ -21,4 +21,117 @@ class GameDTO(BaseModel):
         from_attributes = True
 
 class GamesDTO(BaseModel):
-    games: list[GameDTO]
\ No newline at end of file
+    games: list[GameDTO]
+    # Pass as cursor to get the next page, None on the last page
+    next_cursor: str | None = None
+
+
+class GameSummaryDTO(BaseModel):
+    """A game in the history list, from the point of view of the user"""
+    game_id: UUID | str
+    opponent_id: str
+    symbol: str
+    result: str
+    game_type: str
+    created_at: datetime.datetime
+
+    class Config:
+        from_attributes = True
+
+
+class GameSummariesDTO(BaseModel):
+    games: list[GameSummaryDTO]
+    next_cursor: str | None = None
+
+
+# Fields every projection keeps, pages are ordered and deduplicated by them
+PROJECTION_KEY_FIELDS = {"game_id", "created_at"}
+
+
+def parse_fields(model: type[BaseModel], fields: str | None) -> set[str] | None:
+    """
+    Comma separated field names of model as a set, None for all fields.
+
+    Raises ValueError for unknown fields.
+    """
+    if not fields:
+        return None
+    selected = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = selected - model.model_fields.keys()
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return selected | PROJECTION_KEY_FIELDS
+
+
+class GameStatsDTO(BaseModel):
+    games: int = 0
+    wins: int = 0
+    losses: int = 0
+    draws: int = 0
+    current_streak: int = 0
+    best_streak: int = 0
+    last_played_at: datetime.datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class HeadToHeadDTO(BaseModel):
+    user_id: str
+    opponent_id: str
+    game_type: str | None = None
+    games: int = 0
+    wins: int = 0
+    losses: int = 0
+    draws: int = 0
+    last_played_at: datetime.datetime | None = None
+
+
+class LeaderboardEntryDTO(BaseModel):
+    rank: int
+    user_id: str
+    score: int
+
+
+class LeaderboardDTO(BaseModel):
+    window: str
+    entries: list[LeaderboardEntryDTO]
+
+
+class LeaderboardPositionDTO(BaseModel):
+    window: str
+    # None if the user has not played in the window
+    entry: LeaderboardEntryDTO | None
+    neighbors: list[LeaderboardEntryDTO]
+
+
+class StatsDTO(BaseModel):
+    user_id: str
+    total: GameStatsDTO
+    by_game_type: dict[str, GameStatsDTO]
+
+class OpeningDTO(BaseModel):
+    opening: str
+    games: int
+    first_mover_wins: int
+    draws: int
+
+    class Config:
+        from_attributes = True
+
+
+class GameAnalyticsDTO(BaseModel):
+    game_type: str
+    games: int
+    first_mover_wins: int
+    first_mover_losses: int
+    draws: int
+    avg_moves: float
+    avg_duration_seconds: float | None
+    heatmap_x: list[int]
+    heatmap_o: list[int]
+    computed_at: datetime.datetime
+    openings: list[OpeningDTO] = []
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,78 @@
+"""
+Ingestion worker of the game history service.
+
+Consumes the completed_games stream and stores the games in PostgreSQL,
+independently of the read API. Run with `python -m app.worker`.
+"""
+import asyncio
+import contextlib
+import signal
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from app import consumer
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.core.loop_monitor import LoopMonitor
+from app.core.metrics import metrics_response
+from app.core.tracing import setup_tracing
+
+logger = get_logger(__name__)
+
+health_app = FastAPI(title=f"{settings.PROJECT_NAME} history worker",
+                     docs_url=None, redoc_url=None, openapi_url=None)
+
+stopping = asyncio.Event()
+
+
+@health_app.get("/health")
+async def health_check():
+    if stopping.is_set():
+        return JSONResponse(status_code=503, content={"status": "stopping"})
+    if not consumer.is_healthy():
+        return JSONResponse(status_code=503, content={"status": "stalled"})
+    return {"status": "ok"}
+
+
+@health_app.get("/metrics")
+async def metrics():
+    return metrics_response()
+
+
+class HealthServer(uvicorn.Server):
+    """Serves the health and metrics endpoints, leaving signal handling to the worker"""
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+
+async def main():
+    setup_tracing()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    loop_monitor = LoopMonitor("consumer")
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+
+    server = HealthServer(uvicorn.Config(
+        health_app, host="0.0.0.0", port=settings.WORKER_PORT,
+        log_level="warning", access_log=False))
+    server_task = asyncio.create_task(server.serve())
+
+    try:
+        await consumer.process_redis_messages(stopping)
+    finally:
+        server.should_exit = True
+        await server_task
+        loop_monitor.stop()
+        logger.info("History worker shut down")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
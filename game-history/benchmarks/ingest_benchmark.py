@@ -0,0 +1,108 @@
+"""
+Ingestion benchmark for the game history write path.
+
+Inserts synthetic completed games into the configured database and reports
+rows per second for the previous one-row-per-transaction path and for the
+batched multi-row insert at various batch sizes. The inserted rows are
+deleted again afterwards.
+
+Run from the game-history directory:
+
+    python -m benchmarks.ingest_benchmark --rows 2000 --batch-sizes 1 10 50 100 500
+"""
+import argparse
+import asyncio
+import datetime
+import time
+import uuid
+
+from sqlalchemy import delete
+
+from app.core.config import settings
+from app.crud import create_game_histories, game_history_values
+from app.db import DatabaseSessionManager
+from app.models import GameHistory
+
+
+def make_game() -> dict:
+    """A completed game in the format of the completed_games stream"""
+    created_at = datetime.datetime.now()
+    positions = [4, 0, 8, 2, 1, 7, 6, 3, 5]
+    moves = [
+        {
+            "player": "player-x" if i % 2 == 0 else "player-o",
+            "symbol": "x" if i % 2 == 0 else "o",
+            "position": position,
+            "timestamp": (created_at + datetime.timedelta(seconds=i + 1)).isoformat(),
+        }
+        for i, position in enumerate(positions)
+    ]
+    board = [""] * 9
+    for move in moves:
+        board[move["position"]] = move["symbol"]
+    return {
+        "id": str(uuid.uuid4()),
+        "type": "multiplayer",
+        "status": "completed",
+        "board": board,
+        "players": {"x": "player-x", "o": "player-o"},
+        "winner": "draw",
+        "created_at": created_at.isoformat(),
+        "created_by": "player-x",
+        "moves": moves,
+    }
+
+
+async def insert_row_by_row(sessionmanager: DatabaseSessionManager, games: list[dict]):
+    """The previous write path: one session, add, commit and refresh per game"""
+    for game in games:
+        async with sessionmanager.session() as session:
+            game_history = GameHistory(**game_history_values(game))
+            session.add(game_history)
+            await session.commit()
+            await session.refresh(game_history)
+
+
+async def insert_batched(sessionmanager: DatabaseSessionManager, games: list[dict], batch_size: int):
+    for start in range(0, len(games), batch_size):
+        async with sessionmanager.session() as session:
+            await create_game_histories(session, games[start:start + batch_size])
+
+
+async def cleanup(sessionmanager: DatabaseSessionManager, games: list[dict]):
+    async with sessionmanager.session() as session:
+        await session.execute(
+            delete(GameHistory).where(GameHistory.game_id.in_([game["id"] for game in games])))
+        await session.commit()
+
+
+async def run(rows: int, batch_sizes: list[int], include_row_by_row: bool):
+    sessionmanager = DatabaseSessionManager(str(settings.DATABASE_URI))
+    print(f"{'write path':<24}{'rows':>8}{'seconds':>10}{'rows/s':>12}")
+
+    async def measure(label, insert, games):
+        start = time.perf_counter()
+        await insert(games)
+        elapsed = time.perf_counter() - start
+        await cleanup(sessionmanager, games)
+        print(f"{label:<24}{len(games):>8}{elapsed:>10.2f}{len(games) / elapsed:>12.0f}")
+
+    try:
+        if include_row_by_row:
+            await measure("row by row", lambda games: insert_row_by_row(sessionmanager, games),
+                          [make_game() for _ in range(rows)])
+        for batch_size in batch_sizes:
+            await measure(f"batch of {batch_size}",
+                          lambda games: insert_batched(sessionmanager, games, batch_size),
+                          [make_game() for _ in range(rows)])
+    finally:
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 50, 100, 500])
+    parser.add_argument("--skip-row-by-row", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.batch_sizes, not args.skip_row_by_row))
@@ -0,0 +1,58 @@
+"""
+Decoding benchmark for the board and moves of stored games.
+
+Generates games with 5 to 9 moves and reports the size per row and the time
+per row to decode them from the JSON columns with json.loads and from the
+packed column with unpack_moves. Needs no database.
+
+Run from the game-history directory:
+
+    python -m benchmarks.packing_benchmark --rows 1000
+"""
+import argparse
+import datetime
+import json
+import random
+import timeit
+
+from app.packing import pack_moves, unpack_moves
+
+PLAYERS = {"x": "3f2b9c1e-5d4a-4e8b-9c7d-1a2b3c4d5e6f", "o": "bot"}
+
+
+def make_game() -> tuple[list[str], list[dict]]:
+    """Board and moves of a game, a move every 0.2 to 8 seconds"""
+    timestamp = datetime.datetime(2026, 10, 19) + datetime.timedelta(seconds=random.random() * 1e6)
+    board, moves = [""] * 9, []
+    for i, position in enumerate(random.sample(range(9), random.randint(5, 9))):
+        timestamp += datetime.timedelta(microseconds=random.randint(200_000, 8_000_000))
+        symbol = "xo"[i % 2]
+        board[position] = symbol
+        moves.append({"player": PLAYERS[symbol], "symbol": symbol, "position": position,
+                      "timestamp": timestamp.isoformat()})
+    return board, moves
+
+
+def per_row(decode, rows: int, rounds: int) -> float:
+    """Best time per row in microseconds"""
+    return min(timeit.repeat(decode, number=1, repeat=rounds)) / rows * 1e6
+
+
+def run(rows: int, rounds: int):
+    games = [make_game() for _ in range(rows)]
+    as_json = [(json.dumps(board), json.dumps(moves)) for board, moves in games]
+    packed = [pack_moves(board, moves, PLAYERS) for board, moves in games]
+    assert [unpack_moves(data, PLAYERS) for data in packed] == games
+
+    print(f"json:   {sum(len(board) + len(moves) for board, moves in as_json) / rows:.0f} B/row, "
+          f"{per_row(lambda: [(json.loads(board), json.loads(moves)) for board, moves in as_json], rows, rounds):.2f} us/row")
+    print(f"packed: {sum(map(len, packed)) / rows:.0f} B/row, "
+          f"{per_row(lambda: [unpack_moves(data, PLAYERS) for data in packed], rows, rounds):.2f} us/row")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+    run(args.rows, args.rounds)
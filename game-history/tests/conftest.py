@@ -0,0 +1,6 @@
+import os
+
+# Settings without defaults, the tests reach neither the database nor the users service
+os.environ.setdefault("POSTGRES_PASSWORD", "test")
+os.environ.setdefault("USERS_SERVICE_URL", "http://users")
+os.environ.setdefault("CORS_URL", "http://localhost")
@@ -0,0 +1,82 @@
+import brotli
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.core.compression import CompressionMiddleware
+
+MINIMUM_SIZE = 1000
+BODY = "x" * (MINIMUM_SIZE * 2)
+
+
+async def page(request):
+    return PlainTextResponse(BODY, headers={"ETag": '"1.abc"'})
+
+
+async def small(request):
+    return PlainTextResponse("x", headers={"ETag": '"1.abc"'})
+
+
+async def stream(request):
+    async def chunks():
+        for _ in range(3):
+            yield BODY
+
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+app = Starlette(routes=[Route("/page", page), Route("/small", small), Route("/stream", stream)])
+app.add_middleware(CompressionMiddleware, minimum_size=MINIMUM_SIZE)
+client = TestClient(app)
+
+
+def get_raw(path: str, accept_encoding: str):
+    with client.stream("GET", path, headers={"Accept-Encoding": accept_encoding}) as response:
+        return response, b"".join(response.iter_raw())
+
+
+def test_brotli():
+    response, body = get_raw("/page", "gzip, deflate, br")
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["etag"] == '"1.abc-br"'
+    assert brotli.decompress(body).decode() == BODY
+
+
+def test_brotli_streaming():
+    response, body = get_raw("/stream", "gzip, deflate, br")
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "br"
+    assert brotli.decompress(body).decode() == BODY * 3
+
+
+def test_gzip_without_brotli():
+    response = client.get("/page", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == '"1.abc-gzip"'
+    assert response.text == BODY
+
+
+def test_small_response_is_not_compressed():
+    response = client.get("/small", headers={"Accept-Encoding": "gzip, deflate, br"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"1.abc"'
+
+
+def test_refused_brotli_falls_back_to_gzip():
+    response = client.get("/page", headers={"Accept-Encoding": "gzip, br;q=0"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == BODY
+
+    response = client.get("/page", headers={"Accept-Encoding": "br;q=0"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"1.abc"'
+
+
+def test_brotli_is_matched_as_a_whole_token():
+    response = client.get("/page", headers={"Accept-Encoding": "gzip, xbrotli"})
+    assert response.headers["content-encoding"] == "gzip"
+
+    response = client.get("/page", headers={"Accept-Encoding": "gzip;q=1, br;q=0.5"})
+    assert response.headers["content-encoding"] == "gzip"
@@ -0,0 +1,71 @@
+import asyncio
+import uuid
+
+from app import crud
+
+
+def inserted_rows(statement) -> list[dict]:
+    return [{column.key: value for column, value in row.items()} for row in statement._multi_values[0]]
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class Session:
+    """Stores nothing, the INSERT into game_history reports each of its games as new once, like Postgres"""
+
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        if len(self.statements) == 1:
+            return Result(list(dict.fromkeys(uuid.UUID(row["game_id"]) for row in inserted_rows(statement))))
+        return Result([])
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+
+def game(game_id: str) -> dict:
+    return {
+        "id": game_id,
+        "players": {"x": "alice", "o": "bob"},
+        "winner": "x",
+        "type": "ranked",
+        "status": "completed",
+        "board": ["X", "X", "X", "O", "O", "", "", "", ""],
+        "moves": [],
+        "created_at": "2026-10-19T12:00:00",
+        "created_by": "alice",
+    }
+
+
+def test_duplicate_game_in_batch_counts_once(monkeypatch):
+    stats_updates = []
+
+    async def update_user_stats(db_session, participations):
+        stats_updates.extend(participations)
+
+    monkeypatch.setattr(crud, "update_user_stats", update_user_stats)
+    duplicate = game(str(uuid.uuid4()))
+    other = game(str(uuid.uuid4()))
+    session = Session()
+
+    inserted = asyncio.run(crud.create_game_histories(session, [duplicate, other, dict(duplicate)]))
+
+    assert len(inserted) == 2
+    assert len(inserted_rows(session.statements[0])) == 2
+    assert sorted((row["game_id"], row["user_id"]) for row in stats_updates) == sorted(
+        (game_data["id"], user_id) for game_data in (duplicate, other) for user_id in ("alice", "bob"))
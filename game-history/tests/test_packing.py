@@ -0,0 +1,42 @@
+import datetime
+
+import pytest
+
+from app.packing import pack_moves, try_pack_moves, unpack_moves
+
+PLAYERS = {"x": "alice", "o": "bob"}
+
+
+def moves_at(*timestamps: datetime.datetime) -> list[dict]:
+    return [
+        {"player": PLAYERS["xo"[i % 2]], "symbol": "xo"[i % 2], "position": i, "timestamp": timestamp.isoformat()}
+        for i, timestamp in enumerate(timestamps)
+    ]
+
+
+@pytest.mark.parametrize("timestamps", [
+    # Whole seconds have no fraction in isoformat
+    [datetime.datetime(2026, 10, 19, 12, 0, 0), datetime.datetime(2026, 10, 19, 12, 0, 1, 500)],
+    # Across a minute, an hour, a day and a year
+    [datetime.datetime(2026, 12, 31, 23, 59, 59, 999999), datetime.datetime(2027, 1, 1, 0, 0, 0, 1)],
+    # Before 1970, and a delta too large for 4 bytes
+    [datetime.datetime(1969, 12, 31, 23, 59, 58), datetime.datetime(1970, 1, 2, 0, 0, 0, 7)],
+    # Going back in time
+    [datetime.datetime(2026, 10, 19, 12, 1, 0, 5), datetime.datetime(2026, 10, 19, 12, 0, 59, 6)],
+])
+def test_timestamps(timestamps):
+    moves = moves_at(*timestamps)
+    board = [move["symbol"] for move in moves] + [""] * (9 - len(moves))
+    assert unpack_moves(pack_moves(board, moves, PLAYERS), PLAYERS) == (board, moves)
+
+
+def test_explicit_player_action_and_board():
+    moves = moves_at(datetime.datetime(2026, 10, 19, 12), datetime.datetime(2026, 10, 19, 12, 0, 3))
+    moves[1] = {"player": "carol", "symbol": "o", "position": None, "action": "disconnect",
+                "timestamp": moves[1]["timestamp"]}
+    board = ["x", "", "o", "", "", "", "", "", ""]
+    assert unpack_moves(try_pack_moves(board, moves, PLAYERS), PLAYERS) == (board, moves)
+
+
+def test_no_moves():
+    assert unpack_moves(pack_moves([""] * 9, [], PLAYERS), PLAYERS) == ([""] * 9, [])
@@ -0,0 +1,85 @@
+import asyncio
+
+import redis
+
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ChatService:
+    """
+    Per-game chat with a bounded history and coalescing of message bursts.
+
+    Messages are appended to a capped stream chat:{game_id}, so players who
+    reconnect get the recent history. Messages arriving within a short window
+    are sent as one chat_batch frame, so a burst costs a single Redis pipeline,
+    a single pub/sub publish and one socket write per recipient.
+    """
+
+    def __init__(self, redis_client: redis.Redis, manager,
+                 window: float = settings.CHAT_COALESCE_WINDOW,
+                 history_length: int = settings.CHAT_HISTORY_LENGTH,
+                 max_message_length: int = settings.CHAT_MAX_MESSAGE_LENGTH):
+        self.redis_client = redis_client
+        self.manager = manager
+        self.window = window
+        self.history_length = history_length
+        self.max_message_length = max_message_length
+        # {game_id: [message]} waiting for the end of the coalescing window
+        self._pending: dict[str, list[dict]] = {}
+
+    @staticmethod
+    def _key(game_id: str) -> str:
+        return f"chat:{game_id}"
+
+    def clean_message(self, message) -> str | None:
+        """Apply the size cap, returns None for messages that should be dropped"""
+        if not isinstance(message, str):
+            return None
+        message = message.strip()[:self.max_message_length]
+        return message or None
+
+    def post(self, game_id: str, sender: str, message) -> bool:
+        """Queue a chat message for the next batch of the game, returns False if it was dropped"""
+        message = self.clean_message(message)
+        if message is None:
+            return False
+
+        pending = self._pending.get(game_id)
+        if pending is None:
+            pending = self._pending[game_id] = []
+            asyncio.create_task(self._flush_later(game_id))
+        pending.append({"sender": sender, "message": message})
+        return True
+
+    async def _flush_later(self, game_id: str):
+        await asyncio.sleep(self.window)
+        messages = self._pending.pop(game_id, [])
+        if not messages:
+            return
+
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for message in messages:
+                # Exact trimming, the cap is small enough that it's cheap
+                pipe.xadd(self._key(game_id), message,
+                          maxlen=self.history_length, approximate=False)
+            # Safety net for games that are never cleaned up
+            pipe.expire(self._key(game_id), settings.CHAT_HISTORY_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error storing chat messages for game {game_id}: {e}")
+
+        await self.manager.broadcast({"type": "chat_batch", "messages": messages}, game_id)
+
+    def history(self, game_id: str) -> list[dict]:
+        """Recent messages of the game, oldest first"""
+        entries = self.redis_client.xrevrange(
+            self._key(game_id), count=self.history_length)
+        return [fields for _, fields in reversed(entries)]
+
+    def delete(self, game_id: str):
+        self._pending.pop(game_id, None)
+        self.redis_client.delete(self._key(game_id))
@@ -28,6 +28,36 @@ class Settings(BaseSettings):
     REDIS_DB: int = 0
     REDIS_PASSWORD: str = "password"
 
+    # Approximate cap of the completed_games stream, the history worker also trims it by age
+    COMPLETED_GAMES_MAXLEN: int = 100000
+    # Summaries of just finished games per user, the history service shows them until the
+    # consumer has stored the game, so the TTL only has to outlast the consumer lag
+    RECENT_GAMES_LENGTH: int = 10
+    RECENT_GAMES_TTL: int = 600  # seconds
+
+    # Rate limits per user, as token bucket refill rate and capacity
+    RATE_LIMIT_MOVE_PER_SECOND: float = 2
+    RATE_LIMIT_MOVE_BURST: int = 5
+    RATE_LIMIT_CHAT_PER_SECOND: float = 1
+    RATE_LIMIT_CHAT_BURST: int = 5
+    RATE_LIMIT_CREATE_GAME_PER_SECOND: float = 0.2
+    RATE_LIMIT_CREATE_GAME_BURST: int = 5
+
+    # Chat
+    CHAT_HISTORY_LENGTH: int = 50
+    CHAT_HISTORY_TTL: int = 3600  # seconds
+    CHAT_MAX_MESSAGE_LENGTH: int = 500
+    CHAT_COALESCE_WINDOW: float = 0.1  # seconds
+
+    # Event loop monitoring, in seconds
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL: float = 0.25
+    LOOP_MONITOR_THRESHOLD: float = 0.1
+
+    # Tracing
+    OTEL_SERVICE_NAME: str = "game"
+    OTEL_EXPORTER_OTLP_ENDPOINT: str | None = None
+
 
     # Logging
     LOG_FILE_PATH: str = "logs/app.log"
@@ -0,0 +1,166 @@
+import os
+import time
+
+import redis
+import redis.client
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.responses import Response
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+)
+
+WEBSOCKET_CONNECTIONS = Gauge(
+    "websocket_connections",
+    "Open WebSocket connections on this instance",
+    multiprocess_mode="livesum",
+)
+
+WEBSOCKET_GAMES = Gauge(
+    "websocket_games",
+    "Games with at least one WebSocket connection on this instance",
+    multiprocess_mode="livesum",
+)
+
+MOVE_LATENCY = Histogram(
+    "game_move_processing_seconds",
+    "Time from receiving a move until the new game state is sent",
+    ["game_type"],
+)
+
+BOT_THINK_TIME = Histogram(
+    "game_bot_think_seconds",
+    "Time the bot spends choosing a move",
+    ["strategy"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+REDIS_COMMAND_LATENCY = Histogram(
+    "redis_command_duration_seconds",
+    "Redis command latency",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+# A pipeline is one round trip, its latency is recorded under command="PIPELINE"
+# and its size here, the size as a label would make a series per batch size
+REDIS_PIPELINE_COMMANDS = Histogram(
+    "redis_pipeline_commands",
+    "Commands per executed Redis pipeline",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+RATE_LIMITED = Counter(
+    "rate_limited_total",
+    "Requests and WebSocket messages rejected by the rate limiter",
+    ["action"],
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay of scheduled event loop wake-ups",
+    ["loop"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+EVENT_LOOP_LAG_QUANTILE = Gauge(
+    "event_loop_lag_quantile_seconds",
+    "Event loop lag percentiles over the recent window, per process",
+    ["loop", "quantile"],
+    multiprocess_mode="liveall",
+)
+
+EVENT_LOOP_BLOCKED = Counter(
+    "event_loop_blocked_total",
+    "Times the event loop was blocked for longer than the threshold",
+    ["loop"],
+)
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    """Pipeline that records the latency and the size of every batch it executes."""
+
+    def execute(self, raise_on_error=True):
+        commands = len(self.command_stack)
+        if not commands:
+            return super().execute(raise_on_error)
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            REDIS_COMMAND_LATENCY.labels(command="PIPELINE").observe(time.perf_counter() - start)
+            REDIS_PIPELINE_COMMANDS.observe(commands)
+
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client that records the latency of every command and pipeline it executes."""
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        # Queued commands skip execute_command, the pipeline records them as a batch
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_LATENCY.labels(command=str(args[0]).upper()).observe(
+                time.perf_counter() - start)
+
+
+class PrometheusMiddleware:
+    """Record the latency of every HTTP request, labelled by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Use the route template, not the raw path, to keep label cardinality bounded
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                method=scope["method"],
+                route=route.path if route is not None else "unmatched",
+                status=str(status_code),
+            ).observe(time.perf_counter() - start)
+
+
+def metrics_response() -> Response:
+    """
+    Render all metrics in the Prometheus text format.
+
+    When running under gunicorn with PROMETHEUS_MULTIPROC_DIR set, the
+    metrics of all workers are aggregated.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,49 @@
+from opentelemetry import propagate, trace
+from opentelemetry.context import Context
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+from opentelemetry.instrumentation.redis import RedisInstrumentor
+from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+from app.core.config import settings
+
+
+def setup_tracing(app=None):
+    """
+    Configure the global tracer provider and instrument FastAPI, httpx and Redis.
+
+    Spans are only exported if OTEL_EXPORTER_OTLP_ENDPOINT is configured,
+    trace context is propagated either way.
+    """
+    provider = TracerProvider(
+        resource=Resource.create({SERVICE_NAME: settings.OTEL_SERVICE_NAME}))
+    if settings.OTEL_EXPORTER_OTLP_ENDPOINT:
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(
+            endpoint=f"{settings.OTEL_EXPORTER_OTLP_ENDPOINT}/v1/traces")))
+    trace.set_tracer_provider(provider)
+
+    # Propagates the trace context to the users service on auth calls
+    HTTPXClientInstrumentor().instrument()
+    RedisInstrumentor().instrument()
+
+    if app is not None:
+        FastAPIInstrumentor.instrument_app(app, excluded_urls="health,metrics")
+
+
+def get_tracer(name: str):
+    return trace.get_tracer(name)
+
+
+def inject_trace_context() -> dict[str, str]:
+    """Serialize the current trace context, e.g. into the fields of a stream entry"""
+    carrier: dict[str, str] = {}
+    propagate.inject(carrier)
+    return carrier
+
+
+def extract_trace_context(carrier: dict) -> Context:
+    """Restore a trace context serialized with inject_trace_context"""
+    return propagate.extract(carrier)
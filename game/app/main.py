@@ -2,30 +2,53 @@ import asyncio
 from contextlib import asynccontextmanager
 import datetime
 import json
+import math
 from typing import Dict, Optional
 import uuid
-from fastapi import Depends, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 import redis
+from opentelemetry.context import Context
 
 from app.utils import check_winner, best_move
+from app.chat import ChatService
+from app.rate_limit import RateLimiter, default_limits
 from app.schemes import CreateGameDTO, CreateGameScheme
+from app.versions import Versions, bump_history_versions, recent_games_key, user_digest
 from app.core.config import settings
+from app.core.etag import make_etag, match_etag, not_modified
 from app.core.logger import get_logger
+from app.core.loop_monitor import LoopMonitor
+from app.core.metrics import (
+    BOT_THINK_TIME,
+    MOVE_LATENCY,
+    WEBSOCKET_CONNECTIONS,
+    WEBSOCKET_GAMES,
+    InstrumentedRedis,
+    PrometheusMiddleware,
+    metrics_response,
+)
+from app.core.tracing import get_tracer, inject_trace_context, setup_tracing
 
 logger = get_logger(__name__)
+tracer = get_tracer(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     asyncio.create_task(cleanup_stale_games())
+    loop_monitor = LoopMonitor("api")
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
     yield
+    loop_monitor.stop()
 
 app = FastAPI(title=settings.PROJECT_NAME,
               root_path="/game-service", lifespan=lifespan)
+setup_tracing(app)
 
 
-redis_client = redis.Redis(
+redis_client = InstrumentedRedis(
     host=settings.REDIS_HOST,
     port=settings.REDIS_PORT,
     db=settings.REDIS_DB,
@@ -48,7 +71,7 @@ class AuthenticationMiddleware:
 
         request = Request(scope, receive)
 
-        if request.url.path in ["/game-service/docs", "/game-service/openapi.json", "/game-service/health"]:
+        if request.url.path in ["/game-service/docs", "/game-service/openapi.json", "/game-service/health", "/game-service/metrics"]:
             return await self.app(scope, receive, send)
 
         # Extract the cookie
@@ -126,6 +149,7 @@ class ConnectionManager:
         if game_id not in self.active_connections:
             self.active_connections[game_id] = {}
         self.active_connections[game_id][player_id] = websocket
+        self._update_connection_gauges()
 
         # Ensure tasks are started when first connection happens
         if self.polling_task is None or self.polling_task.done():
@@ -177,6 +201,7 @@ class ConnectionManager:
                 del self.active_connections[game_id][player_id]
             if not self.active_connections[game_id]:  # If empty
                 del self.active_connections[game_id]
+        self._update_connection_gauges()
 
         # Stop tasks if no more connections
         if not self.active_connections:
@@ -187,6 +212,12 @@ class ConnectionManager:
                 self.monitoring_task.cancel()
                 self.monitoring_task = None
 
+    def _update_connection_gauges(self):
+        """Export the number of local connections and games to Prometheus"""
+        WEBSOCKET_GAMES.set(len(self.active_connections))
+        WEBSOCKET_CONNECTIONS.set(
+            sum(len(players) for players in self.active_connections.values()))
+
     async def _handle_pubsub_message(self, message):
         """Handle incoming pub/sub messages"""
         try:
@@ -309,8 +340,7 @@ class ConnectionManager:
                             # Save to Redis
                             redis_client.set(
                                 f"game:{game_id}", json.dumps(game_data))
-                            redis_client.xadd("completed_games", {
-                                              "data": json.dumps(game_data)})
+                            publish_completed_game(game_data)
 
                             # Notify the remaining player
                             try:
@@ -336,6 +366,12 @@ class ConnectionManager:
 # Initialize the manager
 manager = ConnectionManager()
 
+rate_limiter = RateLimiter(redis_client, default_limits())
+
+chat = ChatService(redis_client, manager)
+
+versions = Versions(redis_client)
+
 
 async def cleanup_game(game_id: str, delay_seconds: int = 10):
     """
@@ -348,13 +384,84 @@ async def cleanup_game(game_id: str, delay_seconds: int = 10):
     if delay_seconds > 0:
         await asyncio.sleep(delay_seconds)
 
+    # Remove from the open games first, the lobby must not list a game whose data changed under the same version
+    versions.remove_open_game(game_id)
     # Delete the game data
     redis_client.delete(f"game:{game_id}")
-    # Also remove from open games set if present
-    redis_client.srem("open_games", game_id)
+    chat.delete(game_id)
     logger.info(f"Cleaned up game {game_id} from Redis")
 
 
+def recent_game_summary(game_data: dict, symbol: str) -> str:
+    """A finished game as the history service lists it, from the point of view of the player of symbol"""
+    winner = game_data["winner"]
+    return json.dumps({
+        "game_id": game_data["id"],
+        "player_x_id": game_data["players"]["x"],
+        "player_o_id": game_data["players"]["o"],
+        "winner": winner,
+        "game_type": game_data["type"],
+        "game_status": game_data["status"],
+        "board": game_data["board"],
+        "moves": game_data["moves"],
+        "created_at": game_data["created_at"],
+        "created_by": game_data["created_by"],
+        "result": "draw" if winner == "draw" else "win" if winner == symbol else "loss",
+    }, separators=(",", ":"))
+
+
+def publish_completed_game(game_data: dict):
+    """
+    Send a finished game to the completed_games stream to be saved by the history service.
+
+    The current trace context travels with the entry so the consumer can continue the trace.
+    A summary is also pushed to the recent_games list of each player, so the game shows up
+    in their history right away, before the consumer has stored it. That changes their
+    history, so their history versions are bumped as well.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.xadd("completed_games", {
+        "data": json.dumps(game_data), **inject_trace_context()},
+        maxlen=settings.COMPLETED_GAMES_MAXLEN, approximate=True)
+    player_ids = []
+    for symbol, player_id in game_data["players"].items():
+        if player_id in (None, "bot") or (symbol == "o" and player_id == game_data["players"]["x"]):
+            continue
+        key = recent_games_key(player_id)
+        pipe.lpush(key, recent_game_summary(game_data, symbol))
+        pipe.ltrim(key, 0, settings.RECENT_GAMES_LENGTH - 1)
+        pipe.expire(key, settings.RECENT_GAMES_TTL)
+        player_ids.append(player_id)
+    bump_history_versions(pipe, player_ids)
+    pipe.execute()
+
+
+async def is_throttled(websocket: WebSocket, user_id: str, data: dict) -> bool:
+    """
+    Check the rate limit for a WebSocket message before it touches the game state.
+
+    Throttled moves get an error so the client can resync, throttled chat messages are dropped.
+    """
+    allowed, _ = rate_limiter.allow(user_id, data.get("type"))
+    if allowed:
+        return False
+    if data.get("type") == "move":
+        await websocket.send_json({
+            "type": "error",
+            "message": "Too many moves, slow down"
+        })
+    return True
+
+
+def start_move_span(game_id: str, game_type: str, player_id: str):
+    """Start a new trace for a single move, separate from the long-lived WebSocket connection"""
+    return tracer.start_as_current_span(
+        "game.move",
+        context=Context(),
+        attributes={"game.id": game_id, "game.type": game_type, "player.id": player_id},
+    )
+
+
 @app.websocket("/ws/game/{game_id}")
 async def websocket_endpoint(websocket: WebSocket, game_id: str):
     # Authenticate user with token from query parameter
@@ -429,107 +536,110 @@ async def websocket_endpoint(websocket: WebSocket, game_id: str):
         })
         logger.info(f"Sent initial game state to user {user["id"]}")
 
+        # Recent chat, e.g. after a reconnect
+        chat_history = chat.history(game_id)
+        if chat_history:
+            await websocket.send_json({
+                "type": "chat_history",
+                "messages": chat_history
+            })
+
         # Multiplayer game loop
         if game_data["type"] == "multiplayer":
             logger.info("Starting multiplayer game loop")
             while True:
                 data = await websocket.receive_json()
+                if await is_throttled(websocket, user["id"], data):
+                    continue
 
                 # Handle different message types
                 if data["type"] == "move":
-                    # Get fresh game state from Redis
-                    fresh_game_data_str = redis_client.get(f"game:{game_id}")
-                    if fresh_game_data_str:
-                        fresh_game_data = json.loads(fresh_game_data_str)
-                        # Only send if the game is actually active
-                        if fresh_game_data["status"] == "active":
+                    with MOVE_LATENCY.labels(game_type="multiplayer").time(), \
+                            start_move_span(game_id, "multiplayer", user["id"]):
+                        # Get fresh game state from Redis
+                        fresh_game_data_str = redis_client.get(f"game:{game_id}")
+                        if fresh_game_data_str:
+                            fresh_game_data = json.loads(fresh_game_data_str)
+                            # Only send if the game is actually active
+                            if fresh_game_data["status"] == "active":
+                                await websocket.send_json({
+                                    "type": "game_state",
+                                    "game": fresh_game_data
+                                })
+                            else:
+                                await websocket.send_json({
+                                    "type": "error",
+                                    "message": "Game is not active yet"
+                                })
+                                continue
+
+                        game_data = json.loads(fresh_game_data_str)
+
+                        # Check if it's this player's turn
+                        if game_data["current_player"] != user["id"]:
                             await websocket.send_json({
-                                "type": "game_state",
-                                "game": fresh_game_data
+                                "type": "error",
+                                "message": "Not your turn"
                             })
-                        else:
+                            continue
+
+                        # Check if move is valid
+                        position = data["position"]
+                        if not (0 <= position < 9) or game_data["board"][position] != "":
                             await websocket.send_json({
                                 "type": "error",
-                                "message": "Game is not active yet"
+                                "message": "Invalid move"
                             })
                             continue
 
-                    game_data = json.loads(fresh_game_data_str)
-
-                    # Check if it's this player's turn
-                    if game_data["current_player"] != user["id"]:
-                        await websocket.send_json({
-                            "type": "error",
-                            "message": "Not your turn"
-                        })
-                        continue
+                        # Apply the move
+                        game_data["board"][position] = player_symbol
 
-                    # Check if move is valid
-                    position = data["position"]
-                    if not (0 <= position < 9) or game_data["board"][position] != "":
-                        await websocket.send_json({
-                            "type": "error",
-                            "message": "Invalid move"
+                        # record the move
+                        game_data["moves"].append({
+                            "player": user["id"],
+                            "symbol": player_symbol,
+                            "position": position,
+                            "timestamp": datetime.datetime.now().isoformat()
                         })
-                        continue
-
-                    # Apply the move
-                    game_data["board"][position] = player_symbol
-
-                    # record the move
-                    game_data["moves"].append({
-                        "player": user["id"],
-                        "symbol": player_symbol,
-                        "position": position,
-                        "timestamp": datetime.datetime.now().isoformat()
-                    })
 
-                    # Check for win or draw
-                    winner = check_winner(game_data["board"])
-                    if winner:
-                        game_data["winner"] = winner
-                        game_data["status"] = "completed"
-                        # send complete game to Redis message queue to be saved in the database by another service
-                        redis_client.xadd("completed_games", {
-                                          "data": json.dumps(game_data)})
-                        # Schedule cleanup
-                        asyncio.create_task(cleanup_game(game_id))
-                    elif "" not in game_data["board"]:  # Board is full
-                        game_data["status"] = "completed"
-                        game_data["winner"] = "draw"
-                        redis_client.xadd("completed_games", {
-                                          "data": json.dumps(game_data)})
-                        # Schedule cleanup
-                        asyncio.create_task(cleanup_game(game_id))
-                    else:
-                        # Switch turns
-                        game_data["current_player"] = (
-                            game_data["players"]["o"] if game_data["current_player"] == game_data["players"]["x"]
-                            else game_data["players"]["x"]
+                        # Check for win or draw
+                        winner = check_winner(game_data["board"])
+                        if winner:
+                            game_data["winner"] = winner
+                            game_data["status"] = "completed"
+                            # send complete game to Redis message queue to be saved in the database by another service
+                            publish_completed_game(game_data)
+                            # Schedule cleanup
+                            asyncio.create_task(cleanup_game(game_id))
+                        elif "" not in game_data["board"]:  # Board is full
+                            game_data["status"] = "completed"
+                            game_data["winner"] = "draw"
+                            publish_completed_game(game_data)
+                            # Schedule cleanup
+                            asyncio.create_task(cleanup_game(game_id))
+                        else:
+                            # Switch turns
+                            game_data["current_player"] = (
+                                game_data["players"]["o"] if game_data["current_player"] == game_data["players"]["x"]
+                                else game_data["players"]["x"]
+                            )
+
+                        # Save updated game state to Redis
+                        redis_client.set(f"game:{game_id}", json.dumps(game_data))
+
+                        # Broadcast updated game state to all players
+                        await manager.broadcast(
+                            {
+                                "type": "game_state",
+                                "game": game_data
+                            },
+                            game_id
                         )
 
-                    # Save updated game state to Redis
-                    redis_client.set(f"game:{game_id}", json.dumps(game_data))
-
-                    # Broadcast updated game state to all players
-                    await manager.broadcast(
-                        {
-                            "type": "game_state",
-                            "game": game_data
-                        },
-                        game_id
-                    )
-
                 elif data["type"] == "chat":
-                    # Broadcast chat message to all players
-                    await manager.broadcast(
-                        {
-                            "type": "chat",
-                            "message": data["message"],
-                            "sender": player_symbol
-                        },
-                        game_id
-                    )
+                    # Stored and broadcast to all players with the next chat batch
+                    chat.post(game_id, player_symbol, data.get("message"))
 
         # Bot game loop
         if game_data["type"] == "bot":
@@ -570,176 +680,184 @@ async def websocket_endpoint(websocket: WebSocket, game_id: str):
             # Then enter the game loop to handle player moves and subsequent bot moves
             while True:
                 data = await websocket.receive_json()
+                if await is_throttled(websocket, user["id"], data):
+                    continue
 
                 # Handle different message types
                 if data["type"] == "move":
-                    # Get fresh game state from Redis
-                    game_data_str = redis_client.get(f"game:{game_id}")
-                    if not game_data_str:
-                        await websocket.send_json({
-                            "type": "error",
-                            "message": "Game not found"
-                        })
-                        continue
+                    with MOVE_LATENCY.labels(game_type="bot").time(), \
+                            start_move_span(game_id, "bot", user["id"]):
+                        # Get fresh game state from Redis
+                        game_data_str = redis_client.get(f"game:{game_id}")
+                        if not game_data_str:
+                            await websocket.send_json({
+                                "type": "error",
+                                "message": "Game not found"
+                            })
+                            continue
 
-                    game_data = json.loads(game_data_str)
+                        game_data = json.loads(game_data_str)
 
-                    # Check if game is already completed
-                    if game_data["status"] == "completed":
-                        await websocket.send_json({
-                            "type": "error",
-                            "message": "Game already completed"
-                        })
-                        continue
+                        # Check if game is already completed
+                        if game_data["status"] == "completed":
+                            await websocket.send_json({
+                                "type": "error",
+                                "message": "Game already completed"
+                            })
+                            continue
 
-                    # Check if it's player's turn
-                    if game_data["current_player"] != user["id"]:
-                        await websocket.send_json({
-                            "type": "error",
-                            "message": "Not your turn"
-                        })
-                        continue
+                        # Check if it's player's turn
+                        if game_data["current_player"] != user["id"]:
+                            await websocket.send_json({
+                                "type": "error",
+                                "message": "Not your turn"
+                            })
+                            continue
 
-                    # Check if move is valid
-                    position = data["position"]
-                    if not (0 <= position < 9) or game_data["board"][position] != "":
-                        await websocket.send_json({
-                            "type": "error",
-                            "message": "Invalid move"
+                        # Check if move is valid
+                        position = data["position"]
+                        if not (0 <= position < 9) or game_data["board"][position] != "":
+                            await websocket.send_json({
+                                "type": "error",
+                                "message": "Invalid move"
+                            })
+                            continue
+
+                        # Apply the player's move
+                        game_data["board"][position] = player_symbol
+
+                        # Record the move
+                        game_data["moves"].append({
+                            "player": user["id"],
+                            "symbol": player_symbol,
+                            "position": position,
+                            "timestamp": datetime.datetime.now().isoformat()
                         })
-                        continue
 
-                    # Apply the player's move
-                    game_data["board"][position] = player_symbol
+                        # Check for win or draw after player's move
+                        winner = check_winner(game_data["board"])
+                        if winner:
+                            game_data["winner"] = winner
+                            game_data["status"] = "completed"
+                            publish_completed_game(game_data)
+                            redis_client.set(
+                                f"game:{game_id}", json.dumps(game_data))
+                            await websocket.send_json({
+                                "type": "game_state",
+                                "game": game_data
+                            })
+                            # Schedule cleanup
+                            asyncio.create_task(cleanup_game(game_id))
+                            continue
+                        elif "" not in game_data["board"]:  # Board is full
+                            game_data["status"] = "completed"
+                            game_data["winner"] = "draw"
+                            publish_completed_game(game_data)
+                            redis_client.set(
+                                f"game:{game_id}", json.dumps(game_data))
+                            await websocket.send_json({
+                                "type": "game_state",
+                                "game": game_data
+                            })
+                            # Schedule cleanup
+                            asyncio.create_task(cleanup_game(game_id))
+                            continue
 
-                    # Record the move
-                    game_data["moves"].append({
-                        "player": user["id"],
-                        "symbol": player_symbol,
-                        "position": position,
-                        "timestamp": datetime.datetime.now().isoformat()
-                    })
+                        # Change turn to bot
+                        bot_symbol = "x" if player_symbol == "o" else "o"
+                        game_data["current_player"] = "bot"
 
-                    # Check for win or draw after player's move
-                    winner = check_winner(game_data["board"])
-                    if winner:
-                        game_data["winner"] = winner
-                        game_data["status"] = "completed"
-                        redis_client.xadd("completed_games", {
-                                          "data": json.dumps(game_data)})
-                        redis_client.set(
-                            f"game:{game_id}", json.dumps(game_data))
+                        # Save interim state before bot makes its move
+                        redis_client.set(f"game:{game_id}", json.dumps(game_data))
                         await websocket.send_json({
                             "type": "game_state",
                             "game": game_data
                         })
-                        # Schedule cleanup
-                        asyncio.create_task(cleanup_game(game_id))
-                        continue
-                    elif "" not in game_data["board"]:  # Board is full
-                        game_data["status"] = "completed"
-                        game_data["winner"] = "draw"
-                        redis_client.xadd("completed_games", {
-                            "data": json.dumps(game_data)})
-                        redis_client.set(
-                            f"game:{game_id}", json.dumps(game_data))
-                        await websocket.send_json({
-                            "type": "game_state",
-                            "game": game_data
+
+                        # Bot's turn
+                        bot_position = None
+                        bot_strategy = "minimax" if bot_symbol == "x" else "defensive"
+                        with BOT_THINK_TIME.labels(strategy=bot_strategy).time(), \
+                                tracer.start_as_current_span(
+                                    "game.bot_move", attributes={"bot.strategy": bot_strategy}):
+                            if bot_symbol == "x":
+                                # X plays to win using minimax
+                                bot_position = best_move(game_data["board"])
+                            else:
+                                # O plays defensively
+                                # Try to block a winning move first
+                                for i in range(9):
+                                    if game_data["board"][i] == "":
+                                        # Test if player would win with this move
+                                        game_data["board"][i] = player_symbol
+                                        if check_winner(game_data["board"]) == player_symbol:
+                                            bot_position = i  # Block this winning move
+                                            game_data["board"][i] = ""
+                                            break
+                                        game_data["board"][i] = ""
+
+                                # If no blocking needed, prefer center
+                                if bot_position is None and game_data["board"][4] == "":
+                                    bot_position = 4
+
+                                # Then corners
+                                if bot_position is None:
+                                    corners = [0, 2, 6, 8]
+                                    for corner in corners:
+                                        if game_data["board"][corner] == "":
+                                            bot_position = corner
+                                            break
+
+                                # Then any available spot
+                                if bot_position is None:
+                                    for i in range(9):
+                                        if game_data["board"][i] == "":
+                                            bot_position = i
+                                            break
+
+                        # Apply bot's move
+                        game_data["board"][bot_position] = bot_symbol
+
+                        # Record the bot's move
+                        game_data["moves"].append({
+                            "player": "bot",
+                            "symbol": bot_symbol,
+                            "position": bot_position,
+                            "timestamp": datetime.datetime.now().isoformat()
                         })
-                        # Schedule cleanup
-                        asyncio.create_task(cleanup_game(game_id))
-                        continue
 
-                    # Change turn to bot
-                    bot_symbol = "x" if player_symbol == "o" else "o"
-                    game_data["current_player"] = "bot"
+                        # Check for win or draw after bot's move
+                        winner = check_winner(game_data["board"])
+                        if winner:
+                            game_data["winner"] = winner
+                            game_data["status"] = "completed"
+                            publish_completed_game(game_data)
+                        elif "" not in game_data["board"]:  # Board is full
+                            game_data["status"] = "completed"
+                            game_data["winner"] = "draw"
+                            publish_completed_game(game_data)
 
-                    # Save interim state before bot makes its move
-                    redis_client.set(f"game:{game_id}", json.dumps(game_data))
-                    await websocket.send_json({
-                        "type": "game_state",
-                        "game": game_data
-                    })
+                        # Change turn back to player
+                        game_data["current_player"] = user["id"]
 
-                    # Bot's turn
-                    bot_position = None
-                    if bot_symbol == "x":
-                        # X plays to win using minimax
-                        bot_position = best_move(game_data["board"])
-                    else:
-                        # O plays defensively
-                        # Try to block a winning move first
-                        for i in range(9):
-                            if game_data["board"][i] == "":
-                                # Test if player would win with this move
-                                game_data["board"][i] = player_symbol
-                                if check_winner(game_data["board"]) == player_symbol:
-                                    bot_position = i  # Block this winning move
-                                    game_data["board"][i] = ""
-                                    break
-                                game_data["board"][i] = ""
-
-                        # If no blocking needed, prefer center
-                        if bot_position is None and game_data["board"][4] == "":
-                            bot_position = 4
-
-                        # Then corners
-                        if bot_position is None:
-                            corners = [0, 2, 6, 8]
-                            for corner in corners:
-                                if game_data["board"][corner] == "":
-                                    bot_position = corner
-                                    break
-
-                        # Then any available spot
-                        if bot_position is None:
-                            for i in range(9):
-                                if game_data["board"][i] == "":
-                                    bot_position = i
-                                    break
-
-                    # Apply bot's move
-                    game_data["board"][bot_position] = bot_symbol
-
-                    # Record the bot's move
-                    game_data["moves"].append({
-                        "player": "bot",
-                        "symbol": bot_symbol,
-                        "position": bot_position,
-                        "timestamp": datetime.datetime.now().isoformat()
-                    })
+                        # Save updated game state to Redis
+                        redis_client.set(f"game:{game_id}", json.dumps(game_data))
 
-                    # Check for win or draw after bot's move
-                    winner = check_winner(game_data["board"])
-                    if winner:
-                        game_data["winner"] = winner
-                        game_data["status"] = "completed"
-                        redis_client.xadd("completed_games", {
-                            "data": json.dumps(game_data)})
-                    elif "" not in game_data["board"]:  # Board is full
-                        game_data["status"] = "completed"
-                        game_data["winner"] = "draw"
-                        redis_client.xadd("completed_games", {
-                            "data": json.dumps(game_data)})
-
-                    # Change turn back to player
-                    game_data["current_player"] = user["id"]
-
-                    # Save updated game state to Redis
-                    redis_client.set(f"game:{game_id}", json.dumps(game_data))
-
-                    # Send updated game state to player
-                    await websocket.send_json({
-                        "type": "game_state",
-                        "game": game_data
-                    })
+                        # Send updated game state to player
+                        await websocket.send_json({
+                            "type": "game_state",
+                            "game": game_data
+                        })
 
                 elif data["type"] == "chat":
+                    message = chat.clean_message(data.get("message"))
+                    if message is None:
+                        continue
+
                     # Just echo the chat message back for bot games
                     await websocket.send_json({
                         "type": "chat",
-                        "message": data["message"],
+                        "message": message,
                         "sender": player_symbol
                     })
 
@@ -798,8 +916,7 @@ async def websocket_endpoint(websocket: WebSocket, game_id: str):
                 redis_client.set(f"game:{game_id}", json.dumps(game_data))
 
                 # Record the completed game
-                redis_client.xadd("completed_games", {
-                                  "data": json.dumps(game_data)})
+                publish_completed_game(game_data)
 
                 # Notify the remaining player about the win
                 await manager.broadcast(
@@ -826,9 +943,9 @@ async def websocket_endpoint(websocket: WebSocket, game_id: str):
                     "timestamp": datetime.datetime.now().isoformat()
                 })
 
-                # Update Redis and remove from open games
+                # Remove from open games and update Redis
+                versions.remove_open_game(game_id)
                 redis_client.set(f"game:{game_id}", json.dumps(game_data))
-                redis_client.srem("open_games", game_id)
 
                 logger.info(
                     f"Game {game_id} marked as abandoned after creator disconnected")
@@ -843,7 +960,23 @@ async def websocket_endpoint(websocket: WebSocket, game_id: str):
 
 
 @app.get("/games/open", response_model=list[CreateGameDTO])
-async def get_open_games(user=Depends(get_current_user)):
+async def get_open_games(response: Response, if_none_match: str | None = Header(None),
+                         user=Depends(get_current_user)):
+    """
+    Get the games waiting for a second player, newest first, without the games of the user.
+
+    The ETag changes with the lobby version. With a current ETag in If-None-Match
+    the response is 304 and the games are not read.
+    """
+    # Read the version before the games, a change in between only makes the next response a full one
+    version = versions.lobby()
+    digest = user_digest(user["id"])
+    known_etag, known_version = match_etag(if_none_match, digest)
+    if known_version == version:
+        return not_modified(known_etag)
+    response.headers["ETag"] = make_etag(version, digest)
+    response.headers["Cache-Control"] = "private, no-cache"
+
     # Get list of open game IDs
     open_game_ids = redis_client.smembers("open_games")
 
@@ -856,11 +989,20 @@ async def get_open_games(user=Depends(get_current_user)):
             if game_data["players"]["x"] != user["id"] and game_data["players"]["o"] != user["id"]:
                 open_games.append(game_data)
 
+    # Same order for the same version, the ETag is strong
+    open_games.sort(key=lambda game: (game["created_at"], game["id"]), reverse=True)
     return open_games
 
 
 @app.post("/game/create", response_model=CreateGameDTO)
 async def create_game(data: CreateGameScheme, user=Depends(get_current_user)):
+    allowed, retry_after = rate_limiter.allow(user["id"], "create_game")
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many games created, try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))})
+
     # Generate a unique game ID
     game_id = str(uuid.uuid4())
 
@@ -903,7 +1045,7 @@ async def create_game(data: CreateGameScheme, user=Depends(get_current_user)):
 
     # Add to the list of open games if it's a multiplayer game waiting for opponents
     if type == "multiplayer" and (players["x"] is None or players["o"] is None):
-        redis_client.sadd("open_games", game_id)
+        versions.add_open_game(game_id)
 
     return CreateGameDTO(**game_data)
 
@@ -950,9 +1092,9 @@ async def join_game(game_id: str, user=Depends(get_current_user)):
     # Set game to active now that both players are joined
     game_data["status"] = "active"
 
-    # Update game in Redis
+    # Remove from open games and update game in Redis
+    versions.remove_open_game(game_id)
     redis_client.set(f"game:{game_id}", json.dumps(game_data))
-    redis_client.srem("open_games", game_id)  # Remove from open games
 
     return game_data
 
@@ -962,6 +1104,11 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+
 allowed_origins = [
     settings.CORS_URL,
 ]
@@ -974,6 +1121,8 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+app.add_middleware(PrometheusMiddleware)
+
 
 async def cleanup_stale_games():
     """Background task to clean up old games from Redis"""
@@ -1008,6 +1157,7 @@ async def cleanup_stale_games():
                         # Remove waiting games older than 30 minutes
                         if (current_time - created_time).total_seconds() > 1800:  # 30 minutes
                             game_data["status"] = "expired"
+                            versions.remove_open_game(game_id)
                             redis_client.set(game_key, json.dumps(game_data))
                             await cleanup_game(game_id, delay_seconds=0)
                             logger.info(
@@ -0,0 +1,102 @@
+import time
+
+import redis
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.core.metrics import RATE_LIMITED
+
+logger = get_logger(__name__)
+
+# Refills the bucket based on the time since the last call and takes one token.
+# Uses the Redis clock so all game instances share the same notion of time.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RateLimiter:
+    """
+    Distributed token bucket per user and action, evaluated atomically in Redis.
+
+    Once a bucket is empty, the limiter remembers locally until when it stays
+    empty, so a client that keeps flooding is rejected without any Redis calls.
+    """
+
+    def __init__(self, redis_client: redis.Redis, limits: dict[str, tuple[float, int]]):
+        # {action: (tokens per second, bucket capacity)}
+        self.limits = limits
+        self._script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        # {bucket key: monotonic time until which the bucket is known to be empty}
+        self._blocked_until: dict[str, float] = {}
+
+    def allow(self, user_id: str, action: str) -> tuple[bool, float]:
+        """
+        Take a token for the action of the user.
+
+        Returns whether the action is allowed and, if not, the seconds until it will be.
+        Actions without a configured limit are always allowed.
+        """
+        if action not in self.limits:
+            return True, 0.0
+
+        key = f"rate_limit:{action}:{user_id}"
+        now = time.monotonic()
+        blocked_until = self._blocked_until.get(key)
+        if blocked_until is not None:
+            if blocked_until > now:
+                RATE_LIMITED.labels(action=action).inc()
+                return False, blocked_until - now
+            del self._blocked_until[key]
+
+        rate, capacity = self.limits[action]
+        try:
+            allowed, retry_after = self._script(keys=[key], args=[rate, capacity])
+        except redis.RedisError as e:
+            # Fail open, a Redis hiccup must not stop the games
+            logger.error(f"Error evaluating rate limit for {key}: {e}")
+            return True, 0.0
+
+        if allowed:
+            return True, 0.0
+
+        retry_after = float(retry_after)
+        self._remember_blocked(key, now + retry_after)
+        RATE_LIMITED.labels(action=action).inc()
+        return False, retry_after
+
+    def _remember_blocked(self, key: str, until: float):
+        if len(self._blocked_until) >= 10000:
+            now = time.monotonic()
+            self._blocked_until = {
+                k: v for k, v in self._blocked_until.items() if v > now}
+        self._blocked_until[key] = until
+
+
+def default_limits() -> dict[str, tuple[float, int]]:
+    return {
+        "move": (settings.RATE_LIMIT_MOVE_PER_SECOND, settings.RATE_LIMIT_MOVE_BURST),
+        "chat": (settings.RATE_LIMIT_CHAT_PER_SECOND, settings.RATE_LIMIT_CHAT_BURST),
+        "create_game": (settings.RATE_LIMIT_CREATE_GAME_PER_SECOND, settings.RATE_LIMIT_CREATE_GAME_BURST),
+    }
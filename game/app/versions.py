@@ -0,0 +1,94 @@
+import hashlib
+
+LOBBY_VERSION_KEY = "lobby:version"
+OPEN_GAMES_KEY = "open_games"
+
+# Key and TTL of the history version of a user, owned by the history service, see game-history/app/cache.py
+HISTORY_VERSION_TTL = 24 * 3600
+
+
+def history_version_key(user_id: str) -> str:
+    # The user ID is a hash tag, the history service reads the version together with other keys of the user
+    return f"history:version:{{{user_id}}}"
+
+
+# Games a user just finished, read by the history service, see game-history/app/recent.py
+def recent_games_key(user_id: str) -> str:
+    return f"recent_games:{{{user_id}}}"
+
+
+# A version is the time of the change in microseconds, and at least one more than the
+# version it replaces. Versions are never reused, also not after their key expired, so
+# they can back ETags that clients keep for longer than the key lives.
+NEXT_VERSION_LUA = """
+local function next_version(key)
+    local now = redis.call('TIME')
+    local version = math.max(tonumber(now[1]) * 1000000 + tonumber(now[2]), tonumber(redis.call('GET', key) or '0') + 1)
+    return string.format('%d', version)
+end
+
+local function bump(key, ttl)
+    local version = next_version(key)
+    if tonumber(ttl) > 0 then
+        redis.call('SET', key, version, 'EX', ttl)
+    else
+        redis.call('SET', key, version)
+    end
+    return version
+end
+"""
+
+# Bumps every key, ARGV[1] is their TTL, 0 for none
+BUMP_VERSIONS_SCRIPT = NEXT_VERSION_LUA + """
+for _, key in ipairs(KEYS) do
+    bump(key, ARGV[1])
+end
+"""
+
+# Returns the version of KEYS[1], starting it if it is missing
+GET_VERSION_SCRIPT = NEXT_VERSION_LUA + """
+return redis.call('GET', KEYS[1]) or bump(KEYS[1], ARGV[1])
+"""
+
+# SADD or SREM (ARGV[1]) a game to or from the open games and bump the lobby version if that changed the set
+UPDATE_OPEN_GAMES_SCRIPT = NEXT_VERSION_LUA + """
+if redis.call(ARGV[1], KEYS[1], ARGV[2]) == 1 then
+    bump(KEYS[2], 0)
+end
+"""
+
+
+def user_digest(user_id: str) -> str:
+    """Tells apart the responses of different users built at the same version"""
+    return hashlib.blake2b(user_id.encode(), digest_size=8).hexdigest()
+
+
+class Versions:
+    """
+    Version stamps of what clients poll, bumped whenever it changes.
+
+    The lobby version changes with the set of open games, the history version of
+    a user when the user finished a game. They back the ETags of /games/open
+    here and of /games in the history service.
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self._get_version = redis_client.register_script(GET_VERSION_SCRIPT)
+        self._update_open_games = redis_client.register_script(UPDATE_OPEN_GAMES_SCRIPT)
+
+    def lobby(self) -> str:
+        return self._get_version(keys=[LOBBY_VERSION_KEY], args=[0])
+
+    def add_open_game(self, game_id: str):
+        self._update_open_games(keys=[OPEN_GAMES_KEY, LOBBY_VERSION_KEY], args=["SADD", game_id])
+
+    def remove_open_game(self, game_id: str):
+        self._update_open_games(keys=[OPEN_GAMES_KEY, LOBBY_VERSION_KEY], args=["SREM", game_id])
+
+
+def bump_history_versions(pipe, user_ids: list[str]):
+    """Queue the history version bumps of users on a Redis pipeline"""
+    # One script per user, the versions of different users are in different cluster slots
+    for user_id in user_ids:
+        pipe.eval(BUMP_VERSIONS_SCRIPT, 1, history_version_key(user_id), HISTORY_VERSION_TTL)
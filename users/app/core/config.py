@@ -44,6 +44,10 @@ class Settings(BaseSettings):
     FRONTEND_URL: str
     CORS_URL: str
     COOKIE_DOMAIN: str
+
+    # Tracing
+    OTEL_SERVICE_NAME: str = "users"
+    OTEL_EXPORTER_OTLP_ENDPOINT: str | None = None
     
     # Logging
     LOG_FILE_PATH: str = "logs/app.log"
@@ -0,0 +1,26 @@
+from opentelemetry import trace
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+from app.core.config import settings
+
+
+def setup_tracing(app):
+    """
+    Configure the global tracer provider and instrument the FastAPI app.
+
+    Requests continue the trace of the calling service, e.g. the auth check
+    of the game and history services. Spans are only exported if
+    OTEL_EXPORTER_OTLP_ENDPOINT is configured.
+    """
+    provider = TracerProvider(
+        resource=Resource.create({SERVICE_NAME: settings.OTEL_SERVICE_NAME}))
+    if settings.OTEL_EXPORTER_OTLP_ENDPOINT:
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(
+            endpoint=f"{settings.OTEL_EXPORTER_OTLP_ENDPOINT}/v1/traces")))
+    trace.set_tracer_provider(provider)
+
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="health,metrics")
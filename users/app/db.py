@@ -3,6 +3,7 @@ from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy import text
 import datetime
+import uuid
 from collections.abc import AsyncGenerator
 
 from fastapi import Depends
@@ -32,6 +33,13 @@ class User(SQLAlchemyBaseUserTableUUID, Base):
     )
 
 
+class DeletedUser(Base):
+    """IDs of deleted users, so the guest token of a deleted guest cannot store it again"""
+    __tablename__ = "deleted_user"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+
+
 engine = create_async_engine(str(settings.DATABASE_URI), pool_pre_ping=True)
 session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
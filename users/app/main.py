@@ -4,6 +4,8 @@ from fastapi.responses import RedirectResponse
 from app.oauth_route import get_oauth_router
 from app.db import User
 from app.core.config import settings
+from app.core.metrics import PrometheusMiddleware, metrics_response
+from app.core.tracing import setup_tracing
 from app.schemas import UserRead, UserUpdate
 from app.users import (
     auth_backend,
@@ -20,6 +22,7 @@ app = FastAPI(
     title=settings.PROJECT_NAME,
     root_path="/users-service"
 )
+setup_tracing(app)
 
 app.include_router(
     fastapi_users.get_users_router(UserRead, UserUpdate),
@@ -61,6 +64,11 @@ async def logout():
 async def health_check():
     return {"status": "ok"}
 
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
 allowed_origins = [
     settings.CORS_URL,
 ]
@@ -73,5 +81,7 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+app.add_middleware(PrometheusMiddleware)
+
 for exc, handler in all_exception_handlers.items():
     app.add_exception_handler(exc, handler)
\ No newline at end of file
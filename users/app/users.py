@@ -1,22 +1,36 @@
+import secrets
 import uuid
 from typing import Optional
 
+import jwt
 from fastapi import Depends, Request
-from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin, models
+from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin, exceptions, models
 from fastapi_users.authentication import (
     AuthenticationBackend,
     CookieTransport,
     JWTStrategy,
 )
 from fastapi_users.db import SQLAlchemyUserDatabase
+from fastapi_users.jwt import decode_jwt, generate_jwt
+from fastapi_users.password import PasswordHelper
 from httpx_oauth.clients.github import GitHubOAuth2
+from sqlalchemy.dialects.postgresql import insert
 
-from app.db import get_user_db, User
+from app.db import get_user_db, DeletedUser, User
 from app.core.config import settings
 from app.core.logger import get_logger
+from app.core.metrics import GUESTS
 
 logger = get_logger(__name__)
 
+# Guests have no password, nobody knows the one behind this hash, so logging in as a guest fails.
+# Hashed once per process instead of once per guest.
+GUEST_PASSWORD_HASH = PasswordHelper().hash(secrets.token_urlsafe())
+
+
+def guest_email(user_id: uuid.UUID) -> str:
+    return f"{user_id}@guest.{user_id}.com"
+
 
 github_oauth_client = GitHubOAuth2(
     settings.GITHUB_OAUTH_CLIENT_ID,
@@ -82,6 +96,37 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
         logger.info(
             f"Verification requested for user {user.id}. Verification token: {token}")
 
+    async def on_before_delete(self, user: User, request: Optional[Request] = None):
+        # Committed together with the deletion of the user
+        self.user_db.session.add(DeletedUser(id=user.id))
+
+    async def persist_guest(self, user_id: uuid.UUID) -> User | None:
+        """
+        Store a guest the first time its token is used, see GuestJWTStrategy.
+
+        Returns None for deleted guests, their tokens stay invalid.
+        """
+        session = self.user_db.session
+        if await session.get(DeletedUser, user_id) is not None:
+            return None
+        result = await session.execute(
+            insert(User)
+            .values(
+                id=user_id,
+                email=guest_email(user_id),
+                hashed_password=GUEST_PASSWORD_HASH,
+                is_active=True,
+                is_superuser=False,
+                is_verified=True,
+            )
+            # Concurrent first requests of the same guest
+            .on_conflict_do_nothing(index_elements=[User.id])
+        )
+        await session.commit()
+        if result.rowcount:
+            GUESTS.labels(event="persisted").inc()
+        return await self.get(user_id)
+
 
 async def get_user_manager(user_db: SQLAlchemyUserDatabase = Depends(get_user_db)):
     yield UserManager(user_db)
@@ -91,9 +136,38 @@ cookie_transport = CookieTransport(
     cookie_name="tictactoe", cookie_max_age=604800, cookie_secure=False, cookie_domain=settings.COOKIE_DOMAIN)  # 1 week
 
 
-def get_jwt_strategy() -> JWTStrategy[models.UP, models.ID]:
+class GuestJWTStrategy(JWTStrategy[models.UP, models.ID]):
+    """
+    JWTs that may belong to guests who are not stored yet.
+
+    A guest gets a token marked as guest without touching the database, see
+    /auth/create-guest. When the token is first used and its user does not
+    exist, the guest is stored, with a single insert and without a password hash.
+    Guests that were deleted are not stored again.
+    """
+
+    async def write_guest_token(self, user_id: uuid.UUID) -> str:
+        data = {"sub": str(user_id), "aud": self.token_audience, "guest": True}
+        return generate_jwt(data, self.encode_key, self.lifetime_seconds, algorithm=self.algorithm)
+
+    async def read_token(self, token: str | None, user_manager: UserManager) -> User | None:
+        user = await super().read_token(token, user_manager)
+        if user is not None or token is None:
+            return user
+
+        try:
+            data = decode_jwt(token, self.decode_key, self.token_audience, algorithms=[self.algorithm])
+            if not data.get("guest"):
+                return None
+            user_id = user_manager.parse_id(data.get("sub"))
+        except (jwt.PyJWTError, exceptions.InvalidID):
+            return None
+        return await user_manager.persist_guest(user_id)
+
+
+def get_jwt_strategy() -> GuestJWTStrategy[models.UP, models.ID]:
     # 1 week
-    return JWTStrategy(secret=settings.SECRET, lifetime_seconds=604800)
+    return GuestJWTStrategy(secret=settings.SECRET, lifetime_seconds=604800)
 
 
 auth_backend = AuthenticationBackend(